@@ -1,26 +1,162 @@
 import csv
 import json
 import string
-from typing import Optional, List, Union
+from typing import Optional, List, Union, Iterator, Iterable
+
+from compression import open_file
+from fast_csv import read_csv_dicts, read_csv_tuples, read_csv_columns
+
+
+# Files ending with .gz, .bz2 or .xz are (de)compressed transparently (see `compression`).
 
 
 def read_json(fp: str) -> Union[list, dict]:
-    with open(fp, "r", encoding="utf-8") as f:
+    with open_file(fp, "r", encoding="utf-8") as f:
         j = json.load(f)
     return j
 
 
-def read_csv(fp: str) -> List[dict]:
-    with open(fp, "r", encoding="utf-8-sig") as f:
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+def iter_json(fp: str, chunk_size: int = JSON_CHUNK_SIZE) -> Iterator:
+    """Like `read_json` for a file holding a list, but yields the items one at a time instead of loading the whole file."""
+
+    decoder = json.JSONDecoder()
+    whitespace = " \t\r\n"
+
+    with open_file(fp, "r", encoding="utf-8") as f:
+        buffer = f.read(chunk_size).lstrip(whitespace)
+        if not buffer.startswith("["):
+            raise ValueError(f"{fp} does not hold a JSON list.")
+        pos = 1
+        eof = False
+        expect_comma = False
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in whitespace:
+                pos += 1
+            if pos == len(buffer):
+                if eof:
+                    raise ValueError(f"{fp} ends in the middle of the list.")
+                chunk = f.read(chunk_size)
+                buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+                continue
+
+            if buffer[pos] == "]":
+                return
+            if expect_comma:
+                if buffer[pos] != ",":
+                    raise ValueError(f"Expected ',' or ']' in {fp}, got {buffer[pos]!r}.")
+                pos += 1
+                expect_comma = False
+                continue
+
+            # Read on until the item is complete. A number may be cut by the end of the buffer, e.g., "2" of "2.5".
+            read_size = chunk_size
+            while True:
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                    if eof or (
+                        end < len(buffer)
+                        and (isinstance(item, bool) or not isinstance(item, (int, float)) or buffer[end] in f"{whitespace},]")
+                    ):
+                        break
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                chunk = f.read(read_size)
+                buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+                read_size *= 2
+
+            yield item
+            pos = end
+            expect_comma = True
+
+
+def save_json(d: Union[list, dict], fp: str):
+    with open_file(fp, "w", encoding="utf-8") as f:
+        json.dump(
+            obj=d,
+            fp=f,
+            ensure_ascii=False,
+            indent=2,
+        )
+
+
+CSV_BACKEND_CSV = "csv"
+CSV_BACKEND_MMAP = "mmap"  # See `fast_csv`.
+CSV_BACKENDS = (CSV_BACKEND_CSV, CSV_BACKEND_MMAP)
+
+
+def read_csv(fp: str, backend: str = CSV_BACKEND_CSV) -> List[dict]:
+    """Read a CSV as a list of dicts.
+
+    :param fp: E.g., "russian_word_analyses/resources/words.csv"
+    :param backend: "csv" (csv.DictReader) or "mmap" (the faster `fast_csv`, same results).
+    """
+
+    if backend == CSV_BACKEND_MMAP:
+        return read_csv_dicts(fp)
+    if backend != CSV_BACKEND_CSV:
+        raise ValueError(f"Unknown CSV backend {backend!r}. Expected one of {CSV_BACKENDS}.")
+
+    with open_file(fp, "r", encoding="utf-8-sig") as f:
         csv_reader = csv.DictReader(f)
         return list(csv_reader)
+
+
+def iter_csv(fp: str) -> Iterator[dict]:
+    """Like `read_csv`, but yields the rows one at a time instead of loading the whole file."""
+
+    with open_file(fp, "r", encoding="utf-8-sig") as f:
+        yield from csv.DictReader(f)
     
 
-def write_csv(fp: str, l: List[dict]):
-    with open(fp, "w", encoding="utf-8") as f:
-        csv_writer = csv.DictWriter(f, fieldnames=list(l[0].keys()))
+def write_csv(fp: str, l: Iterable[dict]):
+    """Write rows to a CSV. The header is taken from the first row.
+
+    :param l: A list, or any iterable (e.g., a generator), which is written as it is consumed.
+        Without rows, there is no header either, so the file is left empty.
+    """
+
+    rows = iter(l)
+    first_row = next(rows, None)
+
+    with open_file(fp, "w", encoding="utf-8") as f:
+        if first_row is None:
+            return
+        csv_writer = csv.DictWriter(f, fieldnames=list(first_row.keys()))
         csv_writer.writeheader()
-        csv_writer.writerows(l)
+        csv_writer.writerow(first_row)
+        csv_writer.writerows(rows)
+
+
+def write_xlsx(fp: str, l: Iterable[dict], **kwargs) -> int:
+    """Write rows to an XLSX with a frozen header and the tagged cells highlighted (see `xlsx_writer`).
+
+    :param l: A list, or any iterable (e.g., a generator), which is streamed into the sheet.
+    :return: The number of rows written.
+    """
+
+    # Imported on first use, as zipfile slows down importing IO.
+    from xlsx_writer import write_xlsx as _write_xlsx
+
+    return _write_xlsx(fp=fp, l=l, **kwargs)
+
+
+TOKEN_CHRS_TO_STRIP = (
+    " "
+    + string.punctuation
+    + string.digits
+    + string.ascii_letters
+    + "«»–—ー"
+)
+
+
+def normalize_token(token: str) -> str:
+    """E.g., "«Привет," -> "привет"."""
+    return token.lower().strip(TOKEN_CHRS_TO_STRIP)
 
 
 def read_tokens(
@@ -53,15 +189,8 @@ def read_tokens(
             for para in d["paras"]:
                 tokens.extend(para["text"].strip().split())
 
-    chrs_to_strip = (
-        " "
-        + string.punctuation
-        + string.digits
-        + string.ascii_letters
-        + "«»–—ー"
-    )
     tokens = list(sorted(set(map(
-        lambda token: token.lower().strip(chrs_to_strip),
+        normalize_token,
         tokens
     ))))
 
@@ -0,0 +1,226 @@
+import heapq
+import json
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+TAGS_SUFFIX = "_tags"
+
+# Tag bits (see `utils.get_bits_str_and_tags`).
+BIT_NAMES = {
+    "i": "irregular",
+    "I": "Irregular",  # Not counting -а/-у in gen_sg and -у' in prep_sg of nouns.
+    "a": "accent_change",
+    "m": "multiple_variants",
+}
+
+DEFAULT_TOP_K = 20
+DEFAULT_MIN_SUPPORT = 5  # Smaller classes are not ranked, as their rates are too noisy.
+
+
+def parse_bits(tags: str) -> str:
+    """E.g., "#i_a_, irreg_decl:0, accent_chg:0" -> "i_a_", "" -> ""."""
+
+    if not tags.startswith("#"):
+        return ""
+    return tags[1:].split(",", 1)[0]
+
+
+def get_rate(n: int, total: int) -> Optional[float]:
+    if total == 0:
+        return None
+    return round(n / total, 4)
+
+
+class AnalysisStats:
+    """Aggregate the rows of an analysis as they are made, to see how well the rules cover the data.
+
+    Each row is counted once, when it is emitted (e.g., after `make_row`), so the statistics need
+    no second pass over the output and take memory proportional to the number of classes, not of
+    rows. E.g.,
+
+        stats = AnalysisStats(name="nouns", groups=[("gender",), ("last_letter",), ("gender", "last_letter")])
+        for d in noun_analyses.values():
+            row = make_row(d)
+            stats.update(row)
+        stats.print_summary()
+
+    Counted are:
+
+        1. per cell (e.g., gen_pl), the forms with each tag bit (see `BIT_NAMES`);
+        2. per class (e.g., gender=f, or gender/last_letter=f/ь), the rows and cells with each tag bit;
+        3. the `top_k` lemmas with the most irregular cells, in a bounded heap.
+
+    The `top_k` classes with the highest irregular rates are ranked in the summary.
+    """
+
+    def __init__(self, name: str, groups: Sequence[Tuple[str, ...]] = (), top_k: int = DEFAULT_TOP_K, min_support: int = DEFAULT_MIN_SUPPORT, key_column: str = "accented_form"):
+        """
+        :param groups: Columns of the rows to define classes by, alone or combined.
+        :param key_column: The column identifying a lemma in the top lemmas.
+        """
+
+        self.name = name
+        self.groups = [tuple(group) for group in groups]
+        self.top_k = top_k
+        self.min_support = min_support
+        self.key_column = key_column
+
+        self.n_rows = 0
+        self.cells = None  # Taken from the `*_tags` columns of the first row.
+        self.cell_counts = {}  # {cell: Counter({"n":, "irregular":, ...})}
+        self.class_counts = {}  # {group: {value: Counter({"n_rows":, "rows_irregular":, "cells_irregular":, ...})}}
+        self.top_lemmas = []  # A min-heap of (n_irregular_cells, n_accent_change_cells, index, key).
+
+    def update(self, row: dict):
+
+        if self.cells is None:
+            self.cells = [
+                column[:-len(TAGS_SUFFIX)]
+                for column in row
+                if column.endswith(TAGS_SUFFIX)
+            ]
+            self.cell_counts = {cell: Counter() for cell in self.cells}
+
+        self.n_rows += 1
+
+        # Cells.
+        row_counts = Counter()
+        for cell in self.cells:
+            if not row.get(cell):
+                continue
+
+            cell_counts = self.cell_counts[cell]
+            cell_counts["n"] += 1
+            row_counts["n"] += 1
+            for bit in parse_bits(row.get(f"{cell}{TAGS_SUFFIX}", "")):
+                bit_name = BIT_NAMES.get(bit)
+                if bit_name is not None:
+                    cell_counts[bit_name] += 1
+                    row_counts[bit_name] += 1
+
+        # Classes.
+        for group in self.groups:
+            value = "/".join(str(row.get(column, "")) for column in group)
+            class_counts = self.class_counts.setdefault(group, {}).setdefault(value, Counter())
+            class_counts["n_rows"] += 1
+            class_counts["n_cells"] += row_counts["n"]
+            for bit_name in BIT_NAMES.values():
+                if row_counts[bit_name] > 0:
+                    class_counts[f"rows_{bit_name}"] += 1
+                    class_counts[f"cells_{bit_name}"] += row_counts[bit_name]
+
+        # Top lemmas.
+        if row_counts["irregular"] > 0:
+            item = (row_counts["irregular"], row_counts["accent_change"], -self.n_rows, row.get(self.key_column, ""))
+            if len(self.top_lemmas) < self.top_k:
+                heapq.heappush(self.top_lemmas, item)
+            elif item > self.top_lemmas[0]:
+                heapq.heapreplace(self.top_lemmas, item)
+
+    def get_cell_rates(self) -> Dict[str, dict]:
+        return {
+            cell: {
+                "n": counts["n"],
+                **{
+                    f"{bit_name}_rate": get_rate(counts[bit_name], counts["n"])
+                    for bit_name in BIT_NAMES.values()
+                },
+            }
+            for cell, counts in (self.cell_counts or {}).items()
+        }
+
+    def get_class_rates(self) -> Dict[str, Dict[str, dict]]:
+        """{group: {value: rates}}, e.g., {"gender": {"f": {"n_rows":, "rows_irregular_rate":, ...}}}."""
+
+        class_rates = {}
+        for group, values in self.class_counts.items():
+            class_rates["/".join(group)] = {
+                value: {
+                    "n_rows": counts["n_rows"],
+                    **{
+                        f"rows_{bit_name}_rate": get_rate(counts[f"rows_{bit_name}"], counts["n_rows"])
+                        for bit_name in BIT_NAMES.values()
+                    },
+                    **{
+                        f"cells_{bit_name}_rate": get_rate(counts[f"cells_{bit_name}"], counts["n_cells"])
+                        for bit_name in BIT_NAMES.values()
+                    },
+                }
+                for value, counts in sorted(values.items())
+            }
+        return class_rates
+
+    def get_top_classes(self, bit_name: str = "irregular") -> List[dict]:
+        """The `top_k` classes of at least `min_support` rows with the highest rates of rows with the bit."""
+
+        candidates = (
+            (counts[f"rows_{bit_name}"] / counts["n_rows"], counts["n_rows"], "/".join(group), value)
+            for group, values in self.class_counts.items()
+            for value, counts in values.items()
+            if counts["n_rows"] >= self.min_support
+        )
+        return [
+            {
+                "group": group,
+                "value": value,
+                "n_rows": n_rows,
+                f"rows_{bit_name}_rate": round(rate, 4),
+            }
+            for rate, n_rows, group, value in heapq.nlargest(self.top_k, candidates)
+        ]
+
+    def get_top_lemmas(self) -> List[dict]:
+        return [
+            {
+                self.key_column: key,
+                "cells_irregular": n_irregular,
+                "cells_accent_change": n_accent_change,
+            }
+            for n_irregular, n_accent_change, _, key in sorted(self.top_lemmas, reverse=True)
+        ]
+
+    def summary(self) -> dict:
+        return {
+            "analyzer": self.name,
+            "n_rows": self.n_rows,
+            "cells": self.get_cell_rates(),
+            "classes": self.get_class_rates(),
+            "top_irregular_classes": self.get_top_classes("irregular"),
+            "top_accent_change_classes": self.get_top_classes("accent_change"),
+            "top_irregular_lemmas": self.get_top_lemmas(),
+        }
+
+    def save(self, fp: str):
+        with open(fp, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+    def print_summary(self, top_k: int = 10):
+        if self.n_rows == 0:
+            return
+
+        print(f"Statistics of {self.name} ({self.n_rows:,} rows):")
+        print(f"    {'cell':<20} {'n':>8} {'irregular':>10} {'accent_chg':>10} {'multi_vars':>10}")
+        for cell, rates in self.get_cell_rates().items():
+            print(
+                f"    {cell:<20} {rates['n']:>8,} "
+                + " ".join(
+                    f"{'-' if rates[name] is None else format(rates[name], '.1%'):>10}"
+                    for name in ("irregular_rate", "accent_change_rate", "multiple_variants_rate")
+                )
+            )
+
+        print(f"    Most irregular classes (>= {self.min_support} rows):")
+        for top_class in self.get_top_classes("irregular")[:top_k]:
+            print(
+                f"        {top_class['group'] + '=' + top_class['value']:<30} "
+                f"{top_class['n_rows']:>8,} {top_class['rows_irregular_rate']:>10.1%}"
+            )
+
+
+def add_stats_arguments(parser):
+    parser.add_argument(
+        "--stats",
+        default=None,
+        help="Write the statistics aggregated over the rows (rates by cell and class) as JSON to this path.",
+    )
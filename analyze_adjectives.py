@@ -1,21 +1,36 @@
-from typing import List
-
-from tqdm import tqdm
+import argparse
+import os
+from typing import List, Optional
 
 from IO import (
     read_tokens, 
     read_csv, 
     write_csv
 )
-from russian_gender import RussianGender
+from analysis_stats import AnalysisStats, add_stats_arguments
+from diagnostics import Diagnostics, get_diagnostics, add_diagnostics_arguments
+from lemma_cache import LemmaCache, add_cache_arguments
+from metrics import count_rows
+from profiling import StageProfiler, add_profile_arguments
+from progress import tqdm
+from fixes import apply_fix_overlay, ADJECTIVE_FIXES_KEY
+from external_sort import external_sort
+from out_of_core import (
+    CsvStream,
+    iter_lemma_records,
+    iter_batches,
+    concat_tables,
+    split_memory_limit,
+    add_out_of_core_arguments,
+    DEFAULT_MEMORY_LIMIT_MB,
+    DEFAULT_BATCH_SIZE,
+)
 from adjective_analyses.russian_adjective import (
     RussianAdjective, 
     RussianAdjectiveDeclensionType, 
     RUSSIAN_ADJECTIVE_DECLENSION_TYPES
 )
 from utils import (
-    get_accent_pos,
-    insert_accent_mark,
     remove_accent_mark, 
     supplement_accent_mark, 
     eval_boolean, 
@@ -31,6 +46,24 @@ from utils import (
 )
 
 
+# Classes of the rows to aggregate statistics by (see `analysis_stats`).
+STATS_GROUPS = [
+    ("suffix",),
+    ("is_incomparable",),
+]
+
+# The modules making the rows, whose source is part of the fingerprints of the cached rows (see `lemma_cache`).
+CACHE_CODE_MODULES = [
+    "analyze_adjectives",
+    "adjective_analyses.russian_adjective",
+    "russian_word",
+    "russian_case",
+    "russian_gender",
+    "russian_number",
+    "utils",
+]
+
+
 def get_nom_m_ids(tokens, words, words_forms):
     
     token_set = set(tokens)
@@ -60,12 +93,12 @@ def get_nom_m_ids(tokens, words, words_forms):
     return nom_m_ids
 
 
-def get_adjective_analyses(nom_m_ids, adjectives, words, words_forms, translations):
+def get_adjective_analyses(nom_m_ids, adjectives, words, words_forms, translations, verbose=True):
 
     adjective_analyses = {}
 
     # Get bare, accented and usage from `words`.
-    for row in tqdm(words):
+    for row in tqdm(words, disable=not verbose):
         if not row["id"] in nom_m_ids:
             continue
 
@@ -78,7 +111,7 @@ def get_adjective_analyses(nom_m_ids, adjectives, words, words_forms, translatio
         }
 
     # Get meta from `adjectives`.
-    for row in tqdm(adjectives):
+    for row in tqdm(adjectives, disable=not verbose):
         if row["word_id"] not in nom_m_ids:
             continue
 
@@ -88,7 +121,7 @@ def get_adjective_analyses(nom_m_ids, adjectives, words, words_forms, translatio
             adjective_analyses[row["word_id"]]["meta"][k] = v
 
     # Get translations from `translations`.
-    for row in tqdm(translations):
+    for row in tqdm(translations, disable=not verbose):
         if not row["word_id"] in nom_m_ids:
             continue
         if not row["lang"] == "en":
@@ -100,7 +133,7 @@ def get_adjective_analyses(nom_m_ids, adjectives, words, words_forms, translatio
         ).append(row["tl"].strip())
 
     # Get ground-truth declensions from `words_forms`.
-    for row in tqdm(words_forms):
+    for row in tqdm(words_forms, disable=not verbose):
         if row["word_id"] not in nom_m_ids:
             continue
 
@@ -127,176 +160,34 @@ def get_adjective_analyses(nom_m_ids, adjectives, words, words_forms, translatio
             "accented": supplement_accent_mark(row["form"]),
         })
 
-    print(f"#m_nom_sg_info: {len(adjective_analyses)}")
+    if verbose:
+        print(f"#m_nom_sg_info: {len(adjective_analyses)}")
 
     return adjective_analyses
 
 
-def fix_adjective_analyses(adjective_analyses):
+def fix_adjective_analyses(adjective_analyses, fp_fixes=None, diagnostics=None):
 
-    delimiter_mapping = {
-        "точный": "//", 
-        "далёкий": "//", 
-        "глупый": "//",
-        "новый": " / "
-    }
+    # Lemma-specific fixes are declared in `files/lemma_fixes.json`.
+    adjective_analyses = apply_fix_overlay(
+        analyses=adjective_analyses,
+        section=ADJECTIVE_FIXES_KEY,
+        decl_types=RUSSIAN_ADJECTIVE_DECLENSION_TYPES,
+        fp_fixes=fp_fixes,
+        diagnostics=diagnostics,
+    )
 
     adjectives_to_remove = []
-    for nom_m_id, d in adjective_analyses.items():
-
-        if d["bare"] == "рабочий":
-            d["ground_truth_decls"]["nom_n"][0] = {
-                "position": "1",
-                "bare": "рабочее",
-                "accented": "рабо'чее",
-            }
-            d["ground_truth_decls"]["acc_n"] = d["ground_truth_decls"]["nom_n"]
-
-        if d["bare"] == "спокойный":
-            d["ground_truth_decls"]["prep_f"] = [{
-                "position": "1",
-                "bare": "спокойной",
-                "accented": "споко'йной",
-            }] 
-
-        if d["bare"] == "серьёзный":
-            d["ground_truth_decls"]["comparative"] = [
-                {
-                    "position": "1",
-                    "bare": "серьёзнее",
-                    "accented": "серьё'знее",
-                },
-                {
-                    "position": "2",
-                    "bare": "серьёзней",
-                    "accented": "серьё'зней",
-                }
-            ]
-
-        if d["bare"] == "функциональный":
-            d["ground_truth_decls"]["prep_m"][0] = {
-                "position": "1",
-                "bare": "функциональном",
-                "accented": "функциона'льном",
-            }
-            d["ground_truth_decls"]["prep_f"][0] = {
-                "position": "1",
-                "bare": "функциональной",
-                "accented": "функциона'льной",
-            }
-            d["ground_truth_decls"]["prep_n"] = d["ground_truth_decls"]["prep_m"]
-
-        if d["bare"] in ["готовимый", "танцуемый"]:
-            accent_pos = get_accent_pos(d["accented"])
-            for decl_type in RUSSIAN_ADJECTIVE_DECLENSION_TYPES:
-                if decl_type not in d["ground_truth_decls"]:
-                    continue
-                for decl_form in d["ground_truth_decls"][decl_type]:
-                    decl_form["accented"] = insert_accent_mark(
-                        word=remove_accent_mark(decl_form["accented"]),
-                        accent_pos=accent_pos,
-                    )
-
-        if d["bare"] == "украинский":
-            accent_pos = get_accent_pos(d["accented"])
-            for decl_type in RUSSIAN_ADJECTIVE_DECLENSION_TYPES:
-                if decl_type not in d["ground_truth_decls"]:
-                    continue
-                for decl_form in d["ground_truth_decls"][decl_type]:
-                    decl_form["accented"] = insert_accent_mark(
-                        word=remove_accent_mark(decl_form["accented"]),
-                        accent_pos=accent_pos,
-                    )
-            d["ground_truth_decls"]["inst_f"][1]["bare"] = "(украинскою)"
-            d["ground_truth_decls"]["inst_f"][1]["accented"] = "(украи'нскою)"
-
-        if d["bare"] == "арестованный":
-            for decl_form in d["ground_truth_decls"]["acc_m"]:
-                if decl_form["bare"] == "ного":
-                    decl_form["bare"] = "арестованного"
-                    decl_form["accented"] = "аресто'ванного"
-            for decl_form in d["ground_truth_decls"]["acc_pl"]:
-                if decl_form["bare"] == "ных":
-                    decl_form["bare"] = "арестованных"
-                    decl_form["accented"] = "аресто'ванных"
-            for decl_form in d["ground_truth_decls"]["inst_f"]:
-                if decl_form["bare"] == "ною":
-                    decl_form["bare"] = "арестованною"
-                    decl_form["accented"] = "аресто'ванною"
-
-        if d["bare"] in ["ясный", "точный"]:
-            for gender in [RussianGender.M, RussianGender.F, RussianGender.N]:
-                (
-                    d["ground_truth_decls"][f"inst_{gender}"], 
-                    d["ground_truth_decls"][f"prep_{gender}"]
-                ) = (
-                    d["ground_truth_decls"][f"prep_{gender}"], 
-                    d["ground_truth_decls"][f"inst_{gender}"]
-                )
-
-        if d["bare"] in delimiter_mapping:
-            short_pls = d["ground_truth_decls"]["short_pl"][0]["accented"].split(delimiter_mapping[d["bare"]])
-            d["ground_truth_decls"]["short_pl"] = []
-            for i, short_pl in enumerate(short_pls):
-                d["ground_truth_decls"]["short_pl"].append({
-                    "position": str(i+1),
-                    "bare": remove_accent_mark(short_pl),
-                    "accented": short_pl,
-                })
-        
-        if d["bare"] == "кислый":
-            for decl_form in d["ground_truth_decls"]["short_pl"]:
-                if decl_form["bare"] == "киcлы":
-                    decl_form["bare"] = "кислы"
-                    decl_form["accented"] = "кислы'"
-
-        if d["bare"] == "свободный":
-           d["ground_truth_decls"]["comparative"][0]["accented"] = "свобо'днее"
-
-        if d["bare"] == "нужный":
-           d["ground_truth_decls"]["comparative"][0]["accented"] = "нужне'е"
-
-        if d["bare"] == "грустный":
-           d["ground_truth_decls"]["comparative"][0]["accented"] = "грустне'е"
-
-        if d["bare"] == "кислый":
-           d["ground_truth_decls"]["comparative"][0]["accented"] = "кисле'е"
-
-        if d["bare"] == "чистый":
-           d["ground_truth_decls"]["comparative"][0]["accented"] = "чисте'йший"
-
-        if d["bare"] == "точный":
-           d["ground_truth_decls"]["comparative"][1]["accented"] = "точне'й"
-
-        if d["bare"] == "некоторый":
-            d["ground_truth_decls"]["prep_n"][0]["accented"] = "не'котором"
-
-        if d["bare"] in [
-            "играемый",
-            "изучаемый",
-            "написанный",
-            "переводимый",
-            "полученный",
-            "проводимый",
-            "сформированный",
-            "говоримый",
-            "знаемый",
-        ]:
-            for gender_or_pl in ["m", "f", "n", "pl"]:
-                d["ground_truth_decls"][f"short_{gender_or_pl}"][0]["accented"] = insert_accent_mark(
-                    d["ground_truth_decls"][f"short_{gender_or_pl}"][0]["accented"],
-                    get_accent_pos(d["accented"]),
-                )
-        
-        # if (
-        #     "translations" not in d["meta"]
-        #     or (
-        #         "translations" in d["meta"]
-        #         and len(d["meta"]["translations"]) == 0
-        #     )
-        # ):
-        #     adjectives_to_remove.append(nom_m_id)
-        #     print(f"Removing {d['bare']}/{d['accented']} ({nom_m_id}) as it has not translations.")
+    # for nom_m_id, d in adjective_analyses.items():
+    #     if (
+    #         "translations" not in d["meta"]
+    #         or (
+    #             "translations" in d["meta"]
+    #             and len(d["meta"]["translations"]) == 0
+    #         )
+    #     ):
+    #         adjectives_to_remove.append(nom_m_id)
+    #         print(f"Removing {d['bare']}/{d['accented']} ({nom_m_id}) as it has not translations.")
 
     for nom_m_id in adjectives_to_remove:
         del adjective_analyses[nom_m_id]
@@ -314,7 +205,9 @@ def apply_declensions(russian_adjective):
     return decls
 
 
-def make_row(d):
+def make_row(d, diagnostics=None):
+
+    diagnostics = get_diagnostics(diagnostics)
     
     row = dict(
         bare_form=d["bare"],
@@ -363,14 +256,18 @@ def make_row(d):
         if (
             decl_type in ["acc_m", "acc_pl", "inst_f"]
         ):
-            print("Fixing two endings in acc_{sg|pl}, inst_f:", d["accented"], rule_based_decl_form)
-
             rule_based_decl_forms = rule_based_decl_form.split("/")
             for i, ground_truth_decl_form in enumerate(ground_truth_decl_forms):
                 if (
                     ground_truth_decl_form in rule_based_decl_forms
                     and i in irregular_declension_indices
                 ):
+                    diagnostics.report(
+                        "fix_two_endings",
+                        f"Fixing two endings in acc_{{sg|pl}}, inst_f: {d['accented']} {rule_based_decl_form}",
+                        bare=d["bare"],
+                        decl_type=decl_type,
+                    )
                     irregular_declension_indices.remove(i)
 
         # Fix по/ей in comparative.
@@ -392,7 +289,11 @@ def make_row(d):
                     or ground_truth_decl_form_ == "по" + rule_based_decl_form_
                     or ground_truth_decl_form_ == "по" + rule_based_decl_form_[:-2] + "ей"
                 ):
-                    print("Fixing по/ей in comparative:", d["accented"], ground_truth_decl_form)
+                    diagnostics.report(
+                        "fix_comparative_po_ej",
+                        f"Fixing по/ей in comparative: {d['accented']} {ground_truth_decl_form}",
+                        bare=d["bare"],
+                    )
                     if i in irregular_declension_indices:
                         irregular_declension_indices.remove(i)
                     if i in accent_change_indices:
@@ -443,7 +344,7 @@ def make_row(d):
     return row
 
 
-def main(tokens: List[str], adjectives: List[dict], words: List[dict], words_forms: List[dict], translations: List[dict], fp_analyses: str):
+def main(tokens: List[str], adjectives: List[dict], words: List[dict], words_forms: List[dict], translations: List[dict], fp_analyses: str, profiler: Optional[StageProfiler] = None, diagnostics: Optional[Diagnostics] = None, stats: Optional[AnalysisStats] = None, cache: Optional[LemmaCache] = None):
     """Analyze adjectives.
 
     Output file format:
@@ -473,74 +374,261 @@ def main(tokens: List[str], adjectives: List[dict], words: List[dict], words_for
                 compare the declensions with the ground truth. Mark all inconsistent declensions with
                 decl_tags.
 
+    Each step is timed by `profiler` (see `profiling.StageProfiler`).
+    Per-lemma messages are collected by `diagnostics` (see `diagnostics.Diagnostics`).
+    Rates of the tags by cell and class are aggregated by `stats` as the rows are made (see `analysis_stats.AnalysisStats`).
+    If `cache` is given, the rows of the lemmas unchanged since they were cached are reused (see `lemma_cache.LemmaCache`).
+
     """
 
-    nom_m_ids = get_nom_m_ids(
-        tokens=tokens,
-        words=words,
-        words_forms=words_forms,
-    )
+    if profiler is None:
+        profiler = StageProfiler(name="adjectives")
+    if diagnostics is None:
+        diagnostics = Diagnostics(name="adjectives")
+    if stats is None:
+        stats = AnalysisStats(name="adjectives", groups=STATS_GROUPS)
+
+    with profiler.stage("select_lemmas", rows_in=len(words) + len(words_forms)) as stage:
+        nom_m_ids = get_nom_m_ids(
+            tokens=tokens,
+            words=words,
+            words_forms=words_forms,
+        )
+        stage["rows_out"] = len(nom_m_ids)
+
+    with profiler.stage(
+        "assemble_analyses",
+        rows_in=len(words) + len(adjectives) + len(words_forms) + len(translations)
+    ) as stage:
+        adjective_analyses = get_adjective_analyses(
+            nom_m_ids=nom_m_ids,
+            words=words,
+            adjectives=adjectives,
+            words_forms=words_forms,
+            translations=translations,
+        )
+        stage["rows_out"] = len(adjective_analyses)
 
-    adjective_analyses = get_adjective_analyses(
-        nom_m_ids=nom_m_ids,
-        words=words,
-        adjectives=adjectives,
-        words_forms=words_forms,
-        translations=translations,
-    )
-    adjective_analyses = fix_adjective_analyses(
-        adjective_analyses
-    )
+    with profiler.stage("fix_analyses", rows_in=len(adjective_analyses)) as stage:
+        adjective_analyses = fix_adjective_analyses(
+            adjective_analyses,
+            diagnostics=diagnostics,
+        )
+        stage["rows_out"] = len(adjective_analyses)
+
+    if cache is not None:
+        with profiler.stage("look_up_cache", rows_in=len(adjective_analyses)) as stage:
+            stage["rows_out"] = cache.look_up(adjective_analyses)
 
-    rows = []
-    for _, d in adjective_analyses.items():
+    with profiler.stage("apply_declensions", rows_in=len(adjective_analyses)) as stage:
+        for nom_m_id, d in count_rows(adjective_analyses.items()):
+            if cache is not None and cache.is_hit(nom_m_id):
+                continue
 
-        russian_adjective = RussianAdjective(
-            accented=d["accented"],
+            russian_adjective = RussianAdjective(
+                accented=d["accented"],
+            )
+            d["rule_based_decls"] = apply_declensions(russian_adjective)
+        stage["rows_out"] = len(adjective_analyses)
+
+    with profiler.stage("make_row", rows_in=len(adjective_analyses)) as stage:
+        rows = []
+        for nom_m_id, d in count_rows(adjective_analyses.items()):
+            if cache is not None:
+                row = cache.get_row(nom_m_id, d, make_row=make_row, diagnostics=diagnostics)
+            else:
+                row = make_row(d, diagnostics=diagnostics)
+            stats.update(row)
+            rows.append(row)
+
+            # from pprint import pprint
+            # pprint(d)
+            # input()
+        if cache is not None:
+            cache.commit()
+        stage["rows_out"] = len(rows)
+
+    with profiler.stage("write_csv", rows_in=len(rows)) as stage:
+        write_csv(
+            fp=fp_analyses,
+            l=list(sorted(
+                rows,
+                key=lambda r: r["bare_form"]
+            )),
         )
-        d["rule_based_decls"] = apply_declensions(russian_adjective)
+        stage["rows_out"] = len(rows)
 
-        row = make_row(d)
-        rows.append(row)
 
-        # from pprint import pprint
-        # pprint(d)
-        # input()
+def main_out_of_core(tokens: List[str], resources_dir: str, fp_analyses: str, memory_limit_mb: float = DEFAULT_MEMORY_LIMIT_MB, batch_size: int = DEFAULT_BATCH_SIZE, tmp_dir: Optional[str] = None, profiler: Optional[StageProfiler] = None, diagnostics: Optional[Diagnostics] = None, stats: Optional[AnalysisStats] = None, cache: Optional[LemmaCache] = None):
+    """Analyze adjectives like `main`, without loading the dumps into memory.
 
-    write_csv(
-        fp=fp_analyses,
-        l=list(sorted(
-            rows,
-            key=lambda r: r["bare_form"]
-        )),
-    )
+    See `analyze_nouns.main_out_of_core`.
+    """
+
+    if profiler is None:
+        profiler = StageProfiler(name="adjectives")
+    if diagnostics is None:
+        diagnostics = Diagnostics(name="adjectives")
+    if stats is None:
+        stats = AnalysisStats(name="adjectives", groups=STATS_GROUPS)
+
+    with profiler.stage("select_lemmas") as stage:
+        nom_m_ids = get_nom_m_ids(
+            tokens=tokens,
+            words=CsvStream(os.path.join(resources_dir, "words.csv")),
+            words_forms=CsvStream(os.path.join(resources_dir, "words_forms.csv")),
+        )
+        stage["rows_out"] = len(nom_m_ids)
+
+    records_memory_limit_mb, output_memory_limit_mb = split_memory_limit(memory_limit_mb)
+    n_rows = 0
+
+    def iter_rows():
+        nonlocal n_rows
+
+        records = iter_lemma_records(
+            resources_dir=resources_dir,
+            pos_name="adjectives",
+            word_ids=nom_m_ids,
+            memory_limit_mb=records_memory_limit_mb,
+            tmp_dir=tmp_dir,
+        )
+        for batch in iter_batches(records, batch_size=batch_size):
+            adjective_analyses = get_adjective_analyses(
+                nom_m_ids={record["word_id"] for record in batch},
+                adjectives=concat_tables(batch, "adjectives"),
+                words=concat_tables(batch, "words"),
+                words_forms=concat_tables(batch, "words_forms"),
+                translations=concat_tables(batch, "translations"),
+                verbose=False,
+            )
+            adjective_analyses = fix_adjective_analyses(
+                adjective_analyses,
+                diagnostics=diagnostics,
+            )
+            if cache is not None:
+                cache.look_up(adjective_analyses)
+
+            for nom_m_id, d in count_rows(adjective_analyses.items()):
+                if cache is None or not cache.is_hit(nom_m_id):
+                    russian_adjective = RussianAdjective(
+                        accented=d["accented"],
+                    )
+                    d["rule_based_decls"] = apply_declensions(russian_adjective)
+                n_rows += 1
+                if cache is not None:
+                    row = cache.get_row(nom_m_id, d, make_row=make_row, diagnostics=diagnostics)
+                else:
+                    row = make_row(d, diagnostics=diagnostics)
+                stats.update(row)
+                yield row
+            if cache is not None:
+                cache.commit()
+
+    with profiler.stage("analyze_lemmas", rows_in=len(nom_m_ids)) as stage:
+        write_csv(
+            fp=fp_analyses,
+            l=external_sort(
+                iter_rows(),
+                key=lambda r: r["bare_form"],
+                tmp_dir=tmp_dir,
+                max_bytes_in_memory=int(output_memory_limit_mb * 1024 * 1024),
+            ),
+        )
+        stage["rows_out"] = n_rows
 
 
 if __name__ == '__main__':
-    tokens = read_tokens(
-        fp_words="uploads/words.ru.json",
-        fp_articles="uploads/articles.ru.json",
-        duolingo_only_articles=True,
+    parser = argparse.ArgumentParser()
+    add_profile_arguments(parser)
+    add_diagnostics_arguments(parser)
+    add_stats_arguments(parser)
+    add_out_of_core_arguments(parser)
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+
+    profiler = StageProfiler(
+        name="adjectives",
+        cprofile_dir=args.cprofile_dir,
+        track_memory=args.track_memory,
     )
-    print(f"#tokens: {len(tokens):,}")
-
-    adjectives = read_csv(fp="russian_word_analyses/resources/adjectives.csv")
-    words = read_csv(fp="russian_word_analyses/resources/words.csv")  # Adjectives in `words` are infinitives.
-    words_forms = read_csv(fp="russian_word_analyses/resources/words_forms.csv")
-    translations = read_csv(fp="russian_word_analyses/resources/translations.csv")
-    print(
-        f"#adjectives: {len(adjectives):,}, "
-        f"#words: {len(words):,}, "
-        f"#words_forms: {len(words_forms):,}, "
-        f"#translations: {len(translations):,}"
+    diagnostics = Diagnostics(
+        name="adjectives",
+        echo=args.verbose,
     )
+    stats = AnalysisStats(
+        name="adjectives",
+        groups=STATS_GROUPS,
+    )
+    cache = None
+    if args.lemma_cache is not None:
+        cache = LemmaCache(
+            fp=args.lemma_cache,
+            analyzer="adjectives",
+            code_modules=CACHE_CODE_MODULES,
+        )
+
+    with profiler.stage("read_tokens") as stage:
+        tokens = read_tokens(
+            fp_words="uploads/words.ru.json",
+            fp_articles="uploads/articles.ru.json",
+            duolingo_only_articles=True,
+        )
+        stage["rows_out"] = len(tokens)
+    print(f"#tokens: {len(tokens):,}")
 
     fp_analyses = "russian_word_analyses/files/adjective_analyses.csv"
-    main(
-        tokens=tokens,
-        adjectives=adjectives,
-        words=words,
-        words_forms=words_forms,
-        translations=translations,
-        fp_analyses=fp_analyses,
-    )
+    if args.out_of_core:
+        main_out_of_core(
+            tokens=tokens,
+            resources_dir="russian_word_analyses/resources",
+            fp_analyses=fp_analyses,
+            memory_limit_mb=args.memory_limit_mb,
+            batch_size=args.batch_size,
+            profiler=profiler,
+            diagnostics=diagnostics,
+            stats=stats,
+            cache=cache,
+        )
+    else:
+        with profiler.stage("read_csv") as stage:
+            adjectives = read_csv(fp="russian_word_analyses/resources/adjectives.csv")
+            words = read_csv(fp="russian_word_analyses/resources/words.csv")  # Adjectives in `words` are infinitives.
+            words_forms = read_csv(fp="russian_word_analyses/resources/words_forms.csv")
+            translations = read_csv(fp="russian_word_analyses/resources/translations.csv")
+            stage["rows_out"] = len(adjectives) + len(words) + len(words_forms) + len(translations)
+        print(
+            f"#adjectives: {len(adjectives):,}, "
+            f"#words: {len(words):,}, "
+            f"#words_forms: {len(words_forms):,}, "
+            f"#translations: {len(translations):,}"
+        )
+
+        main(
+            tokens=tokens,
+            adjectives=adjectives,
+            words=words,
+            words_forms=words_forms,
+            translations=translations,
+            fp_analyses=fp_analyses,
+            profiler=profiler,
+            diagnostics=diagnostics,
+            stats=stats,
+            cache=cache,
+        )
+
+    if cache is not None:
+        cache.close()
+        print(f"Lemma cache: {cache.n_hits:,} hits, {cache.n_misses:,} misses")
+
+    stats.print_summary()
+    if args.stats is not None:
+        stats.save(fp=args.stats)
+
+    diagnostics.print_summary()
+    if args.diagnostics is not None:
+        diagnostics.save(fp=args.diagnostics)
+
+    profiler.print_report()
+    if args.profile is not None:
+        profiler.save(fp=args.profile)
@@ -1,12 +1,31 @@
-from typing import List
-
-from tqdm import tqdm
+import argparse
+import os
+from typing import List, Optional
 
 from IO import (
     read_tokens, 
     read_csv, 
     write_csv
 )
+from analysis_stats import AnalysisStats, add_stats_arguments
+from diagnostics import Diagnostics, get_diagnostics, add_diagnostics_arguments
+from lemma_cache import LemmaCache, add_cache_arguments
+from metrics import count_rows
+from profiling import StageProfiler, add_profile_arguments
+from progress import tqdm
+from fixes import apply_fix_overlay, NOUN_FIXES_KEY
+from external_sort import external_sort
+from partner_graph import PartnerGraph, build_partner_graph, ATTRIBUTE_COLUMNS
+from out_of_core import (
+    CsvStream,
+    iter_lemma_records,
+    iter_batches,
+    concat_tables,
+    split_memory_limit,
+    add_out_of_core_arguments,
+    DEFAULT_MEMORY_LIMIT_MB,
+    DEFAULT_BATCH_SIZE,
+)
 from russian_gender import RussianGender
 from noun_analyses.russian_noun import (
     RussianNoun, 
@@ -29,6 +48,26 @@ from utils import (
 )
 
 
+# Classes of the rows to aggregate statistics by (see `analysis_stats`).
+STATS_GROUPS = [
+    ("gender",),
+    ("last_letter",),
+    ("gender", "last_letter"),
+    ("is_animate",),
+]
+
+# The modules making the rows, whose source is part of the fingerprints of the cached rows (see `lemma_cache`).
+CACHE_CODE_MODULES = [
+    "analyze_nouns",
+    "noun_analyses.russian_noun",
+    "russian_word",
+    "russian_case",
+    "russian_gender",
+    "russian_number",
+    "utils",
+]
+
+
 def get_nom_sg_ids(tokens, words, words_forms):
     
     token_set = set(tokens)
@@ -56,12 +95,12 @@ def get_nom_sg_ids(tokens, words, words_forms):
     return nom_sg_ids
 
 
-def get_noun_analyses(nom_sg_ids, nouns, words, words_forms, translations):
+def get_noun_analyses(nom_sg_ids, nouns, words, words_forms, translations, verbose=True):
 
     noun_analyses = {}
 
     # Get bare, accented and usage from `words`.
-    for row in tqdm(words):
+    for row in tqdm(words, disable=not verbose):
         if not row["id"] in nom_sg_ids:
             continue
 
@@ -74,7 +113,7 @@ def get_noun_analyses(nom_sg_ids, nouns, words, words_forms, translations):
         }
 
     # Get meta from `nouns`.
-    for row in tqdm(nouns):
+    for row in tqdm(nouns, disable=not verbose):
         if row["word_id"] not in nom_sg_ids:
             continue
 
@@ -84,7 +123,7 @@ def get_noun_analyses(nom_sg_ids, nouns, words, words_forms, translations):
             noun_analyses[row["word_id"]]["meta"][k] = v
 
     # Get translations from `translations`.
-    for row in tqdm(translations):
+    for row in tqdm(translations, disable=not verbose):
         if not row["word_id"] in nom_sg_ids:
             continue
         if not row["lang"] == "en":
@@ -96,7 +135,7 @@ def get_noun_analyses(nom_sg_ids, nouns, words, words_forms, translations):
         ).append(row["tl"].strip())
 
     # Get ground-truth declensions from `words_forms`.
-    for row in tqdm(words_forms):
+    for row in tqdm(words_forms, disable=not verbose):
         if row["word_id"] not in nom_sg_ids:
             continue
 
@@ -115,49 +154,27 @@ def get_noun_analyses(nom_sg_ids, nouns, words, words_forms, translations):
             "accented": supplement_accent_mark(row["form"]),
         })
 
-    print(f"#nom_sg_info: {len(noun_analyses):,}")
+    if verbose:
+        print(f"#nom_sg_info: {len(noun_analyses):,}")
 
     return noun_analyses
 
 
-def fix_noun_analyses(noun_analyses):
+def fix_noun_analyses(noun_analyses, fp_fixes=None, diagnostics=None):
 
-    nouns_to_remove = []
-    for nom_sg_id, d in noun_analyses.items():
+    diagnostics = get_diagnostics(diagnostics)
 
-        if d["bare"] == "менеджер":
-            d["meta"]["animate"] = "1"
-
-        if d["bare"] == "использование":
-            d["ground_truth_decls"]["inst_sg"][0]["accented"] = "испо'льзованием"
-        if d["bare"] == "жизнь":
-            d["ground_truth_decls"]["prep_sg"][0]["accented"] = "жи'зни"
-        if d["bare"] == "голубь":
-            d["ground_truth_decls"]["nom_sg"][0]["accented"] = "го'лубь"
-        if d["bare"] == "фотоаппарат":
-            d["ground_truth_decls"]["inst_sg"][0]["accented"] = "фотоаппара'том"
-        if d["bare"] == "логин":
-            d["accented"] = "логи'н"
-        if d["bare"] == "стих" and d["accented"] == "стих'":
-            d["accented"] = "сти'х"
-
-        if d["bare"] in ["министр", "президент"]:
-            d["ground_truth_decls"]["acc_sg"] = d["ground_truth_decls"]["gen_sg"]
-            d["ground_truth_decls"]["acc_pl"] = d["ground_truth_decls"]["gen_pl"]
-
-        if d["bare"] == "флéшка":
-            d["bare"] = "флешка"
-            d["accented"] = "фле'шка"
-            for decl_type in RUSSIAN_NOUN_DECLENSION_TYPES:
-                d["ground_truth_decls"][decl_type][0]["accented"] = d["ground_truth_decls"][decl_type][0]["accented"].replace(
-                    "е́",
-                    "е'"
-                )
+    # Lemma-specific fixes are declared in `files/lemma_fixes.json`.
+    noun_analyses = apply_fix_overlay(
+        analyses=noun_analyses,
+        section=NOUN_FIXES_KEY,
+        decl_types=RUSSIAN_NOUN_DECLENSION_TYPES,
+        fp_fixes=fp_fixes,
+        diagnostics=diagnostics,
+    )
 
-        if d["bare"] == "MP3-плеер":
-            for decl_type in RUSSIAN_NOUN_DECLENSION_TYPES:
-                d["ground_truth_decls"][decl_type][0]["accented"] = "MP3-" + d["ground_truth_decls"][decl_type][0]["accented"]
-            d["ground_truth_decls"]["gen_sg"][0]["accented"] = "MP3-пле'ера"
+    nouns_to_remove = []
+    for nom_sg_id, d in noun_analyses.items():
 
         if (
             "translations" not in d["meta"] 
@@ -167,7 +184,12 @@ def fix_noun_analyses(noun_analyses):
             )
         ):
             nouns_to_remove.append(nom_sg_id)
-            print(f"Removing {d['bare']}/{d['accented']} ({nom_sg_id}) as it has not translations.")
+            diagnostics.report(
+                "removed_no_translations",
+                f"Removing {d['bare']}/{d['accented']} ({nom_sg_id}) as it has not translations.",
+                word_id=nom_sg_id,
+                bare=d["bare"],
+            )
 
     for nom_sg_id in nouns_to_remove:
         del noun_analyses[nom_sg_id]
@@ -175,6 +197,44 @@ def fix_noun_analyses(noun_analyses):
     return noun_analyses
 
 
+def check_partners(nom_sg_id, d, partner_graph: PartnerGraph, diagnostics=None):
+    """Resolve the partners of a noun to word ids, and check that each pair differs in gender only."""
+
+    diagnostics = get_diagnostics(diagnostics)
+
+    for partner in partner_graph.get_unresolved(nom_sg_id):
+        diagnostics.report(
+            "partner_unresolved",
+            f"Cannot find the partner {partner} of {d['bare']} ({nom_sg_id}) in words.",
+            word_id=nom_sg_id,
+            bare=d["bare"],
+            partner=partner,
+        )
+
+    d["partner_ids"] = partner_graph.neighbours(nom_sg_id)
+    for partner_id in d["partner_ids"]:
+        meta_of_partner = partner_graph.get_attributes(partner_id)
+        if meta_of_partner is None:
+            continue
+
+        if meta_of_partner["gender"] == d["meta"]["gender"]:
+            diagnostics.report(
+                "partner_same_gender",
+                f"{d['bare']} ({nom_sg_id}) and its partner {partner_id} are both {d['meta']['gender']}.",
+                word_id=nom_sg_id,
+                bare=d["bare"],
+                partner_id=partner_id,
+            )
+        if eval_boolean(meta_of_partner["animate"]) != eval_boolean(d["meta"]["animate"]):
+            diagnostics.report(
+                "partner_animacy_mismatch",
+                f"{d['bare']} ({nom_sg_id}) and its partner {partner_id} differ in animacy.",
+                word_id=nom_sg_id,
+                bare=d["bare"],
+                partner_id=partner_id,
+            )
+
+
 def apply_declensions(russian_noun):
 
     decls = {}
@@ -185,7 +245,9 @@ def apply_declensions(russian_noun):
     return decls
 
 
-def make_row(d):
+def make_row(d, diagnostics=None):
+
+    diagnostics = get_diagnostics(diagnostics)
 
     row = dict(
         bare_form=d["bare"],
@@ -199,6 +261,7 @@ def make_row(d):
         is_sg_only=eval_boolean(d["meta"]["sg_only"]),
         is_pl_only=eval_boolean(d["meta"]["pl_only"]),
         partner=d["meta"]["partner"],
+        partner_ids=";".join(d.get("partner_ids", [])),
         usage=d["meta"]["usage"],
     )
     
@@ -244,7 +307,11 @@ def make_row(d):
                         rb[-2:],
                     )) == {"ом", "ем"}
                 ):
-                    print("Fixing о'м/ем in m.inst_sg:", d["accented"], ground_truth_decl_form, rule_based_decl_form)
+                    diagnostics.report(
+                        "fix_m_inst_sg_om_em",
+                        f"Fixing о'м/ем in m.inst_sg: {d['accented']} {ground_truth_decl_form} {rule_based_decl_form}",
+                        bare=d["bare"],
+                    )
                     irregular_declension_indices.remove(i)
 
         # Fix -ою/-ёю/-ею in f.inst_sg.
@@ -259,7 +326,11 @@ def make_row(d):
                     "ёю",
                     "ею"
                 ) and i in irregular_declension_indices:
-                    print("Fixing -ою/-ёю/-ею in f.inst_sg:", d["accented"], ground_truth_decl_form)
+                    diagnostics.report(
+                        "fix_f_inst_sg_oju",
+                        f"Fixing -ою/-ёю/-ею in f.inst_sg: {d['accented']} {ground_truth_decl_form}",
+                        bare=d["bare"],
+                    )
                     irregular_declension_indices.remove(i)
 
         Irregular_declension_indices = irregular_declension_indices[:]
@@ -275,7 +346,11 @@ def make_row(d):
         ):
             for i, ground_truth_decl_form in enumerate(ground_truth_decl_forms):
                 if remove_accent_mark(ground_truth_decl_form)[-1] == "у":
-                    print(f"Setting as not Irregular for gen_sg of {d['bare']} ({ground_truth_decl_forms})")
+                    diagnostics.report(
+                        "not_Irregular_gen_sg",
+                        f"Setting as not Irregular for gen_sg of {d['bare']} ({ground_truth_decl_forms})",
+                        bare=d["bare"],
+                    )
                     Irregular_declension_indices.remove(i)
                     break
         
@@ -290,7 +365,11 @@ def make_row(d):
         ):
             for i, ground_truth_decl_form in enumerate(ground_truth_decl_forms):
                 if remove_accent_mark(ground_truth_decl_form)[-1] == "у":
-                    print(f"Setting as not Irregular for prep_sg of {d['bare']} ({ground_truth_decl_forms})")
+                    diagnostics.report(
+                        "not_Irregular_prep_sg",
+                        f"Setting as not Irregular for prep_sg of {d['bare']} ({ground_truth_decl_forms})",
+                        bare=d["bare"],
+                    )
                     Irregular_declension_indices.remove(i)
                     break
 
@@ -347,12 +426,12 @@ def make_row(d):
     return row
 
 
-def main(tokens: List[str], nouns: List[dict], words: List[dict], words_forms: List[dict], translations: List[dict], fp_analyses: str):
+def main(tokens: List[str], nouns: List[dict], words: List[dict], words_forms: List[dict], translations: List[dict], fp_analyses: str, profiler: Optional[StageProfiler] = None, diagnostics: Optional[Diagnostics] = None, stats: Optional[AnalysisStats] = None, cache: Optional[LemmaCache] = None):
     """Analyze nouns.
 
     Output file format:
 
-        bare_form, accented_form, last_letter, gender, translations, is_animate, is_indeclinable, is_sg_only, is_pl_only, partner, usage,
+        bare_form, accented_form, last_letter, gender, translations, is_animate, is_indeclinable, is_sg_only, is_pl_only, partner, partner_ids, usage,
         nom_sg, nom_sg_tags, nom_pl, nom_pl_tags,
         gen_sg, gen_sg_tags, gen_pl, gen_pl_tags,
         dat_sg, dat_sg_tags, dat_pl, dat_pl_tags,
@@ -376,50 +455,113 @@ def main(tokens: List[str], nouns: List[dict], words: List[dict], words_forms: L
         3. For each nom sg:
             a. Get its bare and accented forms.
             b. Get its meta info (e.g., gender, partner, animate, etc.).
+                Partners are resolved to word ids through a partner graph (see `partner_graph`),
+                and pairs not differing in gender only are reported.
             c. Get its ground-truth declensions.
             d. Perform declensions according to the Russian noun declension rules and
                 compare the declensions with the ground truth. Mark all inconsistent declensions with
                 decl_tags.
 
-    """
+    Each step is timed by `profiler` (see `profiling.StageProfiler`).
+    Per-lemma messages are collected by `diagnostics` (see `diagnostics.Diagnostics`).
+    Rates of the tags by cell and class are aggregated by `stats` as the rows are made (see `analysis_stats.AnalysisStats`).
+    If `cache` is given, the rows of the lemmas unchanged since they were cached are reused (see `lemma_cache.LemmaCache`).
 
-    nom_sg_ids = get_nom_sg_ids(
-        tokens=tokens,
-        words=words,
-        words_forms=words_forms,
-    )
+    """
 
-    noun_analyses = get_noun_analyses(
-        nom_sg_ids=nom_sg_ids,
-        words=words,
-        nouns=nouns,
-        words_forms=words_forms,
-        translations=translations,
-    )
-    noun_analyses = fix_noun_analyses(
-        noun_analyses
-    )
+    if profiler is None:
+        profiler = StageProfiler(name="nouns")
+    if diagnostics is None:
+        diagnostics = Diagnostics(name="nouns")
+    if stats is None:
+        stats = AnalysisStats(name="nouns", groups=STATS_GROUPS)
+
+    with profiler.stage("select_lemmas", rows_in=len(words) + len(words_forms)) as stage:
+        nom_sg_ids = get_nom_sg_ids(
+            tokens=tokens,
+            words=words,
+            words_forms=words_forms,
+        )
+        stage["rows_out"] = len(nom_sg_ids)
+
+    with profiler.stage(
+        "assemble_analyses", 
+        rows_in=len(words) + len(nouns) + len(words_forms) + len(translations)
+    ) as stage:
+        noun_analyses = get_noun_analyses(
+            nom_sg_ids=nom_sg_ids,
+            words=words,
+            nouns=nouns,
+            words_forms=words_forms,
+            translations=translations,
+        )
+        stage["rows_out"] = len(noun_analyses)
 
-    rows = []  # For storing.
-    for _, d in noun_analyses.items():
-        
-        russian_noun = RussianNoun(
-            accented=d["accented"],
-            gender=d["meta"]["gender"],
-            is_animate=eval_boolean(d["meta"]["animate"]),
+    with profiler.stage("fix_analyses", rows_in=len(noun_analyses)) as stage:
+        noun_analyses = fix_noun_analyses(
+            noun_analyses,
+            diagnostics=diagnostics,
+        )
+        stage["rows_out"] = len(noun_analyses)
+
+    with profiler.stage("build_partner_graph", rows_in=len(words) + len(nouns)) as stage:
+        partner_graph = build_partner_graph(
+            words=words,
+            pos_rows=nouns,
+            word_type="noun",
+            attribute_columns=ATTRIBUTE_COLUMNS["nouns"],
         )
-        d["rule_based_decls"] = apply_declensions(russian_noun)
+        stage["rows_out"] = len(partner_graph)
+
+    with profiler.stage("check_partners", rows_in=len(noun_analyses)) as stage:
+        for nom_sg_id, d in count_rows(noun_analyses.items()):
+            check_partners(
+                nom_sg_id,
+                d,
+                partner_graph=partner_graph,
+                diagnostics=diagnostics,
+            )
+        stage["rows_out"] = len(noun_analyses)
 
-        row = make_row(d)
-        rows.append(row)
+    if cache is not None:
+        with profiler.stage("look_up_cache", rows_in=len(noun_analyses)) as stage:
+            stage["rows_out"] = cache.look_up(noun_analyses)
 
-    write_csv(
-        fp=fp_analyses,
-        l=list(sorted(
-            rows,
-            key=lambda r: r["bare_form"]
-        )),
-    )
+    with profiler.stage("apply_declensions", rows_in=len(noun_analyses)) as stage:
+        for nom_sg_id, d in count_rows(noun_analyses.items()):
+            if cache is not None and cache.is_hit(nom_sg_id):
+                continue
+
+            russian_noun = RussianNoun(
+                accented=d["accented"],
+                gender=d["meta"]["gender"],
+                is_animate=eval_boolean(d["meta"]["animate"]),
+            )
+            d["rule_based_decls"] = apply_declensions(russian_noun)
+        stage["rows_out"] = len(noun_analyses)
+
+    with profiler.stage("make_row", rows_in=len(noun_analyses)) as stage:
+        rows = []  # For storing.
+        for nom_sg_id, d in count_rows(noun_analyses.items()):
+            if cache is not None:
+                row = cache.get_row(nom_sg_id, d, make_row=make_row, diagnostics=diagnostics)
+            else:
+                row = make_row(d, diagnostics=diagnostics)
+            stats.update(row)
+            rows.append(row)
+        if cache is not None:
+            cache.commit()
+        stage["rows_out"] = len(rows)
+
+    with profiler.stage("write_csv", rows_in=len(rows)) as stage:
+        write_csv(
+            fp=fp_analyses,
+            l=list(sorted(
+                rows,
+                key=lambda r: r["bare_form"]
+            )),
+        )
+        stage["rows_out"] = len(rows)
     # write_csv(
     #     fp="noun_analyses.tagged.csv",
     #     l=list(sorted(
@@ -476,31 +618,200 @@ def main(tokens: List[str], nouns: List[dict], words: List[dict], words_forms: L
     # print(noun_analyses)
 
 
+def main_out_of_core(tokens: List[str], resources_dir: str, fp_analyses: str, memory_limit_mb: float = DEFAULT_MEMORY_LIMIT_MB, batch_size: int = DEFAULT_BATCH_SIZE, tmp_dir: Optional[str] = None, profiler: Optional[StageProfiler] = None, diagnostics: Optional[Diagnostics] = None, stats: Optional[AnalysisStats] = None, cache: Optional[LemmaCache] = None):
+    """Analyze nouns like `main`, without loading the dumps into memory.
+
+    The rows of the selected lemmas are external-sorted by word id and merged into one record
+    per lemma (see `out_of_core.iter_lemma_records`), and the lemmas are analyzed in batches.
+    The rows are external-sorted by bare form before being written.
+
+    :param resources_dir: E.g., "russian_word_analyses/resources"
+    :param memory_limit_mb: Memory for the sorts, split between the sorts of the tables and the
+        sort of the output rows (see `out_of_core.split_memory_limit`).
+    """
+
+    if profiler is None:
+        profiler = StageProfiler(name="nouns")
+    if diagnostics is None:
+        diagnostics = Diagnostics(name="nouns")
+    if stats is None:
+        stats = AnalysisStats(name="nouns", groups=STATS_GROUPS)
+
+    with profiler.stage("select_lemmas") as stage:
+        nom_sg_ids = get_nom_sg_ids(
+            tokens=tokens,
+            words=CsvStream(os.path.join(resources_dir, "words.csv")),
+            words_forms=CsvStream(os.path.join(resources_dir, "words_forms.csv")),
+        )
+        stage["rows_out"] = len(nom_sg_ids)
+
+    with profiler.stage("build_partner_graph") as stage:
+        partner_graph = build_partner_graph(
+            words=CsvStream(os.path.join(resources_dir, "words.csv")),
+            pos_rows=CsvStream(os.path.join(resources_dir, "nouns.csv")),
+            word_type="noun",
+            attribute_columns=ATTRIBUTE_COLUMNS["nouns"],
+        )
+        stage["rows_out"] = len(partner_graph)
+
+    records_memory_limit_mb, output_memory_limit_mb = split_memory_limit(memory_limit_mb)
+    n_rows = 0
+
+    def iter_rows():
+        nonlocal n_rows
+
+        records = iter_lemma_records(
+            resources_dir=resources_dir,
+            pos_name="nouns",
+            word_ids=nom_sg_ids,
+            memory_limit_mb=records_memory_limit_mb,
+            tmp_dir=tmp_dir,
+        )
+        for batch in iter_batches(records, batch_size=batch_size):
+            noun_analyses = get_noun_analyses(
+                nom_sg_ids={record["word_id"] for record in batch},
+                nouns=concat_tables(batch, "nouns"),
+                words=concat_tables(batch, "words"),
+                words_forms=concat_tables(batch, "words_forms"),
+                translations=concat_tables(batch, "translations"),
+                verbose=False,
+            )
+            noun_analyses = fix_noun_analyses(
+                noun_analyses,
+                diagnostics=diagnostics,
+            )
+            for nom_sg_id, d in noun_analyses.items():
+                check_partners(
+                    nom_sg_id,
+                    d,
+                    partner_graph=partner_graph,
+                    diagnostics=diagnostics,
+                )
+            if cache is not None:
+                cache.look_up(noun_analyses)
+
+            for nom_sg_id, d in count_rows(noun_analyses.items()):
+                if cache is None or not cache.is_hit(nom_sg_id):
+                    russian_noun = RussianNoun(
+                        accented=d["accented"],
+                        gender=d["meta"]["gender"],
+                        is_animate=eval_boolean(d["meta"]["animate"]),
+                    )
+                    d["rule_based_decls"] = apply_declensions(russian_noun)
+                n_rows += 1
+                if cache is not None:
+                    row = cache.get_row(nom_sg_id, d, make_row=make_row, diagnostics=diagnostics)
+                else:
+                    row = make_row(d, diagnostics=diagnostics)
+                stats.update(row)
+                yield row
+            if cache is not None:
+                cache.commit()
+
+    with profiler.stage("analyze_lemmas", rows_in=len(nom_sg_ids)) as stage:
+        write_csv(
+            fp=fp_analyses,
+            l=external_sort(
+                iter_rows(),
+                key=lambda r: r["bare_form"],
+                tmp_dir=tmp_dir,
+                max_bytes_in_memory=int(output_memory_limit_mb * 1024 * 1024),
+            ),
+        )
+        stage["rows_out"] = n_rows
+
+
 if __name__ == '__main__':
-    tokens = read_tokens(
-        fp_words="uploads/words.ru.json",
-        fp_articles="uploads/articles.ru.json",
-        duolingo_only_articles=True,
+    parser = argparse.ArgumentParser()
+    add_profile_arguments(parser)
+    add_diagnostics_arguments(parser)
+    add_stats_arguments(parser)
+    add_out_of_core_arguments(parser)
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+
+    profiler = StageProfiler(
+        name="nouns",
+        cprofile_dir=args.cprofile_dir,
+        track_memory=args.track_memory,
     )
-    print(f"#tokens: {len(tokens):,}")
-
-    nouns = read_csv(fp="russian_word_analyses/resources/nouns.csv")
-    words = read_csv(fp="russian_word_analyses/resources/words.csv")  # Nouns in `words` are infinitives.
-    words_forms = read_csv(fp="russian_word_analyses/resources/words_forms.csv")
-    translations = read_csv(fp="russian_word_analyses/resources/translations.csv")
-    print(
-        f"#nouns: {len(nouns):,}, "
-        f"#words: {len(words):,}, "
-        f"#words_forms: {len(words_forms):,}, "
-        f"#translations: {len(translations):,}"
+    diagnostics = Diagnostics(
+        name="nouns",
+        echo=args.verbose,
+    )
+    stats = AnalysisStats(
+        name="nouns",
+        groups=STATS_GROUPS,
     )
+    cache = None
+    if args.lemma_cache is not None:
+        cache = LemmaCache(
+            fp=args.lemma_cache,
+            analyzer="nouns",
+            code_modules=CACHE_CODE_MODULES,
+        )
+
+    with profiler.stage("read_tokens") as stage:
+        tokens = read_tokens(
+            fp_words="uploads/words.ru.json",
+            fp_articles="uploads/articles.ru.json",
+            duolingo_only_articles=True,
+        )
+        stage["rows_out"] = len(tokens)
+    print(f"#tokens: {len(tokens):,}")
 
     fp_analyses = "russian_word_analyses/files/noun_analyses.csv"
-    main(
-        tokens=tokens,
-        nouns=nouns,
-        words=words,
-        words_forms=words_forms,
-        translations=translations,
-        fp_analyses=fp_analyses,
-    )
+    if args.out_of_core:
+        main_out_of_core(
+            tokens=tokens,
+            resources_dir="russian_word_analyses/resources",
+            fp_analyses=fp_analyses,
+            memory_limit_mb=args.memory_limit_mb,
+            batch_size=args.batch_size,
+            profiler=profiler,
+            diagnostics=diagnostics,
+            stats=stats,
+            cache=cache,
+        )
+    else:
+        with profiler.stage("read_csv") as stage:
+            nouns = read_csv(fp="russian_word_analyses/resources/nouns.csv")
+            words = read_csv(fp="russian_word_analyses/resources/words.csv")  # Nouns in `words` are infinitives.
+            words_forms = read_csv(fp="russian_word_analyses/resources/words_forms.csv")
+            translations = read_csv(fp="russian_word_analyses/resources/translations.csv")
+            stage["rows_out"] = len(nouns) + len(words) + len(words_forms) + len(translations)
+        print(
+            f"#nouns: {len(nouns):,}, "
+            f"#words: {len(words):,}, "
+            f"#words_forms: {len(words_forms):,}, "
+            f"#translations: {len(translations):,}"
+        )
+
+        main(
+            tokens=tokens,
+            nouns=nouns,
+            words=words,
+            words_forms=words_forms,
+            translations=translations,
+            fp_analyses=fp_analyses,
+            profiler=profiler,
+            diagnostics=diagnostics,
+            stats=stats,
+            cache=cache,
+        )
+
+    if cache is not None:
+        cache.close()
+        print(f"Lemma cache: {cache.n_hits:,} hits, {cache.n_misses:,} misses")
+
+    stats.print_summary()
+    if args.stats is not None:
+        stats.save(fp=args.stats)
+
+    diagnostics.print_summary()
+    if args.diagnostics is not None:
+        diagnostics.save(fp=args.diagnostics)
+
+    profiler.print_report()
+    if args.profile is not None:
+        profiler.save(fp=args.profile)
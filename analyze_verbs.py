@@ -1,11 +1,18 @@
+import argparse
 import csv
 import hashlib
 import json
 import os.path
 import string
-from tqdm import tqdm
 from typing import List, Dict, Tuple, Optional
 
+from compression import open_file, resolve_path
+from diagnostics import Diagnostics, add_diagnostics_arguments
+from out_of_core import CsvStream
+from partner_graph import PartnerGraphBuilder, ATTRIBUTE_COLUMNS, split_partners
+from profiling import StageProfiler, add_profile_arguments
+from progress import tqdm
+
 accent_mark = "'"
 
 special_case_mark = "*"
@@ -18,13 +25,13 @@ jaju_special_consonants = "жшщч"
 
 
 def read_json(fp: str) -> dict:
-    with open(fp, encoding="utf-8") as f:
+    with open_file(fp, encoding="utf-8") as f:
         j = json.load(f)
     return j
 
 
 def save_json(d: dict, fp: str):
-    with open(fp, "w", encoding="utf-8") as f:
+    with open_file(fp, "w", encoding="utf-8") as f:
         json.dump(
             obj=d,
             fp=f,
@@ -60,13 +67,13 @@ def read_tokens(fp_words: Optional[str], fp_articles: Optional[str]) -> List[str
 
 
 def read_csv(fp: str) -> List[dict]:
-    with open(fp, "r", encoding="utf-8") as f:
+    with open_file(fp, "r", encoding="utf-8") as f:
         csv_reader = csv.DictReader(f)
         return list(csv_reader)
 
 
 def write_csv(fp: str, l: List[dict]):
-    with open(fp, "w", encoding="utf-8") as f:
+    with open_file(fp, "w", encoding="utf-8") as f:
         csv_writer = csv.DictWriter(f, fieldnames=list(l[0].keys()))
         csv_writer.writeheader()
         csv_writer.writerows(l)
@@ -121,11 +128,27 @@ def remove_accent_mark(word: str) -> str:
     )
 
 
-def analyze_verbs(tokens, verbs, words, words_forms, fp_token2inf_ids, fp_analyses):
+def get_token2inf_ids_hash(tokens_hash: str, fps_resources: List[str]) -> str:
+    """A hash of the tokens and of the size and mtime of the resources token2inf_ids is constructed from.
+
+    The saved token2inf_ids is named by it, so that it is constructed again after `words` or
+    `words_forms` are changed, instead of reusing ids that no longer exist.
+
+    :param fps_resources: E.g., ["resource/words.csv", "resource/words_forms.csv"]
+    """
+
+    signatures = []
+    for fp in fps_resources:
+        stat = os.stat(resolve_path(fp))
+        signatures.append([stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha256(json.dumps([tokens_hash, signatures]).encode("utf-8")).hexdigest()
+
+
+def analyze_verbs(tokens, verbs, words, words_forms, fp_token2inf_ids, fp_analyses, profiler=None, diagnostics=None):
     """Fields:
     infinitive, accented_infinitive,
     stem, suffix,
-    aspect, partners,
+    aspect, partners, partner_ids,
     conjugation_type,
     present/future forms ...,
     imperative forms ...,
@@ -187,21 +210,10 @@ def analyze_verbs(tokens, verbs, words, words_forms, fp_token2inf_ids, fp_analys
 
     ###### Constants ######
 
-    print("Constructing id2verb")
-    id2verb = {
-        verb["word_id"]: verb
-        for verb in tqdm(verbs)
-    }
-    print("Constructing id2word")
-    id2word = {
-        word["id"]: word
-        for word in tqdm(words)
-    }
-    print("Constructing id2wordforms")
-    id2word_forms = {}
-    for wf in tqdm(words_forms):
-        id2word_forms.setdefault(wf["word_id"], {})
-        id2word_forms[wf["word_id"]][wf["form_type"]] = wf
+    if profiler is None:
+        profiler = StageProfiler(name="verbs")
+    if diagnostics is None:
+        diagnostics = Diagnostics(name="verbs")
 
     def get_token2inf_ids() -> Dict[str, List[str]]:
         """token: [infinitive_ids]"""
@@ -215,12 +227,15 @@ def analyze_verbs(tokens, verbs, words, words_forms, fp_token2inf_ids, fp_analys
 
         token2inf_ids = {}
 
+        # `tokens` is a list, so look tokens up in a set.
+        token_set = set(tokens)
+
         # Each verb in `words` is inf,
         # so this loop mainly constructs inf: [{inf_id:accented_inf:}].
         for w in tqdm(words):
 
             token = w["bare"]
-            if token not in tokens:  # Check this first to save time.
+            if token not in token_set:  # Check this first to save time.
                 continue
 
             if w["type"] != "verb":
@@ -238,7 +253,7 @@ def analyze_verbs(tokens, verbs, words, words_forms, fp_token2inf_ids, fp_analys
         for wf in tqdm(words_forms):
 
             token = wf["_form_bare"]
-            if token not in tokens:
+            if token not in token_set:
                 continue
 
             if not wf["form_type"].startswith("ru_verb"):
@@ -258,7 +273,54 @@ def analyze_verbs(tokens, verbs, words, words_forms, fp_token2inf_ids, fp_analys
 
         return token2inf_ids
 
-    token2inf_ids = get_token2inf_ids()
+    with profiler.stage("select_lemmas", rows_in=len(tokens)) as stage:
+        token2inf_ids = get_token2inf_ids()
+        stage["rows_out"] = len(token2inf_ids)
+
+    # Only the selected infinitives are looked up, so only they are indexed.
+    # `verbs`, `words` and `words_forms` are only iterated over, so they can be streams (see `out_of_core.CsvStream`).
+    inf_id_set = {
+        inf_id
+        for inf_ids in token2inf_ids.values()
+        for inf_id in inf_ids
+    }
+
+    with profiler.stage("build_indexes") as stage:
+        n_rows = 0
+
+        # The partner graph needs all verbs, so it is built during the same scans.
+        partner_graph_builder = PartnerGraphBuilder(
+            word_type="verb",
+            attribute_columns=ATTRIBUTE_COLUMNS["verbs"],
+        )
+
+        print("Constructing id2verb")
+        id2verb = {}
+        for verb in tqdm(verbs):
+            n_rows += 1
+            partner_graph_builder.add_lemma(verb)
+            if verb["word_id"] in inf_id_set:
+                id2verb[verb["word_id"]] = verb
+        print("Constructing id2word")
+        id2word = {}
+        for word in tqdm(words):
+            n_rows += 1
+            partner_graph_builder.add_word(word)
+            if word["id"] in inf_id_set:
+                id2word[word["id"]] = word
+        print("Constructing id2wordforms")
+        id2word_forms = {}
+        for wf in tqdm(words_forms):
+            n_rows += 1
+            if wf["word_id"] not in inf_id_set:
+                continue
+            id2word_forms.setdefault(wf["word_id"], {})
+            id2word_forms[wf["word_id"]][wf["form_type"]] = wf
+
+        partner_graph = partner_graph_builder.build()
+
+        stage["rows_in"] = n_rows
+        stage["rows_out"] = len(id2verb) + len(id2word) + len(id2word_forms)
 
     def get_stem_and_suffix(infinitive: str) -> Tuple[Optional[str], Optional[str]]:
 
@@ -275,9 +337,10 @@ def analyze_verbs(tokens, verbs, words, words_forms, fp_token2inf_ids, fp_analys
         elif suffix in [tji, ch_]:
             pass
         else:
-            print(
-                f"[error] split_infinitive(): "
-                f"Failed to split the infinitive {infinitive}."
+            diagnostics.report(
+                "split_failed",
+                f"split_infinitive(): Failed to split the infinitive {infinitive}.",
+                infinitive=infinitive,
             )
             return undetermined_mark, undetermined_mark
 
@@ -309,9 +372,11 @@ def analyze_verbs(tokens, verbs, words, words_forms, fp_token2inf_ids, fp_analys
             if infinitive_stem[-1] != ji:
                 conj_type = f"{special_case_mark}{conj_type}"
         else:
-            print(
-                f"[error] get_conjugation_type(): "
-                f"Failed to detect the conjugation type for {infinitive}.")
+            diagnostics.report(
+                "conjugation_type_undetermined",
+                f"get_conjugation_type(): Failed to detect the conjugation type for {infinitive}.",
+                infinitive=infinitive,
+            )
             conj_type = undetermined_mark
 
         return conj_type
@@ -490,164 +555,236 @@ def analyze_verbs(tokens, verbs, words, words_forms, fp_token2inf_ids, fp_analys
     def ru_verb_past_pl(stem: str, suffix: str, accent_pos: int, conjugation_type: str):
         return stem + "ли"
 
-    verb_info = {}
-    for token in tokens:
+    def check_partners(inf_id: str, bare_inf: str, aspect: str) -> List[str]:
+        """Resolve the partners of a verb to word ids, and check that each pair differs in aspect."""
 
-        # Get infinitive id.
-        inf_ids = token2inf_ids.get(token)
-        if inf_ids is None:
-            # print(f"[error] Cannot obtain infinitive ids for {token}. Skipping.")
-            continue
+        for partner in partner_graph.get_unresolved(inf_id):
+            diagnostics.report(
+                "partner_unresolved",
+                f"Cannot find the partner {partner} of {bare_inf} ({inf_id}) in words.",
+                infinitive=bare_inf,
+                partner=partner,
+            )
 
-        # TODO
-        # print(f"Analyzing verb: {token}")
+        partner_ids = partner_graph.neighbours(inf_id)
+        for partner_id in partner_ids:
+            meta_of_partner = partner_graph.get_attributes(partner_id)
+            if meta_of_partner is not None and meta_of_partner["aspect"] == aspect:
+                diagnostics.report(
+                    "partner_same_aspect",
+                    f"{bare_inf} ({inf_id}) and its partner {partner_id} are both {aspect}.",
+                    infinitive=bare_inf,
+                    partner_id=partner_id,
+                )
 
-        if len(inf_ids) > 1:
-            print(
-                f"[error] analyze_verbs(): "
-                f"Found more than one infinitive ids for \"{token}\": {inf_ids}. Skipping."
-            )
-            continue
-        inf_id = inf_ids[0]
-
-        # Get bare and accented infinitives.
-        bare_inf = id2word[inf_id]["bare"]
-        accented_inf = add_accent_mark_for_word_with_single_vowel(word=id2word[inf_id]["accented"])
-        if accented_inf in verb_info.keys():
-            # Analyzed, so skip.
-            continue
-
-        accent_pos = (
-            accented_inf.index(accent_mark)
-            if accent_mark in accented_inf
-            else None
-        )
+        return partner_ids
 
-        # Get stem and suffix.
-        stem, suffix = get_stem_and_suffix(infinitive=bare_inf)
+    with profiler.stage("conjugate", rows_in=len(tokens)) as stage:
+        verb_info = {}
+        for token in tokens:
 
-        # Get aspect.
-        aspect = id2verb[inf_id]["aspect"]
+            # Get infinitive id.
+            inf_ids = token2inf_ids.get(token)
+            if inf_ids is None:
+                # print(f"[error] Cannot obtain infinitive ids for {token}. Skipping.")
+                continue
 
-        # Get partners
-        partners = id2verb[inf_id]["partner"]
+            # TODO
+            # print(f"Analyzing verb: {token}")
 
-        # Get conjugation_type.
-        try:
-            presfut_sg2 = id2word_forms[inf_id]["ru_verb_presfut_sg2"]["_form_bare"]
-        except KeyError:
-            print(
-                f"[error] analyze_verbs(): "
-                f"Cannot obtain presfut_sg2 for analyzing the conjugation type of {bare_inf}."
-            )
-            conjugation_type = undetermined_mark
-        else:
-            conjugation_type = get_conjugation_type(
-                infinitive=bare_inf,
-                presfut_sg2=presfut_sg2,
+            if len(inf_ids) > 1:
+                diagnostics.report(
+                    "multiple_infinitives",
+                    f"Found more than one infinitive ids for \"{token}\": {inf_ids}. Skipping.",
+                    token=token,
+                    inf_ids=inf_ids,
+                )
+                continue
+            inf_id = inf_ids[0]
+
+            # Get bare and accented infinitives.
+            bare_inf = id2word[inf_id]["bare"]
+            accented_inf = add_accent_mark_for_word_with_single_vowel(word=id2word[inf_id]["accented"])
+            if accented_inf in verb_info.keys():
+                # Analyzed, so skip.
+                continue
+
+            accent_pos = (
+                accented_inf.index(accent_mark)
+                if accent_mark in accented_inf
+                else None
             )
 
-        # Get forms.
-        forms = {}
-        for form_type in all_form_types:
+            # Get stem and suffix.
+            stem, suffix = get_stem_and_suffix(infinitive=bare_inf)
+
+            # Get aspect.
+            aspect = id2verb[inf_id]["aspect"]
+
+            # Get partners
+            partners = id2verb[inf_id]["partner"]
+            partner_ids = check_partners(inf_id, bare_inf, aspect)
+
+            # Get conjugation_type.
             try:
-                trg = id2word_forms[inf_id][form_type]["form"]
+                presfut_sg2 = id2word_forms[inf_id]["ru_verb_presfut_sg2"]["_form_bare"]
             except KeyError:
-                print(
-                    f"[error] analyze_verbs(): "
-                    f"Cannot construct {form_type} for {bare_inf}. Skipping."
+                diagnostics.report(
+                    "missing_presfut_sg2",
+                    f"Cannot obtain presfut_sg2 for analyzing the conjugation type of {bare_inf}.",
+                    infinitive=bare_inf,
+                )
+                conjugation_type = undetermined_mark
+            else:
+                conjugation_type = get_conjugation_type(
+                    infinitive=bare_inf,
+                    presfut_sg2=presfut_sg2,
                 )
-                forms[form_type] = undetermined_mark
-                continue
 
-            r = eval(form_type)(
-                stem=stem,
-                suffix=suffix[:-2] if suffix.endswith(sja_) else suffix,
-                accent_pos=accent_pos,
-                conjugation_type=conjugation_type.replace(special_case_mark, ""),
-            )
-            if type(r) == str:
-                form = r
-            else:  # type(r) == tuple
-                form, accent_pos = r
-
-            if suffix.endswith(sja_):
-                if not remove_accent_mark(word=form)[-1] in vowels:
-                    form = form + sja_
+            # Get forms.
+            forms = {}
+            for form_type in all_form_types:
+                try:
+                    trg = id2word_forms[inf_id][form_type]["form"]
+                except KeyError:
+                    diagnostics.report(
+                        "missing_form",
+                        f"Cannot construct {form_type} for {bare_inf}. Skipping.",
+                        infinitive=bare_inf,
+                        form_type=form_type,
+                    )
+                    forms[form_type] = undetermined_mark
+                    continue
+
+                r = eval(form_type)(
+                    stem=stem,
+                    suffix=suffix[:-2] if suffix.endswith(sja_) else suffix,
+                    accent_pos=accent_pos,
+                    conjugation_type=conjugation_type.replace(special_case_mark, ""),
+                )
+                if type(r) == str:
+                    form = r
+                else:  # type(r) == tuple
+                    form, accent_pos = r
+
+                if suffix.endswith(sja_):
+                    if not remove_accent_mark(word=form)[-1] in vowels:
+                        form = form + sja_
+                    else:
+                        form = form + s_
+
+                # Add the accent mark.
+                form = form[:accent_pos] + accent_mark + form[accent_pos:]
+
+                if form != trg:
+                    diagnostics.report(
+                        "form_mismatch",
+                        f"{'[' + form_type + ']':<25} "
+                        f"{accented_inf + ' (' + stem + '-' + suffix + ')':<50} "
+                        f"{form}(✔) {trg}(❌)",
+                        infinitive=accented_inf,
+                        form_type=form_type,
+                        rule_based=form,
+                        ground_truth=trg,
+                    )
+
+                    if remove_accent_mark(form) == remove_accent_mark(trg):
+                        forms[form_type] = f"({accent_pos_changing_mark}) {trg}"
+                    else:
+                        forms[form_type] = f"({special_case_mark}) {trg}"
                 else:
-                    form = form + s_
+                    forms[form_type] = ""  # For brevity.
+
+            verb_info[accented_inf] = {
+                "infinitive": bare_inf, "accented_infinitive": accented_inf,
+                "stem": stem, "suffix": suffix,
+                "aspect": aspect, "partners": partners, "partner_ids": ";".join(partner_ids),
+                "conjugation_type": conjugation_type,
+            }
+            for form_type, form in forms.items():
+                verb_info[accented_inf][form_type] = form
+        stage["rows_out"] = len(verb_info)
+
+    def group_by_aspect_pairs() -> List[dict]:
+        """Reorder: imperfective, perfective, other.
+
+        Each imperfective verb is followed by its perfective partners (in `partners`, `;`-separated
+        bare infinitives), and the unpaired verbs come last, each in the order of `verb_info`.
+        Partners are resolved through an index from bare infinitive to verbs.
+        """
+
+        bare2verbs = {}
+        for accented_infinitive, d in verb_info.items():
+            bare2verbs.setdefault(
+                remove_accent_mark(accented_infinitive),
+                [],
+            ).append((accented_infinitive, d))
+
+        reordered_verb_info = []
+        processed_accented_infinitives = set()
+        for accented_infinitive, d in verb_info.items():
+            if d["aspect"] != ipfv:
+                continue
 
-            # Add the accent mark.
-            form = form[:accent_pos] + accent_mark + form[accent_pos:]
+            for partner in split_partners(d["partners"]):
+                for accented_infinitive_of_partner, d_of_partner in bare2verbs.get(partner, []):
+                    if d_of_partner["aspect"] != pfv:
+                        continue
 
-            if form != trg:
-                print(
-                    f"{'[' + form_type + ']':<25} "
-                    f"{accented_inf + ' (' + stem + '-' + suffix + ')':<50} "
-                    f"{form}(✔) {trg}(❌)"
-                )
+                    if accented_infinitive not in processed_accented_infinitives:
+                        reordered_verb_info.append(d)
+                        processed_accented_infinitives.add(accented_infinitive)
 
-                if remove_accent_mark(form) == remove_accent_mark(trg):
-                    forms[form_type] = f"({accent_pos_changing_mark}) {trg}"
-                else:
-                    forms[form_type] = f"({special_case_mark}) {trg}"
-            else:
-                forms[form_type] = ""  # For brevity.
-
-        verb_info[accented_inf] = {
-            "infinitive": bare_inf, "accented_infinitive": accented_inf,
-            "stem": stem, "suffix": suffix,
-            "aspect": aspect, "partners": partners,
-            "conjugation_type": conjugation_type,
-        }
-        for form_type, form in forms.items():
-            verb_info[accented_inf][form_type] = form
-
-    write_csv(
-        fp=fp_analyses,
-        l=list(verb_info.values()),
-    )
+                    if accented_infinitive_of_partner not in processed_accented_infinitives:
+                        reordered_verb_info.append(d_of_partner)
+                        processed_accented_infinitives.add(accented_infinitive_of_partner)
 
-    # # Reorder: imperfective, perfective, other.
-    # reordered_verb_info = []
-    # processed_accented_infinitives = set()
-    # for accented_infinitive, d in verb_info.items():
-    #     if d["aspect"] != ipfv:
-    #         continue
-    #
-    #     partners = d["partners"].split(";")
-    #     for partner in partners:
-    #         for accented_infinitive_of_partner, d_of_partner in verb_info.items():
-    #             if partner != remove_accent_mark(accented_infinitive_of_partner):
-    #                 continue
-    #
-    #             if d_of_partner["aspect"] != pfv:
-    #                 continue
-    #
-    #             if accented_infinitive not in processed_accented_infinitives:
-    #                 reordered_verb_info.append(d)
-    #                 processed_accented_infinitives.add(accented_infinitive)
-    #
-    #             if accented_infinitive_of_partner not in processed_accented_infinitives:
-    #                 reordered_verb_info.append(d_of_partner)
-    #                 processed_accented_infinitives.add(accented_infinitive_of_partner)
-    #
-    # for accented_infinitive, d in verb_info.items():
-    #     if accented_infinitive not in processed_accented_infinitives:
-    #         reordered_verb_info.append(d)
-    #
-    # write_csv(
-    #     fp="resource/verb_info.csv",
-    #     l=reordered_verb_info
-    # )
+        for accented_infinitive, d in verb_info.items():
+            if accented_infinitive not in processed_accented_infinitives:
+                reordered_verb_info.append(d)
+
+        return reordered_verb_info
+
+    with profiler.stage("group_by_aspect_pairs", rows_in=len(verb_info)) as stage:
+        reordered_verb_info = group_by_aspect_pairs()
+        stage["rows_out"] = len(reordered_verb_info)
+
+    with profiler.stage("write_csv", rows_in=len(reordered_verb_info)) as stage:
+        write_csv(
+            fp=fp_analyses,
+            l=reordered_verb_info,
+        )
+        stage["rows_out"] = len(reordered_verb_info)
 
 
 def main():
-    tokens = read_tokens(
-        fp_words="uploads/words.ru.json",
-        # fp_articles="uploads/articles.ru.json",
-        fp_articles=None,
+    parser = argparse.ArgumentParser()
+    add_profile_arguments(parser)
+    add_diagnostics_arguments(parser)
+    parser.add_argument(
+        "--out-of-core",
+        action="store_true",
+        help="Stream the dumps instead of loading them into memory. Only the selected infinitives are kept.",
+    )
+    args = parser.parse_args()
+
+    profiler = StageProfiler(
+        name="verbs",
+        cprofile_dir=args.cprofile_dir,
+        track_memory=args.track_memory,
+    )
+    diagnostics = Diagnostics(
+        name="verbs",
+        echo=args.verbose,
     )
+
+    with profiler.stage("read_tokens") as stage:
+        tokens = read_tokens(
+            fp_words="uploads/words.ru.json",
+            # fp_articles="uploads/articles.ru.json",
+            fp_articles=None,
+        )
+        stage["rows_out"] = len(tokens)
     print(f"#tokens: {len(tokens):,}")
 
     # tokens_hash = hash(str(tokens))
@@ -656,13 +793,25 @@ def main():
     tokens_hash = hashlib.sha256(" ".join(tokens).encode("utf-8")).hexdigest()
     print(f"tokens hash: {tokens_hash}")
 
-    verbs = read_csv(fp="resource/verbs.csv")
-    words = read_csv(fp="resource/words.csv")  # Verbs in `words` are infinitives.
-    words_forms = read_csv(fp="resource/words_forms.csv")
-    print(
-        f"#verbs: {len(verbs):,}, "
-        f"#words: {len(words):,}, "
-        f"#words_forms: {len(words_forms):,}"
+    if args.out_of_core:
+        verbs = CsvStream(fp="resource/verbs.csv")
+        words = CsvStream(fp="resource/words.csv")
+        words_forms = CsvStream(fp="resource/words_forms.csv")
+    else:
+        with profiler.stage("read_csv") as stage:
+            verbs = read_csv(fp="resource/verbs.csv")
+            words = read_csv(fp="resource/words.csv")  # Verbs in `words` are infinitives.
+            words_forms = read_csv(fp="resource/words_forms.csv")
+            stage["rows_out"] = len(verbs) + len(words) + len(words_forms)
+        print(
+            f"#verbs: {len(verbs):,}, "
+            f"#words: {len(words):,}, "
+            f"#words_forms: {len(words_forms):,}"
+        )
+
+    token2inf_ids_hash = get_token2inf_ids_hash(
+        tokens_hash=tokens_hash,
+        fps_resources=["resource/words.csv", "resource/words_forms.csv"],
     )
 
     analyze_verbs(
@@ -670,10 +819,20 @@ def main():
         verbs=verbs,
         words=words,
         words_forms=words_forms,
-        fp_token2inf_ids=f"resource/token2inf_ids.{tokens_hash}.txt",
+        fp_token2inf_ids=f"resource/token2inf_ids.{token2inf_ids_hash}.txt",
         fp_analyses=f"resource/verb_info.{tokens_hash}.csv",
+        profiler=profiler,
+        diagnostics=diagnostics,
     )
 
+    diagnostics.print_summary()
+    if args.diagnostics is not None:
+        diagnostics.save(fp=args.diagnostics)
+
+    profiler.print_report()
+    if args.profile is not None:
+        profiler.save(fp=args.profile)
+
 
 if __name__ == '__main__':
     main()
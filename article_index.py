@@ -0,0 +1,520 @@
+"""An inverted index between the uploaded articles and the lemmas they use.
+
+`IO.read_tokens` merges the tokens of all the articles into one sorted set. This index keeps where
+they come from: the tokens of each paragraph are resolved to word ids (and to the cells of the
+forms, e.g., gen_pl) through `words` and `words_forms`, and posting lists are kept both ways:
+
+    article -> lemmas, with counts, and the lemmas of each paragraph
+    lemma -> articles, with counts
+
+The posting lists are sorted ids, stored as delta-encoded varints (see `encode_postings`).
+
+The index is updated per article: an article whose paragraphs are unchanged since the last update
+is not resolved again, and only the posting lists of the lemmas of a changed article are rewritten.
+E.g.,
+
+    index = ArticleIndex.load("russian_word_analyses/files/article_index.json")
+    index.update_articles(read_json("uploads/articles.ru.json"), words=words, words_forms=words_forms)
+    index.save("russian_word_analyses/files/article_index.json")
+
+    index.get_lemmas(1)           # [(word_id, count), ...]
+    index.get_articles(1234)      # [(article_id, count), ...]
+    index.get_irregular_cells(1, load_irregular_cells("russian_word_analyses/files/noun_analyses.csv"))
+
+Usage:
+
+    python article_index.py --resources-dir russian_word_analyses/resources --uploads-dir uploads \\
+        --index russian_word_analyses/files/article_index.json --article 1 --lemma автобус
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from IO import read_csv, read_json, iter_csv, normalize_token
+from utils import supplement_accent_mark
+
+
+INDEX_VERSION = 1
+
+TAGS_SUFFIX = "_tags"
+IRREGULAR_BIT = "i"
+
+LEMMA_CELL = "lemma"  # Tokens matching the bare form of a word but none of its forms in `words_forms`, e.g., infinitives.
+
+
+##### Posting lists #####
+
+
+def encode_varints(numbers: Iterable[int]) -> bytes:
+    """E.g., [1, 300] -> b"\\x01\\xac\\x02"."""
+
+    out = bytearray()
+    for number in numbers:
+        while number >= 0x80:
+            out.append((number & 0x7F) | 0x80)
+            number >>= 7
+        out.append(number)
+    return bytes(out)
+
+
+def decode_varints(data: bytes) -> List[int]:
+
+    numbers = []
+    number = 0
+    shift = 0
+    for byte in data:
+        number |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            numbers.append(number)
+            number = 0
+            shift = 0
+    return numbers
+
+
+def encode_postings(ids: Iterable[int]) -> bytes:
+    """Sorted, distinct ids as the varints of their deltas, e.g., [3, 5, 300] -> varints of [3, 2, 295]."""
+
+    deltas = []
+    last = 0
+    for i in ids:
+        deltas.append(i - last)
+        last = i
+    return encode_varints(deltas)
+
+
+def decode_postings(data: bytes) -> List[int]:
+
+    ids = []
+    last = 0
+    for delta in decode_varints(data):
+        last += delta
+        ids.append(last)
+    return ids
+
+
+##### Token resolution #####
+
+
+def get_cell(form_type: str) -> str:
+    """The cell of a form type, as in the analyses.
+
+    E.g., "ru_noun_sg_gen" -> "gen_sg", "ru_adj_m_gen" -> "gen_m", "ru_adj_short_m" -> "short_m",
+    "ru_verb_past_m" -> "past_m".
+    """
+
+    parts = form_type.split("_")[2:]
+    if form_type.startswith(("ru_noun_", "ru_adj_")) and "short" not in parts:
+        parts.reverse()
+    return "_".join(parts)
+
+
+def iter_article_tokens(article: dict) -> Iterable[Tuple[int, str]]:
+    """Yield (paragraph index, normalized token) of an article of the upload JSON."""
+
+    for para_index, para in enumerate(article["paras"]):
+        for token in para["text"].strip().split():
+            token = normalize_token(token)
+            if token:
+                yield para_index, token
+
+
+def get_article_hash(article: dict) -> str:
+    return hashlib.sha256(json.dumps(
+        [para["text"] for para in article["paras"]],
+        ensure_ascii=False,
+    ).encode("utf-8")).hexdigest()
+
+
+def build_form_lookup(tokens: Set[str], words: Iterable[dict], words_forms: Iterable[dict]) -> Dict[str, List[Tuple[int, str]]]:
+    """Resolve tokens to the (word id, cell) of the forms they match, like the analyzers do.
+
+    :return: {token: [(word_id, cell)]}. Tokens matching no form are left out.
+    """
+
+    lookup = {}
+    for row in words_forms:
+        if row["_form_bare"] in tokens:
+            lookup.setdefault(row["_form_bare"], set()).add((int(row["word_id"]), get_cell(row["form_type"])))
+
+    for row in words:
+        if row["bare"] not in tokens:
+            continue
+        word_id = int(row["id"])
+        word_cells = lookup.setdefault(row["bare"], set())
+        if not any(other_id == word_id for other_id, _ in word_cells):
+            word_cells.add((word_id, LEMMA_CELL))
+
+    return {
+        token: sorted(word_cells)
+        for token, word_cells in lookup.items()
+    }
+
+
+def load_irregular_cells(fp_analyses: str) -> Dict[str, Set[str]]:
+    """The cells tagged irregular of each lemma of an analysis CSV (e.g., files/noun_analyses.csv).
+
+    :return: {accented_form: {cell}}
+    """
+
+    irregular_cells = {}
+    for row in iter_csv(fp_analyses):
+        cells = {
+            column[:-len(TAGS_SUFFIX)]
+            for column, tags in row.items()
+            if column.endswith(TAGS_SUFFIX) and IRREGULAR_BIT in tags[1:].split(",", 1)[0]
+        }
+        if cells:
+            irregular_cells.setdefault(row["accented_form"], set()).update(cells)
+    return irregular_cells
+
+
+##### Index #####
+
+
+class ArticleIndex:
+    """Posting lists between articles (by id) and lemmas (by word id)."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+
+        # {article_id: {"hash":, "n_tokens":, "n_unresolved":, "lemmas": postings, "counts": varints,
+        #   "paras": [postings], "cells": {word_id: [cell]}}}
+        self.articles = {}
+        # {word_id: {"articles": postings, "counts": varints}}
+        self.lemma_postings = {}
+        # {word_id: [bare, accented]}
+        self.lemmas = {}
+        # Of the resources the tokens are resolved with. The index is rebuilt when it changes.
+        self.resources_signature = None
+
+    def __len__(self) -> int:
+        return len(self.articles)
+
+    def get_lemmas(self, article_id: int) -> List[Tuple[int, int]]:
+        """[(word_id, count)] of an article, by word id."""
+
+        entry = self.articles.get(article_id)
+        if entry is None:
+            return []
+        return list(zip(decode_postings(entry["lemmas"]), decode_varints(entry["counts"])))
+
+    def get_paragraph_lemmas(self, article_id: int, para_index: int) -> List[int]:
+        return decode_postings(self.articles[article_id]["paras"][para_index])
+
+    def get_cells(self, article_id: int, word_id: int) -> List[str]:
+        """The cells of the forms of a lemma used in an article, e.g., ["gen_pl", "nom_sg"]."""
+        return self.articles[article_id]["cells"].get(word_id, [])
+
+    def get_articles(self, word_id: int) -> List[Tuple[int, int]]:
+        """[(article_id, count)] of a lemma, by article id."""
+
+        postings = self.lemma_postings.get(word_id)
+        if postings is None:
+            return []
+        return list(zip(decode_postings(postings["articles"]), decode_varints(postings["counts"])))
+
+    def find_lemmas(self, bare: str) -> List[int]:
+        """The word ids of a bare lemma form, e.g., "автобус" -> [1234]."""
+        return sorted(word_id for word_id, (lemma_bare, _) in self.lemmas.items() if lemma_bare == bare)
+
+    def get_irregular_cells(self, article_id: int, irregular_cells: Dict[str, Set[str]]) -> Dict[int, List[str]]:
+        """The irregular cells an article uses, by word id.
+
+        :param irregular_cells: See `load_irregular_cells`.
+        """
+
+        article_irregular_cells = {}
+        for word_id, cells in self.articles[article_id]["cells"].items():
+            lemma_irregular_cells = irregular_cells.get(self.lemmas[word_id][1])
+            if not lemma_irregular_cells:
+                continue
+            used = [cell for cell in cells if cell in lemma_irregular_cells]
+            if used:
+                article_irregular_cells[word_id] = used
+        return article_irregular_cells
+
+    def _update_lemma_postings(self, word_id: int, changes: Dict[int, Optional[int]]):
+        """Set the counts of articles in the posting list of a lemma, removing those whose count is None.
+
+        :param changes: {article_id: count}
+        """
+
+        postings = dict(self.get_articles(word_id))
+        for article_id, count in changes.items():
+            if count is None:
+                postings.pop(article_id, None)
+            else:
+                postings[article_id] = count
+
+        if not postings:
+            self.lemma_postings.pop(word_id, None)
+            return
+        article_ids = sorted(postings)
+        self.lemma_postings[word_id] = {
+            "articles": encode_postings(article_ids),
+            "counts": encode_varints(postings[i] for i in article_ids),
+        }
+
+    def _apply_lemma_changes(self, lemma_changes: Dict[int, Dict[int, Optional[int]]]):
+        """Rewrite the posting list of each lemma once, with the changes of all articles.
+
+        :param lemma_changes: {word_id: {article_id: count}}, as collected by `add_article` and `remove_article`.
+        """
+
+        for word_id, changes in lemma_changes.items():
+            self._update_lemma_postings(word_id, changes)
+
+    def remove_article(self, article_id: int, lemma_changes: Optional[dict] = None):
+        """
+        :param lemma_changes: Collect the changes of the posting lists of the lemmas into it, to apply
+            later with `_apply_lemma_changes`, instead of applying them now.
+        """
+
+        changes = {} if lemma_changes is None else lemma_changes
+        for word_id, _ in self.get_lemmas(article_id):
+            changes.setdefault(word_id, {})[article_id] = None
+        self.articles.pop(article_id, None)
+        if lemma_changes is None:
+            self._apply_lemma_changes(changes)
+
+    def add_article(self, article: dict, lookup: Dict[str, List[Tuple[int, str]]], article_hash: Optional[str] = None, lemma_changes: Optional[dict] = None):
+        """Index an article, replacing its earlier version.
+
+        :param lookup: Resolves the tokens of the article (see `build_form_lookup`).
+        :param lemma_changes: See `remove_article`.
+        """
+
+        article_id = article["id"]
+        changes = {} if lemma_changes is None else lemma_changes
+        self.remove_article(article_id, lemma_changes=changes)
+
+        counts = {}
+        cells = {}
+        paras = [set() for _ in article["paras"]]
+        n_tokens = 0
+        n_unresolved = 0
+        for para_index, token in iter_article_tokens(article):
+            n_tokens += 1
+            word_cells = lookup.get(token)
+            if not word_cells:
+                n_unresolved += 1
+                continue
+
+            # A form of several lemmas (or cells) counts for each of them, as in the analyzers.
+            for word_id in {word_id for word_id, _ in word_cells}:
+                counts[word_id] = counts.get(word_id, 0) + 1
+                paras[para_index].add(word_id)
+            for word_id, cell in word_cells:
+                cells.setdefault(word_id, set()).add(cell)
+
+        word_ids = sorted(counts)
+        self.articles[article_id] = {
+            "hash": article_hash or get_article_hash(article),
+            "n_tokens": n_tokens,
+            "n_unresolved": n_unresolved,
+            "lemmas": encode_postings(word_ids),
+            "counts": encode_varints(counts[word_id] for word_id in word_ids),
+            "paras": [encode_postings(sorted(para)) for para in paras],
+            "cells": {word_id: sorted(cells[word_id]) for word_id in word_ids},
+        }
+        for word_id in word_ids:
+            changes.setdefault(word_id, {})[article_id] = counts[word_id]
+        if lemma_changes is None:
+            self._apply_lemma_changes(changes)
+
+    def is_up_to_date(self, articles: List[dict], resources_signature=None) -> bool:
+        """Whether `update_articles` would change nothing, which needs no resources to check."""
+
+        return (
+            resources_signature == self.resources_signature
+            and len(articles) == len(self.articles)
+            and all(
+                self.articles.get(article["id"], {}).get("hash") == get_article_hash(article)
+                for article in articles
+            )
+        )
+
+    def update_articles(self, articles: List[dict], words: List[dict], words_forms: List[dict], resources_signature=None) -> dict:
+        """Bring the index up to date with the articles of the upload JSON.
+
+        Only new and changed articles are resolved, and removed articles are dropped.
+
+        :param resources_signature: Of `words` and `words_forms` (e.g., their sizes and mtimes).
+            If it differs from that of the last update, every article is resolved again.
+        :return: {"added":, "updated":, "removed":, "unchanged":}
+        """
+
+        if resources_signature != self.resources_signature:
+            self.clear()
+            self.resources_signature = resources_signature
+
+        hashes = {article["id"]: get_article_hash(article) for article in articles}
+        changed = [
+            article
+            for article in articles
+            if self.articles.get(article["id"], {}).get("hash") != hashes[article["id"]]
+        ]
+        removed = [article_id for article_id in self.articles if article_id not in hashes]
+
+        if changed:
+            tokens = {
+                token
+                for article in changed
+                for _, token in iter_article_tokens(article)
+            }
+            lookup = build_form_lookup(tokens, words=words, words_forms=words_forms)
+
+            word_ids = {word_id for word_cells in lookup.values() for word_id, _ in word_cells}
+            for row in words:
+                if int(row["id"]) in word_ids:
+                    self.lemmas[int(row["id"])] = [row["bare"], supplement_accent_mark(row["accented"])]
+
+        # Rewriting the posting list of a lemma for each of its articles would be quadratic.
+        lemma_changes = {}
+        n_added = sum(article["id"] not in self.articles for article in changed)
+        for article in changed:
+            self.add_article(article, lookup=lookup, article_hash=hashes[article["id"]], lemma_changes=lemma_changes)
+        for article_id in removed:
+            self.remove_article(article_id, lemma_changes=lemma_changes)
+        self._apply_lemma_changes(lemma_changes)
+
+        # Keep the lemmas still used.
+        self.lemmas = {word_id: lemma for word_id, lemma in self.lemmas.items() if word_id in self.lemma_postings}
+
+        return {
+            "added": n_added,
+            "updated": len(changed) - n_added,
+            "removed": len(removed),
+            "unchanged": len(articles) - len(changed),
+        }
+
+    def to_dict(self) -> dict:
+
+        def b64(data: bytes) -> str:
+            return base64.b64encode(data).decode("ascii")
+
+        return {
+            "version": INDEX_VERSION,
+            "resources_signature": self.resources_signature,
+            "articles": {
+                article_id: {
+                    **entry,
+                    "lemmas": b64(entry["lemmas"]),
+                    "counts": b64(entry["counts"]),
+                    "paras": [b64(para) for para in entry["paras"]],
+                }
+                for article_id, entry in self.articles.items()
+            },
+            "lemma_postings": {
+                word_id: {key: b64(data) for key, data in postings.items()}
+                for word_id, postings in self.lemma_postings.items()
+            },
+            "lemmas": self.lemmas,
+        }
+
+    def save(self, fp: str):
+
+        # Write to a temporary file first, so that a concurrent reader never sees a partial index.
+        fp_tmp = f"{fp}.{os.getpid()}.tmp"
+        with open(fp_tmp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(fp_tmp, fp)
+
+    @classmethod
+    def load(cls, fp: str) -> "ArticleIndex":
+        """Load an index, or start an empty one if the file is missing or of another version."""
+
+        index = cls()
+        if not os.path.exists(fp):
+            return index
+        d = read_json(fp)
+        if d.get("version") != INDEX_VERSION:
+            return index
+
+        index.resources_signature = d["resources_signature"]
+        index.articles = {
+            int(article_id): {
+                **entry,
+                "lemmas": base64.b64decode(entry["lemmas"]),
+                "counts": base64.b64decode(entry["counts"]),
+                "paras": [base64.b64decode(para) for para in entry["paras"]],
+                "cells": {int(word_id): cells for word_id, cells in entry["cells"].items()},
+            }
+            for article_id, entry in d["articles"].items()
+        }
+        index.lemma_postings = {
+            int(word_id): {key: base64.b64decode(data) for key, data in postings.items()}
+            for word_id, postings in d["lemma_postings"].items()
+        }
+        index.lemmas = {int(word_id): lemma for word_id, lemma in d["lemmas"].items()}
+        return index
+
+
+def get_resources_signature(fps: List[str]) -> list:
+    signature = []
+    for fp in fps:
+        stat = os.stat(fp)
+        signature.append([os.path.basename(fp), stat.st_size, stat.st_mtime_ns])
+    return signature
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resources-dir", default="russian_word_analyses/resources")
+    parser.add_argument("--uploads-dir", default="uploads")
+    parser.add_argument("--index", default="russian_word_analyses/files/article_index.json")
+    parser.add_argument("--article", type=int, action="append", default=[], help="Print the lemmas of this article.")
+    parser.add_argument("--lemma", action="append", default=[], help="Print the articles of this bare lemma form.")
+    parser.add_argument("--analyses", action="append", default=[], help="With --article, print the irregular cells the article uses according to these analysis CSVs.")
+    args = parser.parse_args()
+
+    fp_words = os.path.join(args.resources_dir, "words.csv")
+    fp_words_forms = os.path.join(args.resources_dir, "words_forms.csv")
+
+    start = time.perf_counter()
+    index = ArticleIndex.load(args.index)
+    articles = read_json(os.path.join(args.uploads_dir, "articles.ru.json"))
+    signature = get_resources_signature([fp_words, fp_words_forms])
+    if index.is_up_to_date(articles, resources_signature=signature):
+        counts = {"unchanged": len(articles)}
+    else:
+        counts = index.update_articles(
+            articles,
+            words=read_csv(fp_words),
+            words_forms=read_csv(fp_words_forms),
+            resources_signature=signature,
+        )
+        index.save(args.index)
+    print(f"{args.index}: {len(index):,} articles, {len(index.lemma_postings):,} lemmas {counts} ({time.perf_counter() - start:.3f}s)")
+
+    irregular_cells = {}
+    for fp_analyses in args.analyses:
+        for accented, cells in load_irregular_cells(fp_analyses).items():
+            irregular_cells.setdefault(accented, set()).update(cells)
+
+    for article_id in args.article:
+        lemmas = index.get_lemmas(article_id)
+        print(f"Article {article_id}: {len(lemmas):,} lemmas")
+        for word_id, count in sorted(lemmas, key=lambda item: -item[1]):
+            bare, accented = index.lemmas[word_id]
+            print(f"    {accented:<24} {count:>4}  {', '.join(index.get_cells(article_id, word_id))}")
+        if irregular_cells:
+            for word_id, cells in index.get_irregular_cells(article_id, irregular_cells).items():
+                print(f"    irregular: {index.lemmas[word_id][1]} {', '.join(cells)}")
+
+    for bare in args.lemma:
+        for word_id in index.find_lemmas(bare):
+            postings = index.get_articles(word_id)
+            print(f"{index.lemmas[word_id][1]} ({word_id}): {len(postings):,} articles")
+            for article_id, count in postings:
+                print(f"    {article_id:>8} {count:>4}")
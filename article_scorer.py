@@ -0,0 +1,311 @@
+"""Score the uploaded articles by how many irregular forms and lemmas they contain.
+
+Instead of running the analyzers on the tokens of each article, the forms of the analysis outputs
+are looked up: a form lookup (see `FormLookup`) is built once from the noun and adjective analyses,
+where each cell has its tag bits (see `utils.get_bits_str_and_tags`) and each lemma its
+`irreg_decl`, ... columns, and from the verb info, where forms that differ from the rules are
+marked (see `analyze_verbs`). The articles are then streamed from the upload JSON (see
+`IO.iter_json`), and each token counts with the bits of the forms it matches. A form of several
+lemmas or cells (e.g., gen_sg and acc_pl) counts with the bits of any of them.
+
+The score of an article (or paragraph) is the weighted number of marked tokens per 100 tokens (see
+`SCORE_WEIGHTS`).
+
+Usage:
+
+    python article_scorer.py --uploads-dir uploads --files-dir russian_word_analyses/files \\
+        --output article_scores.csv --paragraphs-output paragraph_scores.csv
+"""
+
+import argparse
+import csv
+import glob
+import os
+import time
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from IO import iter_csv, iter_json, write_csv
+from article_index import iter_article_tokens
+from compression import open_file
+from utils import ACCENT_MARK
+
+
+TAGS_SUFFIX = "_tags"
+
+# Bits of the tokens.
+BIT_IRREGULAR = 1
+BIT_IRREGULAR_STRICT = 2
+BIT_ACCENT_CHANGE = 4
+BIT_MULTIPLE_VARIANTS = 8
+BIT_NAMES = {
+    BIT_IRREGULAR: "irregular",
+    BIT_IRREGULAR_STRICT: "Irregular",  # Not counting -а/-у in gen_sg and -у' in prep_sg of nouns.
+    BIT_ACCENT_CHANGE: "accent_change",
+    BIT_MULTIPLE_VARIANTS: "multiple_variants",
+}
+TAG_BITS = {
+    "i": BIT_IRREGULAR,
+    "I": BIT_IRREGULAR_STRICT,
+    "a": BIT_ACCENT_CHANGE,
+    "m": BIT_MULTIPLE_VARIANTS,
+}
+# Marks of the verb forms that differ from the rules (see `analyze_verbs`).
+VERB_FORM_MARKS = {
+    "(*) ": BIT_IRREGULAR | BIT_IRREGULAR_STRICT,
+    "(') ": BIT_ACCENT_CHANGE,
+}
+VERB_FORM_PREFIX = "ru_verb_"
+
+# Per marked token. A strictly irregular form is also irregular, so it weighs 3.
+SCORE_WEIGHTS = {
+    "irregular": 2.0,
+    "Irregular": 1.0,
+    "accent_change": 2.0,
+    "multiple_variants": 1.0,
+}
+
+# The lemma-level columns of `make_row`, listing the cells with the tag.
+LEMMA_TAG_COLUMNS = ["irreg_decl", "Irreg_decl"]
+
+NOUN_ANALYSES_FILE_NAME = "noun_analyses.csv"
+ADJECTIVE_ANALYSES_FILE_NAME = "adjective_analyses.csv"
+VERB_INFO_PATTERN = "verb_info.*.csv"
+
+
+def parse_bits(tags: str) -> int:
+    """E.g., "#i_a_, irreg_decl:0, accent_chg:0" -> BIT_IRREGULAR | BIT_ACCENT_CHANGE."""
+
+    if not tags.startswith("#"):
+        return 0
+    bits = 0
+    for bit in tags[1:].split(",", 1)[0]:
+        bits |= TAG_BITS.get(bit, 0)
+    return bits
+
+
+def split_variants(form: str) -> List[str]:
+    """E.g., "ба'гелами/багела'му" -> ["багелами", "багеламу"]."""
+    return [
+        variant.replace(ACCENT_MARK, "").strip().lower()
+        for variant in form.split("/")
+        if variant.strip()
+    ]
+
+
+class FormLookup:
+    """Bare form -> (bits of the form, ids of the irregular lemmas it is a form of)."""
+
+    def __init__(self):
+        self.forms = {}  # {form: [bits, (lemma_id, ...)]}
+        self.irregular_lemmas = []  # Lemmas with an irregular cell, by id.
+
+    def __len__(self) -> int:
+        return len(self.forms)
+
+    def add(self, form: str, bits: int, lemma_id: Optional[int]):
+
+        entry = self.forms.get(form)
+        if entry is None:
+            entry = self.forms[form] = [0, ()]
+        entry[0] |= bits
+        if lemma_id is not None and lemma_id not in entry[1]:
+            entry[1] += (lemma_id,)
+
+    def add_irregular_lemma(self, lemma: str) -> int:
+        self.irregular_lemmas.append(lemma)
+        return len(self.irregular_lemmas) - 1
+
+    def add_analyses(self, rows: Iterable[dict]):
+        """Add the forms of the noun or adjective analyses (see `analyze_nouns.make_row`)."""
+
+        cells = None
+        for row in rows:
+            if cells is None:
+                cells = [column[:-len(TAGS_SUFFIX)] for column in row if column.endswith(TAGS_SUFFIX)]
+
+            lemma_id = None
+            if any(row.get(column) for column in LEMMA_TAG_COLUMNS):
+                lemma_id = self.add_irregular_lemma(row["accented_form"])
+
+            self.add(row["bare_form"].lower(), 0, None)
+            for cell in cells:
+                bits = parse_bits(row[f"{cell}{TAGS_SUFFIX}"])
+                for form in split_variants(row[cell]):
+                    self.add(form, bits, lemma_id if bits & BIT_IRREGULAR else None)
+
+    def add_verb_info(self, rows: Iterable[dict]):
+        """Add the forms of the verb info. Only the forms that differ from the rules are listed."""
+
+        form_types = None
+        for row in rows:
+            if form_types is None:
+                form_types = [column for column in row if column.startswith(VERB_FORM_PREFIX)]
+
+            self.add(row["infinitive"].lower(), 0, None)
+            lemma_id = None
+            for form_type in form_types:
+                form = row[form_type]
+                for mark, bits in VERB_FORM_MARKS.items():
+                    if form.startswith(mark):
+                        break
+                else:
+                    continue
+
+                if lemma_id is None and bits & BIT_IRREGULAR:
+                    lemma_id = self.add_irregular_lemma(row["accented_infinitive"])
+                for variant in split_variants(form[len(mark):]):
+                    self.add(variant, bits, lemma_id if bits & BIT_IRREGULAR else None)
+
+    def get(self, token: str) -> Optional[list]:
+        return self.forms.get(token)
+
+
+def build_form_lookup(fp_nouns: Optional[str] = None, fp_adjectives: Optional[str] = None, fp_verb_info: Optional[str] = None) -> FormLookup:
+
+    lookup = FormLookup()
+    for fp in [fp_nouns, fp_adjectives]:
+        if fp is not None:
+            lookup.add_analyses(iter_csv(fp))
+    if fp_verb_info is not None:
+        lookup.add_verb_info(iter_csv(fp_verb_info))
+    return lookup
+
+
+class Score:
+    """The counts of the tokens of an article or a paragraph."""
+
+    def __init__(self):
+        self.n_tokens = 0
+        self.n_known = 0
+        self.counts = {name: 0 for name in BIT_NAMES.values()}
+        self.irregular_lemma_ids = set()
+
+    def add(self, token: str, lookup: FormLookup):
+
+        self.n_tokens += 1
+        entry = lookup.get(token)
+        if entry is None:
+            return
+
+        self.n_known += 1
+        bits, lemma_ids = entry
+        if bits:
+            for bit, name in BIT_NAMES.items():
+                if bits & bit:
+                    self.counts[name] += 1
+        self.irregular_lemma_ids.update(lemma_ids)
+
+    def get_score(self) -> float:
+        if self.n_tokens == 0:
+            return 0.0
+        return 100 * sum(SCORE_WEIGHTS[name] * count for name, count in self.counts.items()) / self.n_tokens
+
+    def to_row(self) -> dict:
+        return {
+            "n_tokens": self.n_tokens,
+            "n_known": self.n_known,
+            **{f"n_{name}": count for name, count in self.counts.items()},
+            "n_irregular_lemmas": len(self.irregular_lemma_ids),
+            "score": round(self.get_score(), 2),
+        }
+
+
+def score_articles(articles: Iterable[dict], lookup: FormLookup) -> Iterator[Tuple[dict, List[dict]]]:
+    """Yield (row of an article, rows of its paragraphs) for each article, as the articles are read."""
+
+    for article in articles:
+        article_score = Score()
+        para_scores = [Score() for _ in article["paras"]]
+        for para_index, token in iter_article_tokens(article):
+            article_score.add(token, lookup)
+            para_scores[para_index].add(token, lookup)
+
+        article_row = {
+            "article_id": article["id"],
+            "topic": article.get("topic", ""),
+            "n_paras": len(para_scores),
+            **article_score.to_row(),
+            "irregular_lemmas": "; ".join(sorted(
+                lookup.irregular_lemmas[lemma_id]
+                for lemma_id in article_score.irregular_lemma_ids
+            )),
+        }
+        para_rows = [
+            {
+                "article_id": article["id"],
+                "para_index": para_index,
+                **para_score.to_row(),
+            }
+            for para_index, para_score in enumerate(para_scores)
+        ]
+        yield article_row, para_rows
+
+
+def find_verb_info(files_dir: str) -> Optional[str]:
+    """The latest verb info in the directory (its name has the hash of the tokens, see `pipeline`)."""
+
+    fps = glob.glob(os.path.join(files_dir, VERB_INFO_PATTERN))
+    if not fps:
+        return None
+    return max(fps, key=os.path.getmtime)
+
+
+def main(fp_articles: str, fp_scores: str, lookup: FormLookup, fp_paragraph_scores: Optional[str] = None) -> int:
+    """Score the articles and write a row per article (and per paragraph), streaming.
+
+    :return: The number of articles.
+    """
+
+    f_paras = None
+    para_writer = None
+    n_articles = 0
+
+    def iter_article_rows():
+        nonlocal f_paras, para_writer, n_articles
+        for article_row, para_rows in score_articles(iter_json(fp_articles), lookup):
+            n_articles += 1
+            if fp_paragraph_scores is not None and para_rows:
+                if para_writer is None:
+                    f_paras = open_file(fp_paragraph_scores, "w", encoding="utf-8", newline="")
+                    para_writer = csv.DictWriter(f_paras, fieldnames=list(para_rows[0].keys()))
+                    para_writer.writeheader()
+                para_writer.writerows(para_rows)
+            yield article_row
+
+    try:
+        write_csv(fp_scores, iter_article_rows())
+    finally:
+        if f_paras is not None:
+            f_paras.close()
+
+    return n_articles
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads-dir", default="uploads")
+    parser.add_argument("--files-dir", default="russian_word_analyses/files", help="Where the analyses are.")
+    parser.add_argument("--verb-info", default=None, help=f"Defaults to the latest {VERB_INFO_PATTERN} in --files-dir.")
+    parser.add_argument("--output", default="article_scores.csv")
+    parser.add_argument("--paragraphs-output", default=None, help="Also write the scores of the paragraphs to this path.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    fp_nouns = os.path.join(args.files_dir, NOUN_ANALYSES_FILE_NAME)
+    fp_adjectives = os.path.join(args.files_dir, ADJECTIVE_ANALYSES_FILE_NAME)
+    lookup = build_form_lookup(
+        fp_nouns=fp_nouns if os.path.exists(fp_nouns) else None,
+        fp_adjectives=fp_adjectives if os.path.exists(fp_adjectives) else None,
+        fp_verb_info=args.verb_info or find_verb_info(args.files_dir),
+    )
+    print(f"Form lookup: {len(lookup):,} forms, {len(lookup.irregular_lemmas):,} irregular lemmas ({time.perf_counter() - start:.3f}s)")
+
+    start = time.perf_counter()
+    n_articles = main(
+        fp_articles=os.path.join(args.uploads_dir, "articles.ru.json"),
+        fp_scores=args.output,
+        lookup=lookup,
+        fp_paragraph_scores=args.paragraphs_output,
+    )
+    print(f"{args.output}: {n_articles:,} articles ({time.perf_counter() - start:.3f}s)")
@@ -0,0 +1,91 @@
+"""Benchmark the compressed I/O of `IO` (see `compression`).
+
+Each resource CSV of a synthetic dataset is written plain and with each compression through
+`IO.write_csv`, then read back through `IO.read_csv`, checking the rows are the same. The file
+sizes are what a cold-cache read has to fetch from storage. The fastest of `--repeat` runs is kept.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_compression --forms 200000 --workers 4
+"""
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+from typing import Optional
+
+from IO import read_csv, write_csv
+from benchmarks.generate_data import generate
+import compression
+
+
+EXTENSIONS = ["", ".gz", ".bz2", ".xz"]
+
+
+def best_of(repeat: int, f, *args, **kwargs) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        del result
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(args) -> int:
+
+    data_dir = args.data_dir
+    if data_dir is None:
+        data_dir = os.path.join(tempfile.gettempdir(), f"russian_analysis_bench.{args.forms}.{args.seed}")
+    if not os.path.exists(os.path.join(data_dir, "resources", "words.csv")):
+        print(f"Generating {args.forms:,} forms into {data_dir}")
+        generate(
+            data_dir=data_dir,
+            n_forms=args.forms,
+            seed=args.seed,
+        )
+
+    if args.workers is not None:
+        compression.DEFAULT_WORKERS = args.workers
+
+    print(f"{'file':<28} {'ext':<5} {'size_mb':>8} {'ratio':>6} {'write_s':>8} {'read_s':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for fp in sorted(glob.glob(os.path.join(data_dir, "resources", "*.csv"))):
+            rows = read_csv(fp)
+            name = os.path.basename(fp)
+
+            plain_size = None
+            for extension in EXTENSIONS:
+                fp_out = os.path.join(tmp_dir, f"{name}{extension}")
+                write_s = best_of(args.repeat, write_csv, fp_out, rows)
+                if read_csv(fp_out) != rows:
+                    raise AssertionError(f"{fp_out} gives different rows.")
+                read_s = best_of(args.repeat, read_csv, fp_out)
+
+                size = os.path.getsize(fp_out)
+                if plain_size is None:
+                    plain_size = size
+                print(
+                    f"{name:<28} {extension or '-':<5} {size / 1024 / 1024:>8.2f} {plain_size / size:>5.1f}x "
+                    f"{write_s:>8.3f} {read_s:>8.3f}"
+                )
+
+    return 0
+
+
+def parse_args(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", default=None, help="Dataset directory. Generated if it does not exist.")
+    parser.add_argument("--forms", type=int, default=100_000, help="Approximate number of rows in words_forms.csv.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=None, help="Compression threads. All CPUs by default.")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main(parse_args()))
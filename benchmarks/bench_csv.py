@@ -0,0 +1,110 @@
+"""Benchmark the CSV backends of `IO.read_csv` (see `fast_csv`).
+
+For each resource CSV of a synthetic dataset (and the analysis CSVs in `files/`, which have quoted
+fields), the mmap backend is checked to give the same rows as the csv backend, then both are timed
+along with the projected tuple and column readers. The fastest of `--repeat` runs is kept.
+
+Usage (from the repository root):
+
+    python -m benchmarks.bench_csv --forms 200000
+"""
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+from typing import Optional
+
+from IO import read_csv, read_csv_tuples, read_csv_columns, CSV_BACKEND_CSV, CSV_BACKEND_MMAP
+from benchmarks.generate_data import generate
+
+
+# The columns the analyzers use, for the projected readers.
+PROJECTIONS = {
+    "words_forms": ["word_id", "form_type", "position", "form", "_form_bare"],
+    "translations": ["word_id", "lang", "tl"],
+    "words": ["id", "bare", "accented", "type", "usage_en"],
+}
+
+
+def best_of(repeat: int, f, *args, **kwargs) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        del result  # Not timing the deallocation.
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_file(fp: str, repeat: int) -> dict:
+
+    name = os.path.splitext(os.path.basename(fp))[0]
+
+    rows = read_csv(fp, backend=CSV_BACKEND_CSV)
+    if read_csv(fp, backend=CSV_BACKEND_MMAP) != rows:
+        raise AssertionError(f"The mmap backend gives different rows for {fp}.")
+
+    columns = PROJECTIONS.get(name)
+    if columns is not None:
+        _, tuples = read_csv_tuples(fp, columns=columns)
+        if tuples != [tuple(row[column] for column in columns) for row in rows]:
+            raise AssertionError(f"The projected tuples differ for {fp}.")
+        del tuples
+
+    n_rows = len(rows)
+    del rows
+
+    result = {
+        "rows": n_rows,
+        "csv_s": best_of(repeat, read_csv, fp, backend=CSV_BACKEND_CSV),
+        "mmap_s": best_of(repeat, read_csv, fp, backend=CSV_BACKEND_MMAP),
+    }
+    if columns is not None:
+        result["tuples_s"] = best_of(repeat, read_csv_tuples, fp, columns=columns)
+        result["columns_s"] = best_of(repeat, read_csv_columns, fp, columns=columns)
+    return result
+
+
+def main(args) -> int:
+
+    data_dir = args.data_dir
+    if data_dir is None:
+        data_dir = os.path.join(tempfile.gettempdir(), f"russian_analysis_bench.{args.forms}.{args.seed}")
+    if not os.path.exists(os.path.join(data_dir, "resources", "words.csv")):
+        print(f"Generating {args.forms:,} forms into {data_dir}")
+        generate(
+            data_dir=data_dir,
+            n_forms=args.forms,
+            seed=args.seed,
+        )
+
+    fps = sorted(glob.glob(os.path.join(data_dir, "resources", "*.csv")))
+    fps += sorted(glob.glob(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "files", "*.csv")))
+
+    print(f"{'file':<36} {'rows':>10} {'csv_s':>8} {'mmap_s':>8} {'speedup':>8} {'tuples_s':>9} {'columns_s':>9}")
+    for fp in fps:
+        result = bench_file(fp, repeat=args.repeat)
+        print(
+            f"{os.path.basename(fp):<36} {result['rows']:>10,} "
+            f"{result['csv_s']:>8.3f} {result['mmap_s']:>8.3f} {result['csv_s'] / result['mmap_s']:>7.1f}x "
+            f"{result.get('tuples_s', float('nan')):>9.3f} {result.get('columns_s', float('nan')):>9.3f}"
+        )
+
+    return 0
+
+
+def parse_args(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", default=None, help="Dataset directory. Generated if it does not exist.")
+    parser.add_argument("--forms", type=int, default=100_000, help="Approximate number of rows in words_forms.csv.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main(parse_args()))
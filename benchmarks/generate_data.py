@@ -0,0 +1,410 @@
+"""Generate a synthetic, OpenRussian-shaped dataset for benchmarking.
+
+The layout mirrors the real resources:
+
+    {data_dir}/resources/words.csv
+    {data_dir}/resources/words_forms.csv
+    {data_dir}/resources/nouns.csv
+    {data_dir}/resources/adjectives.csv
+    {data_dir}/resources/verbs.csv
+    {data_dir}/resources/translations.csv
+    {data_dir}/uploads/words.ru.json
+    {data_dir}/uploads/articles.ru.json
+
+Lemmas are built from a fixed syllable inventory and declined/conjugated by the
+rule-based generators, with a small, seeded share of perturbed (irregular) forms,
+so the analyzers see a realistic mix of regular and irregular cells.
+The output only depends on `seed` and `n_forms`.
+
+Usage (from the repository root):
+
+    python -m benchmarks.generate_data --data-dir bench_data --forms 100000
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import random
+from typing import List
+
+from adjective_analyses.russian_adjective import RussianAdjective, RUSSIAN_ADJECTIVE_DECLENSION_TYPES
+from noun_analyses.russian_noun import RussianNoun, RUSSIAN_NOUN_DECLENSION_TYPES
+from russian_gender import RussianGender
+from utils import insert_accent_mark, RUSSIAN_VOWELS
+
+
+# Share of lemmas of each part of speech, roughly as in the OpenRussian dump.
+POS_MIX = (
+    ("noun", 0.45),
+    ("adjective", 0.20),
+    ("verb", 0.20),
+    ("adverb", 0.10),
+    ("other", 0.05),
+)
+
+FORMS_PER_LEMMA = {
+    "noun": len(RUSSIAN_NOUN_DECLENSION_TYPES),
+    "adjective": len(RUSSIAN_ADJECTIVE_DECLENSION_TYPES) + 2,  # acc_m and acc_pl have two variants.
+    "verb": 12,
+    "adverb": 0,
+    "other": 0,
+}
+
+IRREGULAR_RATE = 0.05
+VARIANT_RATE = 0.02
+REFLEXIVE_RATE = 0.10
+
+ONSETS = "бвгдзклмнпрстфхчшж"
+NUCLEI = "аоиеу"
+CODAS = "бвдзклмнпрстф"
+
+WORDS_FIELDS = ["id", "position", "bare", "accented", "derived_from_word_id", "rank", "disabled", "audio", "usage_en", "usage_de", "number_value", "type", "level", "created_at"]
+WORDS_FORMS_FIELDS = ["id", "word_id", "form_type", "position", "form", "_form_bare"]
+NOUNS_FIELDS = ["word_id", "gender", "partner", "animate", "indeclinable", "sg_only", "pl_only"]
+ADJECTIVES_FIELDS = ["word_id", "incomparable", "comparative", "superlative", "short_m", "short_f", "short_n", "short_pl"]
+VERBS_FIELDS = ["word_id", "aspect", "partner", "imperative_sg", "imperative_pl", "past_m", "past_f", "past_n", "past_pl"]
+TRANSLATIONS_FIELDS = ["id", "lang", "word_id", "position", "tl", "example_ru", "example_tl", "info"]
+
+VERB_FORM_TYPES = [
+    "ru_verb_presfut_sg1",
+    "ru_verb_presfut_sg2",
+    "ru_verb_presfut_sg3",
+    "ru_verb_presfut_pl1",
+    "ru_verb_presfut_pl2",
+    "ru_verb_presfut_pl3",
+    "ru_verb_imperative_sg",
+    "ru_verb_imperative_pl",
+    "ru_verb_past_m",
+    "ru_verb_past_f",
+    "ru_verb_past_n",
+    "ru_verb_past_pl",
+]
+VERB_ENDINGS = {
+    # conjugation: endings in the order of VERB_FORM_TYPES.
+    "е-conj": ["ю", "ешь", "ет", "ем", "ете", "ют", "й", "йте", "л", "ла", "ло", "ли"],
+    "и-conj": ["ю", "ишь", "ит", "им", "ите", "ят", "ь", "ьте", "л", "ла", "ло", "ли"],
+}
+
+
+def get_n_lemmas(n_forms: int) -> int:
+    forms_per_lemma = sum(
+        share * FORMS_PER_LEMMA[pos]
+        for pos, share in POS_MIX
+    )
+    return max(len(POS_MIX), math.ceil(n_forms / forms_per_lemma))
+
+
+def make_stem(index: int, n_syllables: int = 2) -> str:
+    """Map an index to a unique, pronounceable stem ending in a vowel."""
+
+    syllables = []
+    n = len(ONSETS) * len(NUCLEI)
+    while index > 0 or len(syllables) < n_syllables:
+        index, r = divmod(index, n)
+        syllables.append(ONSETS[r // len(NUCLEI)] + NUCLEI[r % len(NUCLEI)])
+    return "".join(reversed(syllables))
+
+
+def accent(bare: str, rnd: random.Random) -> str:
+    vowel_poss = [i for i, c in enumerate(bare) if c in RUSSIAN_VOWELS]
+    return insert_accent_mark(bare, rnd.choice(vowel_poss))
+
+
+def perturb(accented: str, rnd: random.Random) -> str:
+    """Turn a rule-based form into an irregular one: change the ending or move the accent."""
+
+    bare = accented.replace("'", "")
+    if rnd.random() < 0.5 and len(bare) > 3:
+        return accent(bare[:-1] + rnd.choice(NUCLEI), rnd)
+    return accent(bare, rnd)
+
+
+def split_variants(form: str) -> List[str]:
+    return [f for f in form.split("/") if f]
+
+
+def make_noun(index: int, rnd: random.Random):
+    gender = rnd.choice([RussianGender.M, RussianGender.M, RussianGender.F, RussianGender.N])
+    stem = make_stem(index) + rnd.choice(CODAS)
+    ending = rnd.choice({
+        RussianGender.M: ["", "", "", "ь"],
+        RussianGender.F: ["а", "а", "я", "ь"],
+        RussianGender.N: ["о", "о", "е"],
+    }[gender])
+    bare = stem + ending
+    accented = accent(bare, rnd)
+    is_animate = rnd.random() < 0.2
+
+    noun = RussianNoun(
+        accented=accented,
+        gender=gender,
+        is_animate=is_animate,
+    )
+    forms = {}
+    for decl_type in RUSSIAN_NOUN_DECLENSION_TYPES:
+        variants = split_variants(getattr(noun, decl_type))
+        if rnd.random() < IRREGULAR_RATE:
+            variants = [perturb(variants[0], rnd)]
+        if rnd.random() < VARIANT_RATE:
+            variants.append(perturb(variants[0], rnd))
+        case, number = decl_type.split("_")
+        forms[f"ru_noun_{number}_{case}"] = variants
+
+    meta = {
+        "gender": str(gender),
+        "partner": "",
+        "animate": str(int(is_animate)),
+        "indeclinable": "0",
+        "sg_only": "0",
+        "pl_only": "0",
+    }
+    return bare, accented, meta, forms
+
+
+def make_adjective(index: int, rnd: random.Random):
+    stem = make_stem(index) + rnd.choice("бвдзлмнпрст")
+    if rnd.random() < 0.15:
+        stem = stem[:-1] + "к"
+    ending = "ий" if stem[-1] in "гкх" else rnd.choice(["ый", "ый", "ый", "ий"])
+    bare = stem + ending
+    accented = accent(bare[:-2], rnd) + ending
+
+    adjective = RussianAdjective(accented=accented)
+    forms = {}
+    for decl_type in RUSSIAN_ADJECTIVE_DECLENSION_TYPES:
+        variants = split_variants(getattr(adjective, decl_type))
+        if rnd.random() < IRREGULAR_RATE:
+            variants = [perturb(variants[0], rnd)] + variants[1:]
+        if decl_type in ("comparative", "superlative") or decl_type.startswith("short_"):
+            form_type = f"ru_adj_{decl_type}"
+        else:
+            case, gender_or_pl = decl_type.split("_")
+            form_type = f"ru_adj_{gender_or_pl}_{case}"
+        forms[form_type] = variants
+
+    meta = {
+        "incomparable": "0",
+        "comparative": forms["ru_adj_comparative"][0],
+        "superlative": forms["ru_adj_superlative"][0],
+        "short_m": forms["ru_adj_short_m"][0],
+        "short_f": forms["ru_adj_short_f"][0],
+        "short_n": forms["ru_adj_short_n"][0],
+        "short_pl": forms["ru_adj_short_pl"][0],
+    }
+    return bare, accented, meta, forms
+
+
+def make_verb(stem: str, conjugation: str, accent_pos: int, is_reflexive: bool, rnd: random.Random):
+    """Conjugate a regular -ать (е-conj) or -ить (и-conj) verb. `stem` ends in the suffix vowel."""
+
+    bare = stem + "ть"
+    if is_reflexive:
+        bare += "ся"
+    accented = insert_accent_mark(bare, accent_pos)
+
+    forms = {}
+    for form_type, ending in zip(VERB_FORM_TYPES, VERB_ENDINGS[conjugation]):
+        form_stem = stem if conjugation == "е-conj" or form_type.startswith("ru_verb_past") else stem[:-1]
+        form = form_stem + ending
+        if form_type == "ru_verb_presfut_sg1" and conjugation == "и-conj" and form_stem[-1] in "бвпмф":
+            form = form_stem + "лю"
+        if is_reflexive:
+            form += "сь" if form[-1] in RUSSIAN_VOWELS else "ся"
+        form = insert_accent_mark(form, accent_pos)
+        if rnd.random() < IRREGULAR_RATE:
+            form = perturb(form, rnd)
+        forms[form_type] = [form]
+
+    return bare, accented, forms
+
+
+def generate(data_dir: str, n_forms: int = 10_000, n_tokens: int = None, seed: int = 0) -> dict:
+    """Generate the dataset.
+
+    :param data_dir: Output directory.
+    :param n_forms: Approximate number of rows in `words_forms.csv`.
+    :param n_tokens: Number of tokens in the uploads. Defaults to a tenth of `n_forms`.
+    :param seed: Random seed.
+    :return: Row counts of the generated files.
+    """
+
+    rnd = random.Random(seed)
+    n_lemmas = get_n_lemmas(n_forms)
+    if n_tokens is None:
+        n_tokens = max(100, n_forms // 10)
+
+    resources_dir = os.path.join(data_dir, "resources")
+    uploads_dir = os.path.join(data_dir, "uploads")
+    os.makedirs(resources_dir, exist_ok=True)
+    os.makedirs(uploads_dir, exist_ok=True)
+
+    counts = {name: 0 for name in ["words", "words_forms", "nouns", "adjectives", "verbs", "translations"]}
+    token_pool = []
+
+    files = {
+        name: open(os.path.join(resources_dir, f"{name}.csv"), "w", encoding="utf-8", newline="")
+        for name, fields in [
+            ("words", WORDS_FIELDS),
+            ("words_forms", WORDS_FORMS_FIELDS),
+            ("nouns", NOUNS_FIELDS),
+            ("adjectives", ADJECTIVES_FIELDS),
+            ("verbs", VERBS_FIELDS),
+            ("translations", TRANSLATIONS_FIELDS),
+        ]
+    }
+    writers = {
+        "words": csv.DictWriter(files["words"], fieldnames=WORDS_FIELDS),
+        "words_forms": csv.DictWriter(files["words_forms"], fieldnames=WORDS_FORMS_FIELDS),
+        "nouns": csv.DictWriter(files["nouns"], fieldnames=NOUNS_FIELDS),
+        "adjectives": csv.DictWriter(files["adjectives"], fieldnames=ADJECTIVES_FIELDS),
+        "verbs": csv.DictWriter(files["verbs"], fieldnames=VERBS_FIELDS),
+        "translations": csv.DictWriter(files["translations"], fieldnames=TRANSLATIONS_FIELDS),
+    }
+    for csv_writer in writers.values():
+        csv_writer.writeheader()
+
+    def write(name, row):
+        writers[name].writerow(row)
+        counts[name] += 1
+
+    def write_word(word_id, pos, bare, accented, forms):
+        write("words", {
+            "id": word_id, "position": word_id, "bare": bare, "accented": accented,
+            "derived_from_word_id": "", "rank": word_id, "disabled": "0", "audio": "",
+            "usage_en": "", "usage_de": "", "number_value": "", "type": pos,
+            "level": rnd.choice(["A1", "A2", "B1", "B2", "C1", "C2"]), "created_at": "",
+        })
+        for form_type, variants in forms.items():
+            for position, form in enumerate(variants, start=1):
+                write("words_forms", {
+                    "id": counts["words_forms"] + 1, "word_id": word_id, "form_type": form_type,
+                    "position": position, "form": form, "_form_bare": form.replace("'", ""),
+                })
+        # ~10% of the lemmas have no English translation.
+        n_en_translations = 0 if rnd.random() < 0.1 else rnd.randint(1, 2)
+        for position in range(1, n_en_translations + 1):
+            write("translations", {
+                "id": counts["translations"] + 1, "lang": "en", "word_id": word_id, "position": position,
+                "tl": f"{pos} {word_id}.{position}", "example_ru": "", "example_tl": "", "info": "",
+            })
+        write("translations", {
+            "id": counts["translations"] + 1, "lang": "de", "word_id": word_id, "position": 1,
+            "tl": f"{pos} {word_id}", "example_ru": "", "example_tl": "", "info": "",
+        })
+
+        token_pool.append(bare)
+        for variants in forms.values():
+            token_pool.append(variants[0].replace("'", ""))
+
+    pos_choices = [pos for pos, _ in POS_MIX]
+    pos_weights = [share for _, share in POS_MIX]
+
+    word_id = 0
+    stem_index = 0
+    while word_id < n_lemmas:
+        pos = rnd.choices(pos_choices, pos_weights)[0]
+        stem_index += 1
+
+        if pos == "noun":
+            word_id += 1
+            bare, accented, meta, forms = make_noun(stem_index, rnd)
+            write_word(word_id, pos, bare, accented, forms)
+            write("nouns", {"word_id": word_id, **meta})
+
+        elif pos == "adjective":
+            word_id += 1
+            bare, accented, meta, forms = make_adjective(stem_index, rnd)
+            write_word(word_id, pos, bare, accented, forms)
+            write("adjectives", {"word_id": word_id, **meta})
+
+        elif pos == "verb":
+            # Verbs mostly come in imperfective/perfective pairs: X and по + X.
+            conjugation = rnd.choice(["е-conj", "и-conj"])
+            stem = make_stem(stem_index) + rnd.choice(CODAS) + ("а" if conjugation == "е-conj" else "и")
+            vowel_poss = [i for i, c in enumerate(stem[:-1]) if c in RUSSIAN_VOWELS]
+            accent_pos = rnd.choice(vowel_poss)
+            is_reflexive = rnd.random() < REFLEXIVE_RATE
+            is_paired = rnd.random() < 0.7
+
+            ipfv_bare, ipfv_accented, ipfv_forms = make_verb(stem, conjugation, accent_pos, is_reflexive, rnd)
+            pfv_bare = "по" + ipfv_bare
+
+            word_id += 1
+            write_word(word_id, pos, ipfv_bare, ipfv_accented, ipfv_forms)
+            write("verbs", {
+                "word_id": word_id, "aspect": "imperfective", "partner": pfv_bare if is_paired else "",
+                "imperative_sg": ipfv_forms["ru_verb_imperative_sg"][0], "imperative_pl": ipfv_forms["ru_verb_imperative_pl"][0],
+                "past_m": ipfv_forms["ru_verb_past_m"][0], "past_f": ipfv_forms["ru_verb_past_f"][0],
+                "past_n": ipfv_forms["ru_verb_past_n"][0], "past_pl": ipfv_forms["ru_verb_past_pl"][0],
+            })
+
+            if is_paired and word_id < n_lemmas:
+                _, pfv_accented, pfv_forms = make_verb("по" + stem, conjugation, accent_pos + 2, is_reflexive, rnd)
+                word_id += 1
+                write_word(word_id, pos, pfv_bare, pfv_accented, pfv_forms)
+                write("verbs", {
+                    "word_id": word_id, "aspect": "perfective", "partner": ipfv_bare,
+                    "imperative_sg": pfv_forms["ru_verb_imperative_sg"][0], "imperative_pl": pfv_forms["ru_verb_imperative_pl"][0],
+                    "past_m": pfv_forms["ru_verb_past_m"][0], "past_f": pfv_forms["ru_verb_past_f"][0],
+                    "past_n": pfv_forms["ru_verb_past_n"][0], "past_pl": pfv_forms["ru_verb_past_pl"][0],
+                })
+
+        else:
+            word_id += 1
+            bare = make_stem(stem_index) + "о"
+            write_word(word_id, pos, bare, accent(bare, rnd), {})
+
+    for f in files.values():
+        f.close()
+
+    # Uploads: words are single tokens, articles are paragraphs of tokens.
+    # Tokens are drawn with a skewed distribution, as in real text.
+    def draw_token():
+        return token_pool[int(len(token_pool) * rnd.random() ** 2)]
+
+    n_word_tokens = n_tokens // 10
+    upload_words = [{"text": draw_token()} for _ in range(n_word_tokens)]
+
+    upload_articles = []
+    n_article_tokens = n_tokens - n_word_tokens
+    while n_article_tokens > 0:
+        paras = []
+        for _ in range(rnd.randint(1, 5)):
+            n = min(n_article_tokens, rnd.randint(5, 40))
+            n_article_tokens -= n
+            paras.append({"text": " ".join(draw_token() for _ in range(n)).capitalize() + "."})
+            if n_article_tokens <= 0:
+                break
+        upload_articles.append({
+            "id": len(upload_articles) + 1,
+            "topic": "Duolingo sentences" if rnd.random() < 0.5 else "Reading",
+            "paras": paras,
+        })
+
+    with open(os.path.join(uploads_dir, "words.ru.json"), "w", encoding="utf-8") as f:
+        json.dump(upload_words, f, ensure_ascii=False)
+    with open(os.path.join(uploads_dir, "articles.ru.json"), "w", encoding="utf-8") as f:
+        json.dump(upload_articles, f, ensure_ascii=False)
+
+    counts["tokens"] = n_tokens
+    counts["articles"] = len(upload_articles)
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", required=True)
+    parser.add_argument("--forms", type=int, default=10_000, help="Approximate number of rows in words_forms.csv.")
+    parser.add_argument("--tokens", type=int, default=None, help="Number of tokens in the uploads.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    counts = generate(
+        data_dir=args.data_dir,
+        n_forms=args.forms,
+        n_tokens=args.tokens,
+        seed=args.seed,
+    )
+    print(", ".join(f"#{name}: {count:,}" for name, count in counts.items()))
@@ -0,0 +1,113 @@
+"""Check that importing the library modules stays within a startup-time budget.
+
+Short-lived invocations (e.g., `python csv_index.py <word_id>`) are dominated by startup, so each
+module is imported in a fresh interpreter and the import time (excluding the interpreter's own
+startup) is compared against its budget. The fastest of `--repeat` runs is kept. Bytecode is
+written and warmed up first, so compiling is not counted.
+
+Besides the timing, which is machine-dependent (see `--scale`), heavy optional dependencies
+must not be imported at all (e.g., tqdm, which `progress.tqdm` imports on first use, or sqlite3,
+which `lemma_cache.LemmaCache` imports on first use).
+
+Usage (from the repository root):
+
+    python -m benchmarks.import_time
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Optional
+
+
+# Milliseconds.
+IMPORT_BUDGETS_MS = {
+    "utils": 2,
+    "noun_analyses.russian_noun": 10,
+    "adjective_analyses.russian_adjective": 10,
+    "IO": 20,
+    "analyze_nouns": 40,
+    "analyze_adjectives": 40,
+    "analyze_verbs": 40,
+}
+
+FORBIDDEN_MODULES = [
+    "tqdm",
+    # Only needed with --lemma-cache, when spilling sorts to disk, and with --track-memory.
+    "sqlite3",
+    "tempfile",
+    "tracemalloc",
+]
+
+CHILD_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({{
+    "elapsed_ms": elapsed_ms,
+    "forbidden": [module for module in {forbidden!r} if module in sys.modules],
+}}))
+"""
+
+
+def measure(module: str, repeat: int) -> dict:
+
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    code = CHILD_CODE.format(module=module, forbidden=FORBIDDEN_MODULES)
+    results = []
+    for _ in range(repeat + 1):  # The first run writes the bytecode.
+        completed = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=repo_dir,
+            env=env,
+            capture_output=True,
+            check=True,
+            encoding="utf-8",
+        )
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    return {
+        "elapsed_ms": min(result["elapsed_ms"] for result in results[1:]),
+        "forbidden": results[-1]["forbidden"],
+    }
+
+
+def main(args) -> int:
+
+    failures = []
+    print(f"{'module':<40} {'import_ms':>10} {'budget_ms':>10}")
+    for module, budget_ms in IMPORT_BUDGETS_MS.items():
+        budget_ms *= args.scale
+        result = measure(module, repeat=args.repeat)
+
+        flags = []
+        if result["elapsed_ms"] > budget_ms:
+            flags.append("OVER BUDGET")
+        if result["forbidden"]:
+            flags.append(f"imports {', '.join(result['forbidden'])}")
+        if flags:
+            failures.append(module)
+
+        print(f"{module:<40} {result['elapsed_ms']:>10.1f} {budget_ms:>10.1f}  {'; '.join(flags)}")
+
+    if failures:
+        print(f"{len(failures)} module(s) over budget or importing forbidden modules.")
+        return 1
+    return 0
+
+
+def parse_args(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the budgets, e.g., 2 on a slow machine.")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main(parse_args()))
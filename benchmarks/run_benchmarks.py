@@ -0,0 +1,310 @@
+"""Benchmark the analyzers on a synthetic dataset.
+
+Times each stage of the noun, adjective and verb analyzers (see `profiling.StageProfiler`)
+and the rule-based generators of `RussianNoun` and `RussianAdjective`.
+The verb generators are nested in `analyze_verbs.analyze_verbs()`, so they are covered
+by its "conjugate" stage.
+
+Each benchmark is repeated and the fastest run is kept. Timings are normalized per row
+and by a fixed calibration workload, so results of different runs (and machines) can be
+compared. With `--baseline`, a benchmark is flagged as a regression when its normalized
+time exceeds the baseline by more than `--threshold`, and the exit code is 1.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run_benchmarks --forms 100000 --output bench.json
+    python -m benchmarks.run_benchmarks --forms 100000 --baseline bench.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+
+import analyze_adjectives
+import analyze_nouns
+import analyze_verbs
+from IO import read_csv, read_tokens
+from adjective_analyses.russian_adjective import RussianAdjective, RUSSIAN_ADJECTIVE_DECLENSION_TYPES
+from benchmarks.generate_data import generate
+from noun_analyses.russian_noun import RussianNoun, RUSSIAN_NOUN_DECLENSION_TYPES
+from profiling import StageProfiler
+from utils import eval_boolean
+
+
+DEFAULT_THRESHOLD = 0.25
+
+
+def calibrate(n: int = 200_000) -> float:
+    """Time a fixed pure-Python workload (string and dict operations, like the analyzers)."""
+
+    best = None
+    for _ in range(5):
+        start = time.perf_counter()
+        d = {}
+        for i in range(n):
+            key = str(i)
+            d[key] = key[::-1] + "а"
+        sum(len(v) for v in d.values())
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+@contextlib.contextmanager
+def quiet():
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+            yield
+
+
+def load_data(data_dir: str, profiler: StageProfiler) -> dict:
+
+    with profiler.stage("read_tokens") as stage:
+        tokens = read_tokens(
+            fp_words=os.path.join(data_dir, "uploads", "words.ru.json"),
+            fp_articles=os.path.join(data_dir, "uploads", "articles.ru.json"),
+        )
+        stage["rows_out"] = len(tokens)
+
+    data = {"tokens": tokens}
+    for name in ["words", "words_forms", "nouns", "adjectives", "verbs", "translations"]:
+        with profiler.stage(f"read_csv.{name}") as stage:
+            data[name] = read_csv(fp=os.path.join(data_dir, "resources", f"{name}.csv"))
+            stage["rows_out"] = len(data[name])
+
+    return data
+
+
+def bench_generators(data: dict, profiler: StageProfiler):
+
+    nouns = {row["word_id"]: row for row in data["nouns"]}
+    adjectives = {row["word_id"]: row for row in data["adjectives"]}
+    noun_words = [row for row in data["words"] if row["id"] in nouns]
+    adjective_words = [row for row in data["words"] if row["id"] in adjectives]
+
+    with profiler.stage("RussianNoun", rows_in=len(noun_words)) as stage:
+        for row in noun_words:
+            meta = nouns[row["id"]]
+            russian_noun = RussianNoun(
+                accented=row["accented"],
+                gender=meta["gender"],
+                is_animate=eval_boolean(meta["animate"]),
+            )
+            for decl_type in RUSSIAN_NOUN_DECLENSION_TYPES:
+                getattr(russian_noun, decl_type)
+        stage["rows_out"] = len(noun_words) * len(RUSSIAN_NOUN_DECLENSION_TYPES)
+
+    with profiler.stage("RussianAdjective", rows_in=len(adjective_words)) as stage:
+        for row in adjective_words:
+            russian_adjective = RussianAdjective(accented=row["accented"])
+            for decl_type in RUSSIAN_ADJECTIVE_DECLENSION_TYPES:
+                getattr(russian_adjective, decl_type)
+        stage["rows_out"] = len(adjective_words) * len(RUSSIAN_ADJECTIVE_DECLENSION_TYPES)
+
+
+def run_nouns(data: dict, output_dir: str, profiler: StageProfiler):
+    analyze_nouns.main(
+        tokens=data["tokens"],
+        nouns=data["nouns"],
+        words=data["words"],
+        words_forms=data["words_forms"],
+        translations=data["translations"],
+        fp_analyses=os.path.join(output_dir, "noun_analyses.csv"),
+        profiler=profiler,
+    )
+
+
+def run_adjectives(data: dict, output_dir: str, profiler: StageProfiler):
+    analyze_adjectives.main(
+        tokens=data["tokens"],
+        adjectives=data["adjectives"],
+        words=data["words"],
+        words_forms=data["words_forms"],
+        translations=data["translations"],
+        fp_analyses=os.path.join(output_dir, "adjective_analyses.csv"),
+        profiler=profiler,
+    )
+
+
+def run_verbs(data: dict, output_dir: str, profiler: StageProfiler):
+    fp_token2inf_ids = os.path.join(output_dir, "token2inf_ids.txt")
+    if os.path.exists(fp_token2inf_ids):
+        os.remove(fp_token2inf_ids)  # Do not benchmark the cache.
+    analyze_verbs.analyze_verbs(
+        tokens=data["tokens"],
+        verbs=data["verbs"],
+        words=data["words"],
+        words_forms=data["words_forms"],
+        fp_token2inf_ids=fp_token2inf_ids,
+        fp_analyses=os.path.join(output_dir, "verb_info.csv"),
+        profiler=profiler,
+    )
+
+
+def run_generators(data: dict, output_dir: str, profiler: StageProfiler):
+    bench_generators(data, profiler)
+
+
+BENCHMARKS = {
+    "nouns": run_nouns,
+    "adjectives": run_adjectives,
+    "verbs": run_verbs,
+    "generators": run_generators,
+}
+
+
+def run_once(data: dict, output_dir: str) -> Dict[str, StageProfiler]:
+
+    profilers = {}
+    for name, run in BENCHMARKS.items():
+        profilers[name] = StageProfiler(name=name)
+        with quiet():
+            run(data, output_dir, profilers[name])
+
+    return profilers
+
+
+def collect(results: dict, profiler: StageProfiler):
+    """Keep the fastest run of each stage."""
+
+    for stage in profiler.stages:
+        key = f"{profiler.name}.{stage['name']}"
+        rows = stage["rows_in"] if stage["rows_in"] is not None else stage["rows_out"]
+        if key in results and results[key]["wall_s"] <= stage["wall_s"]:
+            continue
+        results[key] = {
+            "wall_s": stage["wall_s"],
+            "cpu_s": stage["cpu_s"],
+            "rows": rows,
+            "us_per_row": (
+                stage["wall_s"] / rows * 1e6
+                if rows
+                else None
+            ),
+        }
+
+
+def run_benchmarks(data_dir: str, n_forms: int, seed: int = 0, repeat: int = 3) -> dict:
+
+    if not os.path.exists(os.path.join(data_dir, "resources", "words.csv")):
+        print(f"Generating {n_forms:,} forms into {data_dir}")
+        generate(
+            data_dir=data_dir,
+            n_forms=n_forms,
+            seed=seed,
+        )
+
+    results = {}
+    with tempfile.TemporaryDirectory() as output_dir:
+        for _ in range(repeat):
+            load_profiler = StageProfiler(name="load")
+            with quiet():
+                data = load_data(data_dir, load_profiler)
+            collect(results, load_profiler)
+
+            for profiler in run_once(data, output_dir).values():
+                collect(results, profiler)
+
+    return {
+        "meta": {
+            "data_dir": data_dir,
+            "n_forms": len(data["words_forms"]),
+            "seed": seed,
+            "repeat": repeat,
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "calibration_s": calibrate(),
+        },
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """Compare per-row timings against a baseline report.
+
+    :return: [(benchmark, ratio)] of the benchmarks slower than the baseline by more than `threshold`.
+    """
+
+    scale = baseline["meta"]["calibration_s"] / report["meta"]["calibration_s"]
+
+    regressions = []
+    print(f"{'benchmark':<40} {'baseline us/row':>16} {'us/row':>12} {'ratio':>8}")
+    for key, result in report["results"].items():
+        base = baseline["results"].get(key)
+        if (
+            base is None
+            or not base["us_per_row"]
+            or not result["us_per_row"]
+        ):
+            continue
+
+        ratio = result["us_per_row"] * scale / base["us_per_row"]
+        flag = ""
+        if ratio > 1 + threshold:
+            regressions.append((key, ratio))
+            flag = "  REGRESSION"
+        print(f"{key:<40} {base['us_per_row']:>16.2f} {result['us_per_row']:>12.2f} {ratio:>8.2f}{flag}")
+
+    return regressions
+
+
+def print_report(report: dict):
+    print(f"{'benchmark':<40} {'wall_s':>10} {'rows':>12} {'us/row':>10}")
+    for key, result in report["results"].items():
+        print(
+            f"{key:<40} "
+            f"{result['wall_s']:>10.3f} "
+            f"{'' if result['rows'] is None else format(result['rows'], ','):>12} "
+            f"{'' if result['us_per_row'] is None else format(result['us_per_row'], '.2f'):>10}"
+        )
+
+
+def main(args) -> int:
+
+    data_dir = args.data_dir
+    if data_dir is None:
+        data_dir = os.path.join(tempfile.gettempdir(), f"russian_analysis_bench.{args.forms}.{args.seed}")
+
+    report = run_benchmarks(
+        data_dir=data_dir,
+        n_forms=args.forms,
+        seed=args.seed,
+        repeat=args.repeat,
+    )
+    print_report(report)
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, threshold=args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}.")
+            return 1
+
+    return 0
+
+
+def parse_args(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data-dir", default=None, help="Dataset directory. Generated if it does not exist.")
+    parser.add_argument("--forms", type=int, default=100_000, help="Approximate number of rows in words_forms.csv.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="Write the results as JSON to this path.")
+    parser.add_argument("--baseline", default=None, help="Compare against the results at this path.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown ratio, e.g., 0.25 for 25%%.")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main(parse_args()))
@@ -0,0 +1,238 @@
+"""Scaling-curve benchmark: wall time and peak RSS of each pipeline against the dataset size.
+
+For each size, a synthetic dataset is generated (see `benchmarks.generate_data`) and every
+pipeline (loading + one analyzer) runs in a fresh process, so the peak RSS of a size is not
+inflated by an earlier one. The growth exponent k of each stage is fitted by least squares
+on log(time) = k * log(n) + c, where n is the number of rows the stage consumed (or the
+dataset size for stages that do not report it). A stage whose exponent exceeds
+`--max-exponent` grows super-linearly and fails the run (exit code 1).
+
+Stages that take less than `--min-wall-s` at the largest size are reported but not checked,
+since their timings are dominated by noise.
+
+Usage (from the repository root):
+
+    python -m benchmarks.scaling --sizes 10000,20000,40000,80000 --output scaling.json
+"""
+
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from typing import List, Optional
+
+from benchmarks.generate_data import generate
+from benchmarks.run_benchmarks import BENCHMARKS, load_data, quiet
+from profiling import StageProfiler
+
+
+DEFAULT_SIZES = "10000,20000,40000,80000"
+DEFAULT_MAX_EXPONENT = 1.25
+DEFAULT_MIN_WALL_S = 0.1
+
+
+def get_peak_rss_mb() -> float:
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak_rss / 1024 / 1024  # Bytes.
+    return peak_rss / 1024  # Kilobytes.
+
+
+def run_pipeline(name: str, data_dir: str) -> dict:
+    """Run a pipeline in the current process. Meant to be called in a fresh process."""
+
+    load_profiler = StageProfiler(name="load")
+    profiler = StageProfiler(name=name)
+    with tempfile.TemporaryDirectory() as output_dir:
+        with quiet():
+            data = load_data(data_dir, load_profiler)
+            BENCHMARKS[name](data, output_dir, profiler)
+
+    stages = {
+        f"{p.name}.{stage['name']}": {
+            "wall_s": stage["wall_s"],
+            "rows": stage["rows_in"] if stage["rows_in"] is not None else stage["rows_out"],
+        }
+        for p in [load_profiler, profiler]
+        for stage in p.stages
+    }
+    stages[f"{name}.total"] = {
+        "wall_s": sum(stage["wall_s"] for stage in stages.values()),
+        "rows": None,
+    }
+
+    return {
+        "stages": stages,
+        "peak_rss_mb": get_peak_rss_mb(),
+    }
+
+
+def run_pipeline_in_subprocess(name: str, data_dir: str) -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.scaling", "--child", name, data_dir],
+        capture_output=True,
+        check=True,
+        encoding="utf-8",
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def fit_exponent(sizes: List[float], values: List[float]) -> Optional[float]:
+    """Least-squares slope of log(value) against log(size)."""
+
+    points = [
+        (math.log(size), math.log(value))
+        for size, value in zip(sizes, values)
+        if size > 0 and value > 0
+    ]
+    if len(points) < 2:
+        return None
+
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if var_x == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+
+
+def run_scaling(sizes: List[int], pipelines: List[str], data_root: str, seed: int = 0) -> dict:
+
+    measurements = {name: [] for name in pipelines}
+    for size in sizes:
+        data_dir = os.path.join(data_root, f"{size}.{seed}")
+        if not os.path.exists(os.path.join(data_dir, "resources", "words.csv")):
+            print(f"Generating {size:,} forms into {data_dir}")
+            generate(
+                data_dir=data_dir,
+                n_forms=size,
+                seed=seed,
+            )
+
+        for name in pipelines:
+            measurement = run_pipeline_in_subprocess(name, data_dir)
+            measurement["size"] = size
+            measurements[name].append(measurement)
+            print(
+                f"{name:<12} size={size:>12,} "
+                f"wall_s={measurement['stages'][f'{name}.total']['wall_s']:>10.3f} "
+                f"peak_rss_mb={measurement['peak_rss_mb']:>10.1f}"
+            )
+
+    return measurements
+
+
+def fit(measurements: dict, max_exponent: float, min_wall_s: float) -> dict:
+
+    fits = {}
+    for name, points in measurements.items():
+        sizes = [point["size"] for point in points]
+
+        for stage in points[-1]["stages"]:
+            wall_s = [point["stages"].get(stage, {}).get("wall_s", 0) for point in points]
+            rows = [point["stages"].get(stage, {}).get("rows") for point in points]
+            if None in rows or len(set(rows)) < 2:
+                rows = sizes
+            exponent = fit_exponent(rows, wall_s)
+            checked = wall_s[-1] >= min_wall_s
+            fits[stage] = {
+                "rows": rows,
+                "wall_s": wall_s,
+                "exponent": exponent,
+                "checked": checked,
+                "super_linear": (
+                    checked
+                    and exponent is not None
+                    and exponent > max_exponent
+                ),
+            }
+
+        peak_rss_mb = [point["peak_rss_mb"] for point in points]
+        fits[f"{name}.peak_rss"] = {
+            "peak_rss_mb": peak_rss_mb,
+            "exponent": fit_exponent(sizes, peak_rss_mb),
+            "checked": False,  # The interpreter's baseline RSS flattens the curve.
+            "super_linear": False,
+        }
+
+    return fits
+
+
+def print_fits(fits: dict, max_exponent: float):
+    print(f"{'stage':<40} {'exponent':>10}")
+    for stage, result in fits.items():
+        exponent = result["exponent"]
+        flag = ""
+        if result["super_linear"]:
+            flag = f"  SUPER-LINEAR (> {max_exponent})"
+        elif not result["checked"]:
+            flag = "  (not checked)"
+        print(f"{stage:<40} {'' if exponent is None else format(exponent, '.2f'):>10}{flag}")
+
+
+def main(args) -> int:
+
+    if args.child is not None:
+        name, data_dir = args.child
+        print(json.dumps(run_pipeline(name, data_dir)))
+        return 0
+
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    pipelines = args.pipelines.split(",")
+
+    data_root = args.data_root
+    if data_root is None:
+        data_root = os.path.join(tempfile.gettempdir(), "russian_analysis_scaling")
+
+    measurements = run_scaling(
+        sizes=sizes,
+        pipelines=pipelines,
+        data_root=data_root,
+        seed=args.seed,
+    )
+    fits = fit(
+        measurements,
+        max_exponent=args.max_exponent,
+        min_wall_s=args.min_wall_s,
+    )
+    print_fits(fits, max_exponent=args.max_exponent)
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "sizes": sizes,
+                    "measurements": measurements,
+                    "fits": fits,
+                },
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+    super_linear = [stage for stage, result in fits.items() if result["super_linear"]]
+    if super_linear:
+        print(f"Super-linear stages: {', '.join(super_linear)}")
+        return 1
+    return 0
+
+
+def parse_args(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated numbers of rows in words_forms.csv.")
+    parser.add_argument("--pipelines", default="nouns,adjectives,verbs", help=f"Comma-separated subset of {','.join(BENCHMARKS)}.")
+    parser.add_argument("--data-root", default=None, help="Directory for the generated datasets.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--max-exponent", type=float, default=DEFAULT_MAX_EXPONENT)
+    parser.add_argument("--min-wall-s", type=float, default=DEFAULT_MIN_WALL_S)
+    parser.add_argument("--output", default=None, help="Write the measurements and fits as JSON to this path.")
+    parser.add_argument("--child", nargs=2, default=None, metavar=("PIPELINE", "DATA_DIR"), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main(parse_args()))
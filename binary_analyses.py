@@ -0,0 +1,417 @@
+"""A compact binary format of the analysis CSVs, which can be mmapped instead of parsed.
+
+A CSV row of the noun analyses repeats the stem in every form and spells out the tags, e.g.,
+`ба'гела,,багелу',"#iIa_, irreg_decl:0, Irreg_decl:0, accent_chg:0",...`. In the binary format,
+each distinct string is stored once, in a string pool, and a row is a fixed-size record of:
+
+    a form (e.g., gen_sg)          (stem id, ending id, accent position), e.g., ("багел", "у", 5)
+    a tag (e.g., gen_sg_tags)      (bitmask of the tag bits, id of the rest of the tag), e.g., (0b10000111, ", irreg_decl:0, ...")
+    any other column               string id
+
+The stem of a form is its common prefix with the `bare_form` of the row. Forms that do not fit
+(e.g., several variants, "ба'гелами/багела'му") are kept whole as the ending, with no stem, and
+so are tags whose bits do not follow the layout of the rest of the file, so the conversion is
+lossless: `binary_to_csv` gives back the same rows, and the same bytes for a CSV written by
+`IO.write_csv`.
+
+Each field of the records is as narrow as its largest value in the file allows (uint8, uint16 or
+uint32). As the records are fixed-size, row i is at `rows_offset + i * record_size`. A key index (the row
+ids sorted by `bare_form`, or `accented_infinitive` for verbs) allows binary search by key.
+
+Layout (little-endian):
+
+    MAGIC, rows, string pool offsets (uint32 * (n_strings + 1)), string pool (UTF-8),
+    key index (uint32 * n_rows), footer (JSON), footer offset (uint64), MAGIC
+
+E.g.,
+
+    csv_to_binary("files/noun_analyses.csv", "files/noun_analyses.bin")
+    with AnalysisFile("files/noun_analyses.bin") as analyses:
+        analyses.find("багело")          # [row_id]
+        analyses.get_row(row_id)         # As read from the CSV.
+        analyses.get_tag_bits(row_id, "gen_sg")  # "iIa"
+
+Usage:
+
+    python binary_analyses.py to-binary files/noun_analyses.csv files/noun_analyses.bin
+    python binary_analyses.py to-csv files/noun_analyses.bin files/noun_analyses.csv
+"""
+
+import argparse
+import json
+import mmap
+import os
+import struct
+from array import array
+from itertools import chain
+from typing import Iterator, List
+
+from IO import iter_csv, write_csv
+from diff_analyses import KEY_COLUMNS, CELL_KIND_FORMS, CELL_KIND_TAGS, get_cell_kind
+from utils import ACCENT_MARK, get_accent_pos, insert_accent_mark
+
+
+MAGIC = b"RUAB"
+FORMAT_VERSION = 1
+
+STEM_COLUMN = "bare_form"
+
+# Number of record fields by column kind.
+N_FIELDS = {
+    CELL_KIND_FORMS: 3,  # Stem id, ending id, accent position.
+    CELL_KIND_TAGS: 2,   # Bitmask, id of the rest.
+}
+N_FIELDS_META = 1        # String id.
+
+# Each field takes the narrowest of these that fits its largest value in the file.
+FIELD_FORMATS = [(0xFF, "B"), (0xFFFF, "H"), (0xFFFFFFFF, "I")]
+
+NO_ACCENT = 0xFF
+WHOLE_FORM = 0xFE  # As the accent position: the ending id is the id of the whole form, and there is no stem.
+MAX_TAG_BITS = 7
+TAG_PRESENT = 0x80  # The tag starts with "#" and the bits. If unset, the rest is the whole tag.
+NO_BIT = "_"
+
+FOOTER_SIZE = struct.Struct("<Q")
+
+
+class StringPool:
+    """Distinct strings by id, "" being 0."""
+
+    def __init__(self):
+        self.ids = {"": 0}
+        self.strings = [""]
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def add(self, s: str) -> int:
+        string_id = self.ids.get(s)
+        if string_id is None:
+            string_id = self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return string_id
+
+
+class RowEncoder:
+    """Encode the rows of an analysis CSV into records, adding their strings to a pool."""
+
+    def __init__(self, fieldnames: List[str], pool: StringPool):
+
+        self.fieldnames = fieldnames
+        self.kinds = [get_cell_kind(column, fieldnames)[1] for column in fieldnames]
+        self.pool = pool
+        self.has_stems = STEM_COLUMN in fieldnames
+
+        # The letter of each position of the tag bits (e.g., "iIam" for nouns), learnt from the tags.
+        self.tag_template = None
+
+    def encode_form(self, form: str, bare_form: str) -> tuple:
+
+        accent_pos = get_accent_pos(form)
+        if (
+            not self.has_stems
+            or "/" in form
+            or form.count(ACCENT_MARK) > 1
+            or (accent_pos is not None and not 0 <= accent_pos < WHOLE_FORM)
+        ):
+            return 0, self.pool.add(form), WHOLE_FORM
+
+        bare = form.replace(ACCENT_MARK, "")
+        n = len(os.path.commonprefix([bare, bare_form]))
+        return (
+            self.pool.add(bare[:n]),
+            self.pool.add(bare[n:]),
+            NO_ACCENT if accent_pos is None else accent_pos,
+        )
+
+    def encode_tags(self, tags: str) -> tuple:
+
+        if tags.startswith("#"):
+            bits = tags[1:].split(",", 1)[0]
+            if self.tag_template is None and 0 < len(bits) <= MAX_TAG_BITS:
+                self.tag_template = [NO_BIT] * len(bits)
+
+            if self.tag_template is not None and len(bits) == len(self.tag_template):
+                mask = TAG_PRESENT
+                for i, bit in enumerate(bits):
+                    if bit == NO_BIT:
+                        continue
+                    if self.tag_template[i] == NO_BIT and bit not in self.tag_template:
+                        self.tag_template[i] = bit
+                    if self.tag_template[i] != bit:
+                        break
+                    mask |= 1 << i
+                else:
+                    return mask, self.pool.add(tags[1 + len(bits):])
+
+        return 0, self.pool.add(tags)
+
+    def encode(self, row: dict) -> list:
+
+        bare_form = row.get(STEM_COLUMN, "")
+        fields = []
+        for column, kind in zip(self.fieldnames, self.kinds):
+            value = row[column]
+            if kind == CELL_KIND_FORMS:
+                fields.extend(self.encode_form(value, bare_form))
+            elif kind == CELL_KIND_TAGS:
+                fields.extend(self.encode_tags(value))
+            else:
+                fields.append(self.pool.add(value))
+        return fields
+
+
+def csv_to_binary(fp_csv: str, fp_bin: str) -> dict:
+    """Convert an analysis CSV (e.g., files/noun_analyses.csv) to the binary format.
+
+    The CSV is streamed. The string pool and the fields of the rows (as uint32) are held in memory,
+    until the width of each field is known.
+
+    :return: {"n_rows":, "n_strings":, "csv_size":, "bin_size":}
+    """
+
+    rows = iter_csv(fp_csv)
+    first_row = next(rows, None)
+    if first_row is None:
+        raise ValueError(f"{fp_csv} has no rows.")
+
+    fieldnames = list(first_row.keys())
+    key_column = next((column for column in KEY_COLUMNS if column in fieldnames), fieldnames[0])
+    pool = StringPool()
+    encoder = RowEncoder(fieldnames, pool)
+    key_ids = array("I")
+    fields = array("I")
+    for row in chain([first_row], rows):
+        fields.extend(encoder.encode(row))
+        key_ids.append(pool.add(row[key_column]))
+
+    n_rows = len(key_ids)
+    n_fields = len(fields) // n_rows
+    record = struct.Struct("<" + "".join(
+        next(code for max_value, code in FIELD_FORMATS if max(fields[i::n_fields]) <= max_value)
+        for i in range(n_fields)
+    ))
+
+    fp_tmp = f"{fp_bin}.{os.getpid()}.tmp"
+    with open(fp_tmp, "wb") as f:
+        f.write(MAGIC)
+
+        rows_offset = f.tell()
+        for start in range(0, len(fields), n_fields):
+            f.write(record.pack(*fields[start:start + n_fields]))
+
+        encoded = [s.encode("utf-8") for s in pool.strings]
+        pool_offsets = array("I", [0])
+        for s in encoded:
+            pool_offsets.append(pool_offsets[-1] + len(s))
+
+        pool_offsets_offset = f.tell()
+        f.write(pool_offsets.tobytes())
+        pool_offset = f.tell()
+        f.write(b"".join(encoded))
+
+        key_index = array("I", sorted(range(n_rows), key=lambda row_id: (pool.strings[key_ids[row_id]], row_id)))
+        key_index_offset = f.tell()
+        f.write(key_index.tobytes())
+
+        footer = {
+            "version": FORMAT_VERSION,
+            "columns": [[column, kind] for column, kind in zip(fieldnames, encoder.kinds)],
+            "record_format": record.format,
+            "tag_template": "".join(encoder.tag_template or []),
+            "key_column": key_column,
+            "n_rows": n_rows,
+            "n_strings": len(pool),
+            "rows_offset": rows_offset,
+            "pool_offsets_offset": pool_offsets_offset,
+            "pool_offset": pool_offset,
+            "key_index_offset": key_index_offset,
+        }
+        footer_offset = f.tell()
+        f.write(json.dumps(footer, ensure_ascii=False).encode("utf-8"))
+        f.write(FOOTER_SIZE.pack(footer_offset))
+        f.write(MAGIC)
+    os.replace(fp_tmp, fp_bin)
+
+    return {
+        "n_rows": n_rows,
+        "n_strings": len(pool),
+        "csv_size": os.path.getsize(fp_csv),
+        "bin_size": os.path.getsize(fp_bin),
+    }
+
+
+class AnalysisFile:
+    """Random access to the rows of a binary analysis file, through mmap."""
+
+    def __init__(self, fp: str):
+
+        self.fp = fp
+        self._f = open(fp, "rb")
+        try:
+            self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self._f.close()
+            raise
+
+        tail = len(MAGIC) + FOOTER_SIZE.size
+        if self._mm[:len(MAGIC)] != MAGIC or self._mm[-len(MAGIC):] != MAGIC:
+            self.close()
+            raise ValueError(f"{fp} is not a binary analysis file.")
+        footer_offset, = FOOTER_SIZE.unpack_from(self._mm, len(self._mm) - tail)
+        footer = json.loads(self._mm[footer_offset:len(self._mm) - tail].decode("utf-8"))
+        if footer["version"] != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"{fp} has format version {footer['version']}, expected {FORMAT_VERSION}.")
+
+        self.footer = footer
+        self.fieldnames = [column for column, _ in footer["columns"]]
+        self.kinds = [kind for _, kind in footer["columns"]]
+        self.cells = [column for column, kind in footer["columns"] if kind == CELL_KIND_FORMS]
+        self.key_column = footer["key_column"]
+        self.tag_template = footer["tag_template"]
+        self.record = struct.Struct(footer["record_format"])
+        self.n_rows = footer["n_rows"]
+
+        # Field position of each column in the record.
+        self._positions = {}
+        position = 0
+        for column, kind in zip(self.fieldnames, self.kinds):
+            self._positions[column] = position
+            position += N_FIELDS.get(kind, N_FIELDS_META)
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._mm.close()
+        self._f.close()
+
+    def get_string(self, string_id: int) -> str:
+        start, end = struct.unpack_from("<II", self._mm, self.footer["pool_offsets_offset"] + 4 * string_id)
+        offset = self.footer["pool_offset"]
+        return self._mm[offset + start:offset + end].decode("utf-8")
+
+    def get_fields(self, row_id: int) -> tuple:
+        if not 0 <= row_id < self.n_rows:
+            raise IndexError(f"Row {row_id} out of range [0, {self.n_rows}).")
+        return self.record.unpack_from(self._mm, self.footer["rows_offset"] + row_id * self.record.size)
+
+    def decode_tag_bits(self, mask: int) -> str:
+        return "".join(
+            bit if mask & (1 << i) else NO_BIT
+            for i, bit in enumerate(self.tag_template)
+        )
+
+    def get_row(self, row_id: int) -> dict:
+        """The row as read from the CSV."""
+
+        fields = self.get_fields(row_id)
+        row = {}
+        position = 0
+        for column, kind in zip(self.fieldnames, self.kinds):
+            if kind == CELL_KIND_FORMS:
+                stem_id, ending_id, accent_pos = fields[position:position + 3]
+                if accent_pos == WHOLE_FORM:
+                    row[column] = self.get_string(ending_id)
+                else:
+                    row[column] = insert_accent_mark(
+                        self.get_string(stem_id) + self.get_string(ending_id),
+                        None if accent_pos == NO_ACCENT else accent_pos,
+                    )
+                position += 3
+            elif kind == CELL_KIND_TAGS:
+                mask, rest_id = fields[position:position + 2]
+                if mask & TAG_PRESENT:
+                    row[column] = f"#{self.decode_tag_bits(mask)}{self.get_string(rest_id)}"
+                else:
+                    row[column] = self.get_string(rest_id)
+                position += 2
+            else:
+                row[column] = self.get_string(fields[position])
+                position += 1
+        return row
+
+    def iter_rows(self) -> Iterator[dict]:
+        for row_id in range(self.n_rows):
+            yield self.get_row(row_id)
+
+    def get_tag_bits(self, row_id: int, cell: str) -> str:
+        """The tag bits of a cell without decoding the row, e.g., "iIa" (see `utils.get_bits_str_and_tags`)."""
+
+        mask, rest_id = self.get_fields(row_id)[self._positions[f"{cell}_tags"]:][:2]
+        if mask & TAG_PRESENT:
+            return self.decode_tag_bits(mask).replace(NO_BIT, "")
+        # Tags not following the layout are kept whole.
+        tags = self.get_string(rest_id)
+        if not tags.startswith("#"):
+            return ""
+        return tags[1:].split(",", 1)[0].replace(NO_BIT, "")
+
+    def get_key(self, index: int) -> str:
+        """The key of the index-th row in the key order."""
+
+        row_id, = struct.unpack_from("<I", self._mm, self.footer["key_index_offset"] + 4 * index)
+        return self.get_string(self.get_fields(row_id)[self._positions[self.key_column]])
+
+    def find(self, key: str) -> List[int]:
+        """The ids of the rows of a key (e.g., a bare form), by binary search in the key index."""
+
+        lo, hi = 0, self.n_rows
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.get_key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        row_ids = []
+        offset = self.footer["key_index_offset"]
+        while lo < self.n_rows and self.get_key(lo) == key:
+            row_ids.append(struct.unpack_from("<I", self._mm, offset + 4 * lo)[0])
+            lo += 1
+        return row_ids
+
+
+def binary_to_csv(fp_bin: str, fp_csv: str) -> int:
+    """Convert a binary analysis file back to the CSV it was made from.
+
+    :return: The number of rows.
+    """
+
+    with AnalysisFile(fp_bin) as analyses:
+        write_csv(fp_csv, analyses.iter_rows())
+        return len(analyses)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_to_binary = subparsers.add_parser("to-binary", help="Convert an analysis CSV to the binary format.")
+    parser_to_binary.add_argument("fp_csv")
+    parser_to_binary.add_argument("fp_bin")
+
+    parser_to_csv = subparsers.add_parser("to-csv", help="Convert a binary analysis file back to CSV.")
+    parser_to_csv.add_argument("fp_bin")
+    parser_to_csv.add_argument("fp_csv")
+
+    args = parser.parse_args()
+
+    if args.command == "to-binary":
+        stats = csv_to_binary(args.fp_csv, args.fp_bin)
+        print(
+            f"{args.fp_bin}: {stats['n_rows']:,} rows, {stats['n_strings']:,} strings, "
+            f"{stats['bin_size']:,} bytes ({stats['bin_size'] / max(stats['csv_size'], 1):.0%} of the CSV)"
+        )
+    else:
+        n_rows = binary_to_csv(args.fp_bin, args.fp_csv)
+        print(f"{args.fp_csv}: {n_rows:,} rows")
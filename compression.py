@@ -0,0 +1,277 @@
+"""Transparent .gz, .bz2 and .xz compression for the files read and written by `IO`.
+
+`open_file` is a drop-in replacement of `open` that picks the compression by the file extension:
+
+    with open_file("resources/words_forms.csv.gz", "r", encoding="utf-8") as f:
+        ...  # Decompressed as it is read, without a temporary file.
+
+A path without the extension also resolves to its compressed version when only that exists, so
+the dumps can be compressed in place (e.g., `gzip resources/*.csv`) without changing any path.
+
+Reads are streamed: a background thread reads the compressed file a chunk ahead of the
+decompression (see `ReadaheadReader`), which hides the latency of cold-cache and network-mounted
+storage. Writes are split into chunks that are compressed in parallel by a thread pool (zlib, bz2
+and lzma release the GIL) and written in order as independent members, which the three formats
+allow to be concatenated (see `ParallelCompressedWriter`). The compression modules are imported
+on first use.
+"""
+
+import io
+import os
+import threading
+from collections import deque
+from typing import Optional
+
+
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_BZ2 = "bz2"
+COMPRESSION_XZ = "xz"
+
+EXTENSIONS = {
+    ".gz": COMPRESSION_GZIP,
+    ".bz2": COMPRESSION_BZ2,
+    ".xz": COMPRESSION_XZ,
+}
+
+# gzip and xz are faster than at their maximum levels, at a slightly lower ratio.
+COMPRESSION_LEVELS = {
+    COMPRESSION_GZIP: 6,
+    COMPRESSION_BZ2: 9,
+    COMPRESSION_XZ: 6,
+}
+
+# Large enough for the members to compress about as well as one stream.
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+READ_CHUNK_SIZE = 1024 * 1024
+READAHEAD_CHUNKS = 4
+# Compression threads. All CPUs if None.
+DEFAULT_WORKERS = None
+
+
+def get_compression(fp: str) -> Optional[str]:
+    """E.g., "words.csv.gz" -> "gzip", "words.csv" -> None."""
+    return EXTENSIONS.get(os.path.splitext(fp)[1].lower())
+
+
+def resolve_path(fp: str) -> str:
+    """The path itself if it exists, else its compressed version if exactly that exists."""
+
+    if os.path.exists(fp) or get_compression(fp) is not None:
+        return fp
+
+    for extension in EXTENSIONS:
+        if os.path.exists(f"{fp}{extension}"):
+            return f"{fp}{extension}"
+    return fp
+
+
+def compress_chunk(data: bytes, compression: str, level: Optional[int] = None) -> bytes:
+    """Compress a chunk into a complete gzip member, bz2 stream or xz stream."""
+
+    if level is None:
+        level = COMPRESSION_LEVELS[compression]
+
+    if compression == COMPRESSION_GZIP:
+        import gzip
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if compression == COMPRESSION_BZ2:
+        import bz2
+        return bz2.compress(data, compresslevel=level)
+    if compression == COMPRESSION_XZ:
+        import lzma
+        return lzma.compress(data, format=lzma.FORMAT_XZ, preset=level)
+    raise ValueError(f"Unknown compression {compression!r}. Expected one of {list(EXTENSIONS.values())}.")
+
+
+class ReadaheadReader(io.RawIOBase):
+    """Read a file in a background thread, up to `depth` chunks ahead of the reader."""
+
+    def __init__(self, fp: str, chunk_size: int = READ_CHUNK_SIZE, depth: int = READAHEAD_CHUNKS):
+
+        import queue
+
+        self._f = open(fp, "rb", buffering=0)
+        self._chunk_size = chunk_size
+        self._queue = queue.Queue(maxsize=depth)
+        self._queue_full = queue.Full
+        self._stopped = threading.Event()
+
+        self._chunk = memoryview(b"")
+        self._pos = 0
+        self._eof = False
+
+        self._thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except self._queue_full:
+                continue
+        return False
+
+    def _read_ahead(self):
+        try:
+            while True:
+                chunk = self._f.read(self._chunk_size)
+                if not self._put(chunk) or not chunk:  # b"" marks the end.
+                    return
+        except BaseException as e:
+            self._put(e)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+
+        if self._pos >= len(self._chunk):
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, BaseException):
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._chunk, self._pos = memoryview(item), 0
+
+        n = min(len(b), len(self._chunk) - self._pos)
+        b[:n] = self._chunk[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stopped.set()
+            self._thread.join()
+            self._f.close()
+        super().close()
+
+
+class DecompressedReader(io.RawIOBase):
+    """The decompressed stream of a compressed file, which also closes the file when closed."""
+
+    def __init__(self, fp: str, compression: str):
+
+        self._raw = ReadaheadReader(fp)
+        try:
+            if compression == COMPRESSION_GZIP:
+                import gzip
+                self._f = gzip.GzipFile(fileobj=self._raw, mode="rb")
+            elif compression == COMPRESSION_BZ2:
+                import bz2
+                self._f = bz2.BZ2File(self._raw, mode="rb")
+            elif compression == COMPRESSION_XZ:
+                import lzma
+                self._f = lzma.LZMAFile(self._raw, mode="rb")
+            else:
+                raise ValueError(f"Unknown compression {compression!r}. Expected one of {list(EXTENSIONS.values())}.")
+        except BaseException:
+            self._raw.close()
+            raise
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        return self._f.readinto(b)
+
+    def close(self):
+        if not self.closed:
+            try:
+                self._f.close()
+            finally:
+                self._raw.close()
+        super().close()
+
+
+class ParallelCompressedWriter(io.RawIOBase):
+    """Compress what is written in chunks, in parallel, and write them to the file in order.
+
+    At most `2 * workers` chunks are held in memory at a time.
+    """
+
+    def __init__(self, fp: str, compression: str, mode: str = "w", level: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE, workers: Optional[int] = None):
+        """
+        :param mode: "w", "a" (appends new members) or "x".
+        :param workers: Compression threads. `DEFAULT_WORKERS` by default, 1 to compress in the writing thread.
+        """
+
+        if workers is None:
+            workers = DEFAULT_WORKERS or os.cpu_count() or 1
+
+        self.compression = compression
+        self.level = level
+        self.chunk_size = chunk_size
+        self.workers = workers
+
+        self._f = open(fp, f"{mode}b")
+        self._buffer = bytearray()
+        self._pending = deque()
+
+        self._executor = None
+        if workers > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+
+        self._buffer += b
+        while len(self._buffer) >= self.chunk_size:
+            chunk = bytes(self._buffer[:self.chunk_size])
+            del self._buffer[:self.chunk_size]
+            self._submit(chunk)
+        return len(b)
+
+    def _submit(self, chunk: bytes):
+
+        if self._executor is None:
+            self._f.write(compress_chunk(chunk, self.compression, self.level))
+            return
+
+        self._pending.append(self._executor.submit(compress_chunk, chunk, self.compression, self.level))
+        while len(self._pending) >= 2 * self.workers:
+            self._f.write(self._pending.popleft().result())
+
+    def close(self):
+        if not self.closed:
+            try:
+                if self._buffer or (self._f.tell() == 0 and not self._pending):  # An empty file is still a valid archive.
+                    self._submit(bytes(self._buffer))
+                    self._buffer = bytearray()
+                while self._pending:
+                    self._f.write(self._pending.popleft().result())
+            finally:
+                if self._executor is not None:
+                    self._executor.shutdown()
+                self._f.close()
+        super().close()
+
+
+def open_file(fp: str, mode: str = "r", encoding: Optional[str] = None, newline: Optional[str] = None, **kwargs):
+    """Like `open`, but (de)compresses .gz, .bz2 and .xz files.
+
+    :param mode: "r", "w", "a" or "x", with "b" for bytes and "t" (the default) for text.
+    :param kwargs: For writing compressed files, see `ParallelCompressedWriter`.
+    """
+
+    if "r" in mode:
+        fp = resolve_path(fp)
+
+    compression = get_compression(fp)
+    if compression is None:
+        return open(fp, mode, buffering=READ_CHUNK_SIZE if "r" in mode else -1, encoding=encoding, newline=newline)
+
+    if "r" in mode:
+        f = io.BufferedReader(DecompressedReader(fp, compression), buffer_size=READ_CHUNK_SIZE)
+    else:
+        f = io.BufferedWriter(ParallelCompressedWriter(fp, compression, mode=mode.replace("b", "").replace("t", ""), **kwargs), buffer_size=READ_CHUNK_SIZE)
+
+    if "b" in mode:
+        return f
+    return io.TextIOWrapper(f, encoding=encoding, newline=newline)
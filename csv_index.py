@@ -0,0 +1,291 @@
+"""Sidecar byte-offset indexes for random access into the resource dumps.
+
+For one-off lookups of a few lemmas, parsing the whole `words_forms.csv` is wasteful. An index
+records, for each key (e.g., `word_id`), the byte spans of its rows in the CSV. It is saved next to
+the CSV (e.g., `words_forms.csv.word_id.idx.json`) together with the size and mtime of the CSV,
+and is rebuilt automatically when they change. Lookups mmap the CSV and parse only the rows of
+the key. E.g.,
+
+    lookup = LemmaLookup(resources_dir="russian_word_analyses/resources")
+    lookup.get_forms("1234")         # {"ru_noun_sg_gen": [{"position": "1", "bare": ..., "accented": ...}], ...}
+    lookup.get_translations("1234")  # ["bus", "coach"]
+"""
+
+import argparse
+import csv
+import io
+import json
+import mmap
+import os
+import time
+from typing import Dict, List, Optional
+
+from compression import get_compression
+from fast_csv import ends_in_quoted_field
+from utils import supplement_accent_mark
+
+
+INDEX_SUFFIX = ".idx.json"
+INDEX_VERSION = 1
+
+DEFAULT_KEY_COLUMN = "word_id"
+
+WORDS_FORMS_FILE_NAME = "words_forms.csv"
+TRANSLATIONS_FILE_NAME = "translations.csv"
+
+
+def get_index_path(fp: str, key_column: str = DEFAULT_KEY_COLUMN) -> str:
+    """E.g., "resources/words_forms.csv" -> "resources/words_forms.csv.word_id.idx.json"."""
+    return f"{fp}.{key_column}{INDEX_SUFFIX}"
+
+
+def get_source_signature(fp: str) -> dict:
+    stat = os.stat(fp)
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+
+
+def iter_raw_rows(f):
+    """Yield (offset, raw row bytes) of the rows of a binary CSV file, header included.
+
+    A row may span several physical lines if a quoted field contains a newline (see
+    `fast_csv.ends_in_quoted_field`).
+    """
+
+    offset = 0
+    row_start = 0
+    row_lines = []
+    in_quotes = False
+    for line in f:
+        row_lines.append(line)
+        offset += len(line)
+        in_quotes = ends_in_quoted_field(line, in_quotes)
+        if in_quotes:
+            continue
+
+        yield row_start, b"".join(row_lines)
+        row_start = offset
+        row_lines = []
+
+    if row_lines:
+        yield row_start, b"".join(row_lines)
+
+
+def parse_raw_rows(raw: bytes) -> List[List[str]]:
+    return list(csv.reader(io.StringIO(raw.decode("utf-8-sig"), newline="")))
+
+
+def build_csv_index(fp: str, key_column: str = DEFAULT_KEY_COLUMN) -> dict:
+    """Scan the CSV once and record the byte spans of the rows of each key.
+
+    Consecutive rows of the same key are merged into one span, so a dump sorted (or grouped)
+    by the key has one span per key.
+
+    :param fp: E.g., "russian_word_analyses/resources/words_forms.csv"
+    :param key_column: E.g., "word_id"
+    :return: {"version":, "source":, "key_column":, "header":, "spans": {key: [[start, end]]}}
+    """
+
+    if get_compression(fp) is not None:
+        raise ValueError(f"Cannot index {fp}: byte offsets need an uncompressed CSV.")
+
+    signature = get_source_signature(fp)
+
+    spans = {}
+    with open(fp, "rb") as f:
+        raw_rows = iter_raw_rows(f)
+        _, raw_header = next(raw_rows)
+        header = parse_raw_rows(raw_header)[0]
+        key_index = header.index(key_column)
+
+        for start, raw in raw_rows:
+            if b'"' in raw:
+                row = parse_raw_rows(raw)[0]
+            else:
+                row = raw.rstrip(b"\r\n").decode("utf-8").split(",")
+            if len(row) <= key_index:
+                continue  # Blank line.
+
+            key = row[key_index]
+            end = start + len(raw)
+            key_spans = spans.setdefault(key, [])
+            if key_spans and key_spans[-1][1] == start:
+                key_spans[-1][1] = end
+            else:
+                key_spans.append([start, end])
+
+    return {
+        "version": INDEX_VERSION,
+        "source": signature,
+        "key_column": key_column,
+        "header": header,
+        "spans": spans,
+    }
+
+
+def is_index_valid(index: dict, fp: str, key_column: str) -> bool:
+    return (
+        index.get("version") == INDEX_VERSION
+        and index.get("key_column") == key_column
+        and index.get("source") == get_source_signature(fp)
+    )
+
+
+def load_csv_index(fp: str, key_column: str = DEFAULT_KEY_COLUMN, rebuild: bool = False) -> dict:
+    """Load the sidecar index of the CSV, (re)building and saving it if it is missing or stale."""
+
+    fp_index = get_index_path(fp, key_column)
+
+    if not rebuild and os.path.exists(fp_index):
+        with open(fp_index, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if is_index_valid(index, fp, key_column):
+            return index
+
+    index = build_csv_index(fp, key_column)
+
+    # Write to a temporary file first, so that a concurrent reader never sees a partial index.
+    fp_tmp = f"{fp_index}.{os.getpid()}.tmp"
+    with open(fp_tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(fp_tmp, fp_index)
+
+    return index
+
+
+class IndexedCsv:
+    """Random access to the rows of a CSV by key, through its sidecar index."""
+
+    def __init__(self, fp: str, key_column: str = DEFAULT_KEY_COLUMN):
+
+        self.fp = fp
+        self.key_column = key_column
+
+        self._index = None
+        self._f = None
+        self._mmap = None
+
+    def _open(self):
+        """(Re)open the CSV and its index if the CSV has changed since they were opened."""
+
+        if self._index is not None and is_index_valid(self._index, self.fp, self.key_column):
+            return
+
+        self.close()
+        self._index = load_csv_index(self.fp, self.key_column)
+        self._f = open(self.fp, "rb")
+        if self._index["source"]["size"] > 0:
+            self._mmap = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def header(self) -> List[str]:
+        self._open()
+        return self._index["header"]
+
+    def __len__(self) -> int:
+        """The number of keys."""
+        self._open()
+        return len(self._index["spans"])
+
+    def __contains__(self, key: str) -> bool:
+        self._open()
+        return key in self._index["spans"]
+
+    def get_rows(self, key: str) -> List[dict]:
+        """Parse only the rows of the key. Returns [] for an unknown key."""
+
+        self._open()
+        spans = self._index["spans"].get(key)
+        if not spans:
+            return []
+
+        header = self._index["header"]
+        raw = b"".join(self._mmap[start:end] for start, end in spans)
+        return [
+            dict(zip(header, row))
+            for row in parse_raw_rows(raw)
+            if row
+        ]
+
+
+class LemmaLookup:
+    """Look up the ground-truth forms and translations of single lemmas without loading the dumps."""
+
+    def __init__(self, resources_dir: str):
+
+        self.words_forms = IndexedCsv(os.path.join(resources_dir, WORDS_FORMS_FILE_NAME))
+        self.translations = IndexedCsv(os.path.join(resources_dir, TRANSLATIONS_FILE_NAME))
+
+    def close(self):
+        self.words_forms.close()
+        self.translations.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_forms(self, word_id: str) -> Dict[str, List[dict]]:
+        """The ground-truth forms of a lemma, in the shape of the analyzers' "ground_truth_decls".
+
+        :return: {form_type: [{"position":, "bare":, "accented":}]}, e.g., form_type "ru_noun_sg_gen".
+        """
+
+        forms = {}
+        for row in self.words_forms.get_rows(word_id):
+            forms.setdefault(row["form_type"], []).append({
+                "position": row["position"],
+                "bare": row["_form_bare"],
+                "accented": supplement_accent_mark(row["form"]),
+            })
+        return forms
+
+    def get_translations(self, word_id: str, lang: Optional[str] = "en") -> List[str]:
+        return [
+            row["tl"].strip()
+            for row in self.translations.get_rows(word_id)
+            if lang is None or row["lang"] == lang
+        ]
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("word_ids", nargs="*")
+    parser.add_argument("--resources-dir", default="russian_word_analyses/resources")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the indexes even if they are up to date.")
+    args = parser.parse_args()
+
+    with LemmaLookup(resources_dir=args.resources_dir) as lookup:
+        for indexed_csv in [lookup.words_forms, lookup.translations]:
+            start = time.perf_counter()
+            if args.rebuild:
+                load_csv_index(indexed_csv.fp, rebuild=True)
+            print(f"{get_index_path(indexed_csv.fp)}: {len(indexed_csv):,} keys ({time.perf_counter() - start:.3f}s)")
+
+        for word_id in args.word_ids:
+            start = time.perf_counter()
+            forms = lookup.get_forms(word_id)
+            translations = lookup.get_translations(word_id)
+            elapsed_us = (time.perf_counter() - start) * 1e6
+
+            print(f"{word_id} ({elapsed_us:.0f}us): {'; '.join(translations)}")
+            for form_type, variants in forms.items():
+                print(f"    {form_type:<32} {'/'.join(variant['accented'] for variant in variants)}")
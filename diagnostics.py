@@ -0,0 +1,109 @@
+import json
+import threading
+from collections import Counter
+from typing import Optional
+
+from metrics import count_diagnostic
+
+
+DEFAULT_MAX_SAMPLES = 20
+
+
+class Diagnostics:
+    """Count diagnostic events by category and keep a bounded sample of each.
+
+    Replaces printing in hot loops. E.g.,
+
+        diagnostics.report("form_mismatch", f"{form} != {trg}", form_type=form_type)
+
+    With `echo`, the first `max_samples` events of each category are also printed.
+    """
+
+    def __init__(self, name: str, max_samples: int = DEFAULT_MAX_SAMPLES, echo: bool = False):
+
+        self.name = name
+        self.max_samples = max_samples
+        self.echo = echo
+
+        self.counts = Counter()
+        self.samples = {}
+
+        self._lock = threading.Lock()
+
+    def report(self, category: str, message: str, **fields):
+
+        with self._lock:
+            self.counts[category] += 1
+            count = self.counts[category]
+
+            samples = self.samples.setdefault(category, [])
+            if len(samples) < self.max_samples:
+                samples.append({
+                    "message": message,
+                    **fields,
+                })
+        count_diagnostic(self.name, category)
+
+        if self.echo:
+            if count <= self.max_samples:
+                print(f"[{self.name}.{category}] {message}")
+            elif count == self.max_samples + 1:
+                print(f"[{self.name}.{category}] Further messages are suppressed.")
+
+    def summary(self) -> dict:
+        return {
+            "analyzer": self.name,
+            "counts": dict(self.counts.most_common()),
+        }
+
+    def save(self, fp: str):
+        """Write the samples, one JSON object per line, followed by the summary."""
+
+        with open(fp, "w", encoding="utf-8") as f:
+            for category, samples in self.samples.items():
+                for sample in samples:
+                    f.write(json.dumps(
+                        {
+                            "analyzer": self.name,
+                            "category": category,
+                            **sample,
+                        },
+                        ensure_ascii=False,
+                    ) + "\n")
+            f.write(json.dumps(
+                {
+                    "category": "summary",
+                    **self.summary(),
+                },
+                ensure_ascii=False,
+            ) + "\n")
+
+    def print_summary(self):
+        if len(self.counts) == 0:
+            return
+        print(f"Diagnostics of {self.name}:")
+        for category, count in self.counts.most_common():
+            print(f"    {category:<40} {count:>10,}")
+
+
+# Collects the events of callers that do not pass a collector.
+_default_diagnostics = Diagnostics(name="default")
+
+
+def get_diagnostics(diagnostics: Optional[Diagnostics] = None) -> Diagnostics:
+    if diagnostics is None:
+        return _default_diagnostics
+    return diagnostics
+
+
+def add_diagnostics_arguments(parser):
+    parser.add_argument(
+        "--diagnostics",
+        default=None,
+        help="Write sampled diagnostics and their counts as JSONL to this path.",
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        help="Also print diagnostics (rate-limited per category).",
+    )
@@ -0,0 +1,375 @@
+"""Diff two snapshots of an analysis CSV, e.g., files/noun_analyses.old.1.csv and files/noun_analyses.csv.
+
+Both files are streamed and merge-joined on the key column (`bare_form` for nouns and adjectives,
+`accented_infinitive` for verbs), so memory stays constant in the number of rows. The noun and
+adjective analyses are written sorted by `bare_form`. Unsorted files (e.g., the verb info, which is
+in token order) are rejected unless `sort` is given, in which case they are sorted externally first.
+
+Rows sharing a key (homographs) are paired by `accented_form` first, then by position.
+
+Usage:
+
+    python diff_analyses.py files/noun_analyses.old.1.csv files/noun_analyses.csv --changes changes.jsonl
+"""
+
+import argparse
+import json
+from collections import Counter
+from itertools import groupby
+from typing import Iterator, List, Optional, Tuple
+
+from IO import iter_csv
+from external_sort import external_sort, DEFAULT_MAX_ROWS_IN_MEMORY
+
+
+KEY_COLUMNS = (
+    "bare_form",            # Nouns, adjectives.
+    "accented_infinitive",  # Verbs.
+)
+SECONDARY_KEY_COLUMN = "accented_form"
+
+TAGS_SUFFIX = "_tags"
+
+CELL_KIND_FORMS = "forms"
+CELL_KIND_TAGS = "tags"
+CELL_KIND_META = "meta"
+
+DEFAULT_MAX_SAMPLES = 20
+
+
+def get_key_column(fieldnames: List[str]) -> str:
+    for key_column in KEY_COLUMNS:
+        if key_column in fieldnames:
+            return key_column
+    raise ValueError(f"None of the key columns {KEY_COLUMNS} is in the header {fieldnames}.")
+
+
+def get_cell_kind(column: str, fieldnames: List[str]) -> Tuple[str, str]:
+    """Classify a column. E.g.,
+    "gen_sg" -> ("gen_sg", "forms"), "gen_sg_tags" -> ("gen_sg", "tags"), "gender" -> ("gender", "meta").
+    """
+
+    if column.endswith(TAGS_SUFFIX):
+        return column[:-len(TAGS_SUFFIX)], CELL_KIND_TAGS
+    if f"{column}{TAGS_SUFFIX}" in fieldnames:
+        return column, CELL_KIND_FORMS
+    return column, CELL_KIND_META
+
+
+def parse_tag_bits(tags: str) -> str:
+    """Get the bits of a tag cell. E.g., "#i_a_, gen_pl:..." -> "i_a_", "" -> ""."""
+
+    if not tags.startswith("#"):
+        return ""
+    return tags[1:].split(",", 1)[0]
+
+
+def get_tag_bit_changes(old_tags: str, new_tags: str) -> List[str]:
+    """E.g., ("#i___, ...", "#_Ia_, ...") -> ["-i", "+I", "+a"].
+
+    Bits are compared by letter, not by position, as snapshots may have different numbers of bits.
+    """
+
+    old_bits = set(parse_tag_bits(old_tags)) - {"_"}
+    new_bits = set(parse_tag_bits(new_tags)) - {"_"}
+
+    return (
+        [f"-{bit}" for bit in sorted(old_bits - new_bits)]
+        + [f"+{bit}" for bit in sorted(new_bits - old_bits)]
+    )
+
+
+def iter_groups(rows: Iterator[dict], key_column: str, fp: str) -> Iterator[Tuple[str, List[dict]]]:
+    """Group consecutive rows by the key, checking that the keys are sorted."""
+
+    last_key = None
+    for key, group in groupby(rows, key=lambda row: row[key_column]):
+        if last_key is not None and key < last_key:
+            raise ValueError(
+                f"{fp} is not sorted by {key_column} ({key!r} after {last_key!r}). "
+                f"Pass sort=True (--sort) to sort it externally."
+            )
+        last_key = key
+        yield key, list(group)
+
+
+def pair_rows(old_rows: List[dict], new_rows: List[dict]) -> Iterator[Tuple[Optional[dict], Optional[dict]]]:
+    """Pair the rows of a key by the accented form, then by position."""
+
+    if len(old_rows) == 1 and len(new_rows) == 1:
+        yield old_rows[0], new_rows[0]
+        return
+
+    unpaired_new_rows = list(new_rows)
+    unpaired_old_rows = []
+    for old_row in old_rows:
+        for index, new_row in enumerate(unpaired_new_rows):
+            if old_row.get(SECONDARY_KEY_COLUMN) == new_row.get(SECONDARY_KEY_COLUMN):
+                yield old_row, unpaired_new_rows.pop(index)
+                break
+        else:
+            unpaired_old_rows.append(old_row)
+
+    for index in range(max(len(unpaired_old_rows), len(unpaired_new_rows))):
+        yield (
+            unpaired_old_rows[index] if index < len(unpaired_old_rows) else None,
+            unpaired_new_rows[index] if index < len(unpaired_new_rows) else None,
+        )
+
+
+class AnalysisDiff:
+    """Counts of the differences between two snapshots, with bounded samples."""
+
+    def __init__(self, fp_old: str, fp_new: str, max_samples: int = DEFAULT_MAX_SAMPLES, f_changes=None):
+
+        self.fp_old = fp_old
+        self.fp_new = fp_new
+        self.max_samples = max_samples
+        self.f_changes = f_changes
+
+        self.key_column = None
+        self.columns_added = []
+        self.columns_removed = []
+
+        self.counts = Counter()
+        # {cell: {kind: count}}
+        self.cells = {}
+        # {cell: {"+a": count}}
+        self.tag_bits = {}
+        self.samples = {}
+
+    def _sample(self, change: dict):
+        samples = self.samples.setdefault(change["change"], [])
+        if len(samples) < self.max_samples:
+            samples.append(change)
+        if self.f_changes is not None:
+            self.f_changes.write(json.dumps(change, ensure_ascii=False) + "\n")
+
+    def lemma_added(self, key: str, row: dict):
+        self.counts["lemmas_added"] += 1
+        self._sample({
+            "change": "lemma_added",
+            "key": key,
+            "accented": row.get(SECONDARY_KEY_COLUMN),
+        })
+
+    def lemma_removed(self, key: str, row: dict):
+        self.counts["lemmas_removed"] += 1
+        self._sample({
+            "change": "lemma_removed",
+            "key": key,
+            "accented": row.get(SECONDARY_KEY_COLUMN),
+        })
+
+    def compare(self, key: str, old_row: dict, new_row: dict, columns: List[Tuple[str, str, str]]):
+
+        changed = False
+        for column, cell, kind in columns:
+            old_value = old_row[column]
+            new_value = new_row[column]
+            if old_value == new_value:
+                continue
+
+            changed = True
+            cell_counts = self.cells.setdefault(cell, Counter())
+            cell_counts[kind] += 1
+
+            change = {
+                "change": "cell_changed",
+                "key": key,
+                "accented": new_row.get(SECONDARY_KEY_COLUMN),
+                "column": column,
+                "kind": kind,
+                "old": old_value,
+                "new": new_value,
+            }
+            if kind == CELL_KIND_TAGS:
+                bit_changes = get_tag_bit_changes(old_value, new_value)
+                self.tag_bits.setdefault(cell, Counter()).update(bit_changes)
+                change["bits"] = bit_changes
+            self._sample(change)
+
+        if changed:
+            self.counts["lemmas_changed"] += 1
+        else:
+            self.counts["lemmas_unchanged"] += 1
+
+    def summary(self) -> dict:
+        return {
+            "old": self.fp_old,
+            "new": self.fp_new,
+            "key_column": self.key_column,
+            "columns_added": self.columns_added,
+            "columns_removed": self.columns_removed,
+            "counts": dict(self.counts),
+            "cells": {
+                cell: dict(counts)
+                for cell, counts in self.cells.items()
+            },
+            "tag_bits": {
+                cell: dict(counts.most_common())
+                for cell, counts in self.tag_bits.items()
+            },
+            "samples": self.samples,
+        }
+
+    def print_summary(self):
+        print(f"{self.fp_old} -> {self.fp_new} (key: {self.key_column})")
+        for name in ["old_rows", "new_rows", "lemmas_added", "lemmas_removed", "lemmas_changed", "lemmas_unchanged"]:
+            print(f"    {name:<40} {self.counts[name]:>10,}")
+        if self.columns_added:
+            print(f"    columns added: {', '.join(self.columns_added)}")
+        if self.columns_removed:
+            print(f"    columns removed: {', '.join(self.columns_removed)}")
+
+        if self.cells:
+            print(f"    {'changed cell':<24} {CELL_KIND_FORMS:>10} {CELL_KIND_TAGS:>10} {CELL_KIND_META:>10}  tag bits")
+        for cell, counts in self.cells.items():
+            bits = " ".join(
+                f"{bit}:{count}"
+                for bit, count in self.tag_bits.get(cell, Counter()).most_common()
+            )
+            print(
+                f"    {cell:<24} "
+                f"{counts[CELL_KIND_FORMS]:>10,} {counts[CELL_KIND_TAGS]:>10,} {counts[CELL_KIND_META]:>10,}"
+                f"  {bits}"
+            )
+
+
+def _iter_rows(fp: str, key_column: Optional[str], sort: bool, max_rows_in_memory: int) -> Tuple[List[str], str, Iterator[dict]]:
+
+    rows = iter_csv(fp)
+    first_row = next(rows, None)
+    fieldnames = list(first_row.keys()) if first_row is not None else []
+    if key_column is None:
+        key_column = get_key_column(fieldnames)
+
+    def chained():
+        if first_row is not None:
+            yield first_row
+            yield from rows
+
+    sorted_rows = chained()
+    if sort:
+        sorted_rows = external_sort(
+            sorted_rows,
+            key=lambda row: row[key_column],
+            max_rows_in_memory=max_rows_in_memory,
+        )
+    return fieldnames, key_column, sorted_rows
+
+
+def diff_analyses(
+        fp_old: str,
+        fp_new: str,
+        key_column: Optional[str] = None,
+        sort: bool = False,
+        max_samples: int = DEFAULT_MAX_SAMPLES,
+        fp_changes: Optional[str] = None,
+        max_rows_in_memory: int = DEFAULT_MAX_ROWS_IN_MEMORY,
+) -> AnalysisDiff:
+    """Diff two snapshots of an analysis CSV.
+
+    :param fp_old: E.g., "files/noun_analyses.old.1.csv"
+    :param fp_new: E.g., "files/noun_analyses.csv"
+    :param key_column: Detected from the header of `fp_old` if not given.
+    :param sort: Sort the files by the key externally instead of requiring them to be sorted.
+    :param fp_changes: If given, every change is written to it as a JSON line.
+    :return: The diff. See `AnalysisDiff.summary`.
+    """
+
+    f_changes = open(fp_changes, "w", encoding="utf-8") if fp_changes is not None else None
+    try:
+        diff = AnalysisDiff(
+            fp_old=fp_old,
+            fp_new=fp_new,
+            max_samples=max_samples,
+            f_changes=f_changes,
+        )
+
+        old_fieldnames, key_column, old_rows = _iter_rows(fp_old, key_column, sort, max_rows_in_memory)
+        new_fieldnames, _, new_rows = _iter_rows(fp_new, key_column, sort, max_rows_in_memory)
+
+        diff.key_column = key_column
+        diff.columns_added = [column for column in new_fieldnames if column not in old_fieldnames]
+        diff.columns_removed = [column for column in old_fieldnames if column not in new_fieldnames]
+
+        columns = [
+            (column, *get_cell_kind(column, new_fieldnames))
+            for column in new_fieldnames
+            if column in old_fieldnames and column != key_column
+        ]
+
+        old_groups = iter_groups(old_rows, key_column, fp_old)
+        new_groups = iter_groups(new_rows, key_column, fp_new)
+        old_group = next(old_groups, None)
+        new_group = next(new_groups, None)
+        while old_group is not None or new_group is not None:
+
+            if new_group is None or (old_group is not None and old_group[0] < new_group[0]):
+                key, old_group_rows = old_group
+                diff.counts["old_rows"] += len(old_group_rows)
+                for old_row in old_group_rows:
+                    diff.lemma_removed(key, old_row)
+                old_group = next(old_groups, None)
+
+            elif old_group is None or new_group[0] < old_group[0]:
+                key, new_group_rows = new_group
+                diff.counts["new_rows"] += len(new_group_rows)
+                for new_row in new_group_rows:
+                    diff.lemma_added(key, new_row)
+                new_group = next(new_groups, None)
+
+            else:
+                key = old_group[0]
+                diff.counts["old_rows"] += len(old_group[1])
+                diff.counts["new_rows"] += len(new_group[1])
+                for old_row, new_row in pair_rows(old_group[1], new_group[1]):
+                    if new_row is None:
+                        diff.lemma_removed(key, old_row)
+                    elif old_row is None:
+                        diff.lemma_added(key, new_row)
+                    else:
+                        diff.compare(key, old_row, new_row, columns)
+                old_group = next(old_groups, None)
+                new_group = next(new_groups, None)
+
+    finally:
+        if f_changes is not None:
+            f_changes.close()
+
+    return diff
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("fp_old")
+    parser.add_argument("fp_new")
+    parser.add_argument("--key", default=None, help=f"The key column. Detected from {KEY_COLUMNS} by default.")
+    parser.add_argument("--sort", action="store_true", help="Sort unsorted files (e.g., the verb info) externally.")
+    parser.add_argument("--max-rows-in-memory", type=int, default=DEFAULT_MAX_ROWS_IN_MEMORY)
+    parser.add_argument("--max-samples", type=int, default=DEFAULT_MAX_SAMPLES)
+    parser.add_argument("--changes", default=None, help="Write every change as JSONL to this path.")
+    parser.add_argument("--output", default=None, help="Write the summary as JSON to this path.")
+    args = parser.parse_args()
+
+    diff = diff_analyses(
+        fp_old=args.fp_old,
+        fp_new=args.fp_new,
+        key_column=args.key,
+        sort=args.sort,
+        max_samples=args.max_samples,
+        fp_changes=args.changes,
+        max_rows_in_memory=args.max_rows_in_memory,
+    )
+    diff.print_summary()
+
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                diff.summary(),
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
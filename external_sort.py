@@ -0,0 +1,128 @@
+import heapq
+import os
+import sys
+from typing import Callable, Iterable, Iterator, Optional
+
+
+DEFAULT_MAX_ROWS_IN_MEMORY = 500_000
+
+# The maximum number of runs merged at once, to bound the number of open files.
+MAX_MERGE_FAN_IN = 128
+
+# The number of rows to estimate the row size from, for `max_bytes_in_memory`.
+ROW_SIZE_SAMPLE = 1000
+
+
+def estimate_row_bytes(row) -> int:
+    """Rough in-memory size of a row, e.g., a dict of strings from csv.DictReader.
+
+    Keys are not counted, as the rows of a reader share them.
+    """
+
+    if isinstance(row, dict):
+        return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+    if isinstance(row, (tuple, list)):
+        return sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+    return sys.getsizeof(row)
+
+
+def _write_run(rows: Iterable, tmp_dir: Optional[str]) -> str:
+
+    # Imported on first use, as tempfile and pickle slow down importing the analyzers, and most
+    # sorts fit in memory.
+    import pickle
+    import tempfile
+
+    fd, fp = tempfile.mkstemp(
+        prefix="run.",
+        suffix=".pickle",
+        dir=tmp_dir,
+    )
+    with os.fdopen(fd, "wb") as f:
+        for row in rows:
+            pickle.dump(row, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return fp
+
+
+def _read_run(fp: str) -> Iterator:
+    import pickle
+    with open(fp, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def external_sort(
+        rows: Iterable,
+        key: Callable,
+        max_rows_in_memory: int = DEFAULT_MAX_ROWS_IN_MEMORY,
+        tmp_dir: Optional[str] = None,
+        max_bytes_in_memory: Optional[int] = None,
+) -> Iterator:
+    """Sort rows that may not fit in memory.
+
+    Rows are sorted in runs of at most `max_rows_in_memory` rows, the runs are spilled to
+    temporary files and then merged lazily. If all rows fit in one run, nothing is spilled.
+    The sort is stable.
+
+    :param rows: E.g., a csv.DictReader.
+    :param key: Sort key of a row.
+    :param max_bytes_in_memory: If given, runs are also limited to about this many bytes,
+        estimated from the first rows (see `estimate_row_bytes`).
+    :return: Iterator over the sorted rows.
+    """
+
+    fp_runs = []
+    try:
+        run = []
+        n_sampled = 0
+        sampled_bytes = 0
+        for row in rows:
+            run.append(row)
+
+            if max_bytes_in_memory is not None and n_sampled < ROW_SIZE_SAMPLE:
+                n_sampled += 1
+                sampled_bytes += estimate_row_bytes(row)
+                max_rows_in_memory = min(
+                    max_rows_in_memory,
+                    max(1, max_bytes_in_memory * n_sampled // sampled_bytes),
+                )
+
+            if len(run) >= max_rows_in_memory:
+                run.sort(key=key)
+                fp_runs.append(_write_run(run, tmp_dir))
+                run = []
+        run.sort(key=key)
+
+        if not fp_runs:
+            yield from run
+            return
+
+        if run:
+            fp_runs.append(_write_run(run, tmp_dir))
+        del run
+
+        # Merge the runs in several passes if there are too many to open at once.
+        while len(fp_runs) > MAX_MERGE_FAN_IN:
+            fp_merged_runs = []
+            for i in range(0, len(fp_runs), MAX_MERGE_FAN_IN):
+                fp_group = fp_runs[i:i + MAX_MERGE_FAN_IN]
+                fp_merged_runs.append(_write_run(
+                    heapq.merge(*[_read_run(fp) for fp in fp_group], key=key),
+                    tmp_dir,
+                ))
+                for fp in fp_group:
+                    os.remove(fp)
+            fp_runs[:] = fp_merged_runs
+
+        yield from heapq.merge(
+            *[_read_run(fp) for fp in fp_runs],
+            key=key,
+        )
+
+    finally:
+        for fp in fp_runs:
+            if os.path.exists(fp):
+                os.remove(fp)
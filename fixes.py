@@ -0,0 +1,222 @@
+import os.path
+from typing import List, Dict, Optional
+
+from IO import read_json
+from diagnostics import Diagnostics, get_diagnostics
+from utils import get_accent_pos, remove_accent_mark, insert_accent_mark
+
+
+FP_LEMMA_FIXES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    "files",
+    "lemma_fixes.json",
+)
+
+NOUN_FIXES_KEY = "nouns"
+ADJECTIVE_FIXES_KEY = "adjectives"
+
+WORD_ID_KEY_PREFIX = "#"
+
+FIX_OPS = (
+    "accent",    # Override the bare/accented form of the lemma.
+    "meta",      # Override a meta field. E.g., animate.
+    "set",       # Replace a cell, or a single variant of a cell.
+    "alias",     # Make cell A refer to the forms of cell B.
+    "swap",      # Swap the forms of two cells.
+    "split",     # Split the first variant of a cell into several variants by a delimiter.
+    "reaccent",  # Move the accent of the variants to the accent position of the lemma.
+    "replace",   # Replace a substring in the accented variants.
+    "prefix",    # Prepend a string to the accented variants.
+    "drop",      # Drop the lemma.
+)
+
+# fp: (mtime_ns, overlay)
+_overlay_cache = {}
+
+
+def validate_fix_overlay(overlay: dict):
+    for section, fixes in overlay.items():
+        for key, ops in fixes.items():
+            for op in ops:
+                if op.get("op") not in FIX_OPS:
+                    raise ValueError(
+                        f"Unknown fix op {op.get('op')!r} for {key!r} in section {section!r}."
+                    )
+
+
+def read_fix_overlay(fp: str = FP_LEMMA_FIXES) -> Dict[str, Dict[str, List[dict]]]:
+    """Read the lemma fix overlay.
+
+    The overlay is reloaded whenever the file changes on disk,
+    so edits take effect on the next call without a restart.
+
+    :param fp: E.g., "files/lemma_fixes.json"
+    :return: {section: {bare or #word_id: [op]}}
+    """
+
+    mtime_ns = os.stat(fp).st_mtime_ns
+
+    cached = _overlay_cache.get(fp)
+    if cached is None or cached[0] != mtime_ns:
+        overlay = read_json(fp=fp)
+        validate_fix_overlay(overlay)
+        _overlay_cache[fp] = (mtime_ns, overlay)
+
+    return _overlay_cache[fp][1]
+
+
+def get_fixes(overlay_section: Dict[str, List[dict]], word_id: str, bare: str) -> List[dict]:
+    """Look up the fixes of a lemma. Entries keyed by word id take precedence over bare forms."""
+
+    fixes = overlay_section.get(f"{WORD_ID_KEY_PREFIX}{word_id}")
+    if fixes is None:
+        fixes = overlay_section.get(bare, [])
+    return fixes
+
+
+def _iter_variants(decls: dict, op: dict, decl_types: List[str]):
+    for decl_type in op.get("cells", decl_types):
+        if decl_type not in decls:
+            continue
+        variants = decls[decl_type]
+        if "index" in op:
+            variants = variants[op["index"]:op["index"] + 1]
+        yield from variants
+
+
+def apply_fixes(d: dict, fixes: List[dict], decl_types: List[str]) -> bool:
+    """Apply the fixes to the analysis of a lemma in place.
+
+    :param d: The analysis of a lemma, i.e., {"bare":, "accented":, "meta":, "ground_truth_decls":}.
+    :param fixes: Fix ops from the overlay.
+    :param decl_types: The cells that "all cells" refers to.
+    :return: False if the lemma should be dropped.
+    """
+
+    for op in fixes:
+        kind = op["op"]
+        decls = d.setdefault("ground_truth_decls", {})
+
+        if kind == "drop":
+            return False
+
+        elif kind == "accent":
+            if "if_accented" in op and d["accented"] != op["if_accented"]:
+                continue
+            if "bare" in op:
+                d["bare"] = op["bare"]
+            d["accented"] = op["accented"]
+
+        elif kind == "meta":
+            d["meta"][op["key"]] = op["value"]
+
+        elif kind == "set":
+            cell = op["cell"]
+            if "forms" in op:
+                decls[cell] = [
+                    {
+                        "position": str(i + 1),
+                        "bare": remove_accent_mark(accented),
+                        "accented": accented,
+                    }
+                    for i, accented in enumerate(op["forms"])
+                ]
+                continue
+
+            if "index" in op:
+                variants = [decls[cell][op["index"]]]
+            else:
+                variants = [
+                    variant
+                    for variant in decls[cell]
+                    if variant["bare"] == op["match_bare"]
+                ]
+            for variant in variants:
+                if "bare" in op:
+                    variant["bare"] = op["bare"]
+                variant["accented"] = op["accented"]
+
+        elif kind == "alias":
+            decls[op["cell"]] = decls[op["source"]]
+
+        elif kind == "swap":
+            a, b = op["cells"]
+            decls[a], decls[b] = decls[b], decls[a]
+
+        elif kind == "split":
+            cell = op["cell"]
+            variants = decls[cell][0]["accented"].split(op["delimiter"])
+            decls[cell] = [
+                {
+                    "position": str(i + 1),
+                    "bare": remove_accent_mark(variant),
+                    "accented": variant,
+                }
+                for i, variant in enumerate(variants)
+            ]
+
+        elif kind == "reaccent":
+            accent_pos = get_accent_pos(d["accented"])
+            for variant in _iter_variants(decls, op, decl_types):
+                variant["accented"] = insert_accent_mark(
+                    word=remove_accent_mark(variant["accented"]),
+                    accent_pos=accent_pos,
+                )
+
+        elif kind == "replace":
+            for variant in _iter_variants(decls, op, decl_types):
+                variant["accented"] = variant["accented"].replace(
+                    op["old"],
+                    op["new"],
+                )
+
+        elif kind == "prefix":
+            for variant in _iter_variants(decls, op, decl_types):
+                variant["accented"] = op["prefix"] + variant["accented"]
+
+    return True
+
+
+def apply_fix_overlay(
+        analyses: Dict[str, dict],
+        section: str,
+        decl_types: List[str],
+        fp_fixes: Optional[str] = None,
+        diagnostics: Optional[Diagnostics] = None,
+) -> Dict[str, dict]:
+    """Apply the fixes of an overlay section to all analyses, dropping the lemmas marked as dropped."""
+
+    diagnostics = get_diagnostics(diagnostics)
+
+    overlay_section = read_fix_overlay(
+        fp=fp_fixes if fp_fixes is not None else FP_LEMMA_FIXES
+    ).get(section, {})
+
+    ids_to_remove = []
+    for word_id, d in analyses.items():
+        fixes = get_fixes(
+            overlay_section=overlay_section,
+            word_id=word_id,
+            bare=d["bare"],
+        )
+        if not fixes:
+            continue
+        diagnostics.report(
+            "fixed_by_overlay",
+            f"Fixing {d['bare']} ({word_id}) with {len(fixes)} op(s).",
+            word_id=word_id,
+            bare=d["bare"],
+        )
+        if not apply_fixes(d, fixes, decl_types):
+            ids_to_remove.append(word_id)
+
+    for word_id in ids_to_remove:
+        diagnostics.report(
+            "dropped_by_overlay",
+            f"Removing {analyses[word_id]['bare']} ({word_id}) as it is dropped by the fix overlay.",
+            word_id=word_id,
+            bare=analyses[word_id]["bare"],
+        )
+        del analyses[word_id]
+
+    return analyses
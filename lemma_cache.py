@@ -0,0 +1,197 @@
+"""A persistent cache of the output rows of the analyzers, by lemma.
+
+Between dictionary releases, most lemmas do not change, yet their declensions are applied and
+their rows made again on every run. The cache is a SQLite file keeping, for each analyzer and
+word id, the finished row, the diagnostics reported while making it, and a fingerprint of:
+
+    1. the assembled analysis of the lemma, i.e., its `words` row, POS row, translations and
+       forms, after the lemma fixes are applied and the partners resolved (see `analyze_nouns.main`);
+    2. the code version, i.e., the source of the modules making the rows.
+
+A lemma whose fingerprint matches is not analyzed again: its row is taken from the cache, and its
+diagnostics are reported again, so the outputs are the same as without the cache. E.g.,
+
+    cache = LemmaCache("lemma_cache.sqlite", analyzer="nouns", code_modules=CACHE_CODE_MODULES)
+    cache.look_up(noun_analyses)  # Before the analyses are changed by the later steps.
+    for word_id, d in noun_analyses.items():
+        if not cache.is_hit(word_id):
+            d["rule_based_decls"] = ...
+        row = cache.get_row(word_id, d, make_row=make_row, diagnostics=diagnostics)
+    cache.commit()
+"""
+
+import json
+from typing import Callable, Dict, Sequence
+
+from diagnostics import Diagnostics
+
+
+CACHE_VERSION = 1
+
+# SQLite limits the number of parameters of a statement.
+LOOKUP_BATCH_SIZE = 500
+# Waiting for the analyzers running in parallel to commit.
+DEFAULT_TIMEOUT_S = 60
+
+
+def get_code_version(module_names: Sequence[str]) -> str:
+    """A hash of the source of the modules, e.g., ["analyze_nouns", "noun_analyses.russian_noun"]."""
+
+    # Imported on first use, as hashlib and sqlite3 slow down importing the analyzers.
+    import hashlib
+    import importlib.util
+
+    h = hashlib.sha256(str(CACHE_VERSION).encode("utf-8"))
+    for name in module_names:
+        spec = importlib.util.find_spec(name)
+        if spec is None or spec.origin is None:
+            raise ValueError(f"Cannot find the source of the module {name!r}.")
+        h.update(name.encode("utf-8"))
+        with open(spec.origin, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class RecordingDiagnostics:
+    """Forward the reports to `diagnostics`, keeping them to be reported again later."""
+
+    def __init__(self, diagnostics: Diagnostics):
+        self.diagnostics = diagnostics
+        self.events = []
+
+    def report(self, category: str, message: str, **fields):
+        self.events.append([category, message, fields])
+        self.diagnostics.report(category, message, **fields)
+
+
+class LemmaCache:
+    """Output rows by analyzer and word id, valid while the fingerprint of the lemma is unchanged."""
+
+    def __init__(self, fp: str, analyzer: str, code_modules: Sequence[str], timeout: float = DEFAULT_TIMEOUT_S):
+        """
+        :param fp: E.g., "russian_word_analyses/files/lemma_cache.sqlite"
+        :param analyzer: E.g., "nouns"
+        :param code_modules: The modules making the rows (see `get_code_version`).
+        """
+
+        self.fp = fp
+        self.analyzer = analyzer
+        self.code_version = get_code_version(code_modules)
+
+        import sqlite3
+        self.conn = sqlite3.connect(fp, timeout=timeout)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # Readers do not block the writer.
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            "analyzer TEXT NOT NULL, "
+            "word_id TEXT NOT NULL, "
+            "fingerprint TEXT NOT NULL, "
+            "row TEXT NOT NULL, "
+            "diagnostics TEXT NOT NULL, "
+            "PRIMARY KEY (analyzer, word_id))"
+        )
+        self.conn.commit()
+
+        self.n_hits = 0
+        self.n_misses = 0
+        self._fingerprints = {}  # {word_id: fingerprint} of the lemmas looked up.
+        self._hits = {}  # {word_id: (row, diagnostics)}
+        self._pending = []  # Rows to write on commit.
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def get_fingerprint(self, d: dict) -> str:
+        import hashlib
+        return hashlib.sha256(json.dumps(
+            [self.code_version, d],
+            ensure_ascii=False,
+            sort_keys=True,
+        ).encode("utf-8")).hexdigest()
+
+    def look_up(self, analyses: Dict[str, dict]) -> int:
+        """Fingerprint the analyses and fetch the rows of those cached with the same fingerprint.
+
+        Call it before the analyses are changed by applying the declensions.
+
+        :param analyses: {word_id: analysis}, e.g., `noun_analyses`.
+        :return: The number of hits.
+        """
+
+        fingerprints = {word_id: self.get_fingerprint(d) for word_id, d in analyses.items()}
+        self._fingerprints.update(fingerprints)
+
+        word_ids = list(fingerprints)
+        n_hits = 0
+        for start in range(0, len(word_ids), LOOKUP_BATCH_SIZE):
+            batch = word_ids[start:start + LOOKUP_BATCH_SIZE]
+            cursor = self.conn.execute(
+                f"SELECT word_id, fingerprint, row, diagnostics FROM rows "
+                f"WHERE analyzer = ? AND word_id IN ({','.join('?' * len(batch))})",
+                [self.analyzer, *batch],
+            )
+            for word_id, fingerprint, row, diagnostics in cursor:
+                if fingerprint == fingerprints[word_id]:
+                    self._hits[word_id] = (json.loads(row), json.loads(diagnostics))
+                    n_hits += 1
+        return n_hits
+
+    def is_hit(self, word_id: str) -> bool:
+        return word_id in self._hits
+
+    def get_row(self, word_id: str, d: dict, make_row: Callable, diagnostics: Diagnostics) -> dict:
+        """The cached row of a lemma, or the row made by `make_row(d, diagnostics=...)`, then cached."""
+
+        hit = self._hits.pop(word_id, None)
+        if hit is not None:
+            row, events = hit
+            for category, message, fields in events:
+                diagnostics.report(category, message, **fields)
+            self.n_hits += 1
+            return row
+
+        recorder = RecordingDiagnostics(diagnostics)
+        row = make_row(d, diagnostics=recorder)
+        fingerprint = self._fingerprints.pop(word_id, None) or self.get_fingerprint(d)
+        self._pending.append((
+            self.analyzer,
+            word_id,
+            fingerprint,
+            json.dumps(row, ensure_ascii=False),
+            json.dumps(recorder.events, ensure_ascii=False),
+        ))
+        self.n_misses += 1
+        return row
+
+    def commit(self):
+        """Write the rows made since the last commit."""
+
+        if self._pending:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO rows (analyzer, word_id, fingerprint, row, diagnostics) VALUES (?, ?, ?, ?, ?)",
+                    self._pending,
+                )
+            self._pending = []
+        self._fingerprints.clear()
+
+    def summary(self) -> dict:
+        return {
+            "analyzer": self.analyzer,
+            "hits": self.n_hits,
+            "misses": self.n_misses,
+        }
+
+
+def add_cache_arguments(parser):
+    parser.add_argument(
+        "--lemma-cache",
+        default=None,
+        help="Reuse the rows of unchanged lemmas from this SQLite file, and cache the rows made (see `lemma_cache`).",
+    )
@@ -0,0 +1,140 @@
+"""Memory measurement, and projection of the footprint of loading the dumps before they are loaded.
+
+The in-memory path of the analyzers holds `words`, `words_forms`, `translations` and the
+part-of-speech tables at once as lists of dicts, which take 8-20 times the size of the CSVs. The
+footprint of a table is projected from a sample of its first rows, sized the way they will be held
+in memory (see `estimate_csv`), scaled by the size of the file. E.g.,
+
+    estimate_csv("russian_word_analyses/resources/words_forms.csv")  # {"rows": 226_184, "mb": 133.7}
+
+Measurements (see `profiling.StageProfiler`):
+
+    1. the resident set size (RSS) of the process and its peak so far (`get_rss_mb`, `get_max_rss_mb`);
+    2. with tracemalloc, the peak of the memory allocated by Python during each stage.
+"""
+
+import csv
+import io
+import os
+import sys
+from typing import Optional
+
+from compression import open_file, get_compression, resolve_path
+
+try:
+    import resource
+except ImportError:  # Windows.
+    resource = None
+
+
+MB = 1024 * 1024
+
+SAMPLE_ROWS = 1000
+LIST_SLOT_BYTES = 8
+
+# Peak memory of reading a JSON upload (the loaded list, while tokenizing it), by byte of the file.
+JSON_BYTES_FACTOR = 8.0
+
+# Peak memory of the analyzers on top of their inputs, measured with tracemalloc on the dumps
+# (with a margin), by row of the part-of-speech table, since the lemmas selected are a part of them.
+WORKING_SET_BYTES_PER_ROW = {
+    "nouns": 6_000,
+    "adjectives": 18_000,
+    "verbs": 2_500,
+}
+# The article index, by byte of the upload JSON.
+INDEX_BYTES_PER_ARTICLE_BYTE = 55
+# Out-of-core analyzers: a batch of lemmas, and the partner graph, by row of `words.csv`.
+OUT_OF_CORE_BYTES_PER_LEMMA = 24_000
+PARTNER_GRAPH_BYTES_PER_WORD = 200
+# Below this, the external sorts spill in so many runs that they are not worth it.
+MIN_MEMORY_LIMIT_MB = 16
+
+
+class MemoryBudgetError(RuntimeError):
+    """The projected footprint exceeds the memory budget, whatever the strategy."""
+
+
+def get_rss_mb() -> Optional[float]:
+    """The resident set size of the process, or None where /proc is unavailable."""
+
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            n_pages = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return n_pages * os.sysconf("SC_PAGE_SIZE") / MB
+
+
+def get_max_rss_mb() -> Optional[float]:
+    """The peak resident set size of the process so far."""
+
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return max_rss / MB if sys.platform == "darwin" else max_rss / 1024
+
+
+def get_row_size(row: dict) -> int:
+    """Bytes held by a row of `csv.DictReader` in a list.
+
+    The keys are shared by the rows, and so are the empty and one-character Latin-1 strings.
+    """
+
+    return sys.getsizeof(row) + LIST_SLOT_BYTES + sum(
+        sys.getsizeof(value)
+        for value in row.values()
+        if len(value) > 1 or (value and ord(value) > 0xFF)
+    )
+
+
+def get_data_size(fp: str) -> int:
+    """The size of the (decompressed) file."""
+
+    fp = resolve_path(fp)
+    if get_compression(fp) is None:
+        return os.path.getsize(fp)
+
+    size = 0
+    with open_file(fp, "rb") as f:
+        while True:
+            chunk = f.read(MB)
+            if not chunk:
+                return size
+            size += len(chunk)
+
+
+def estimate_csv(fp: str, n_sample_rows: int = SAMPLE_ROWS) -> dict:
+    """Project the number of rows and the memory of `IO.read_csv(fp)` from its first rows.
+
+    :return: {"rows":, "mb":}
+    """
+
+    lines = []
+    with open_file(fp, "rb") as f:
+        for line in f:
+            lines.append(line)
+            if len(lines) > n_sample_rows:
+                break
+
+    sample_bytes = sum(map(len, lines[1:]))
+    if sample_bytes == 0:
+        return {"rows": 0, "mb": 0.0}
+
+    rows = list(csv.DictReader(io.StringIO(b"".join(lines).decode("utf-8-sig"))))
+    data_bytes = get_data_size(fp) - len(lines[0])
+    scale = data_bytes / sample_bytes if len(lines) > n_sample_rows else 1.0
+    return {
+        "rows": round(len(rows) * scale),
+        "mb": sum(map(get_row_size, rows)) * scale / MB,
+    }
+
+
+def estimate_json_mb(fp: str) -> float:
+    """The peak memory of reading an upload JSON (see `IO.read_tokens`)."""
+
+    if not os.path.exists(resolve_path(fp)):
+        return 0.0
+    return get_data_size(fp) * JSON_BYTES_FACTOR / MB
+
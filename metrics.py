@@ -0,0 +1,457 @@
+"""Live metrics of a run, exported in the Prometheus text format to a file and an optional HTTP endpoint.
+
+Under cron, nobody watches the progress bars. While exporting is on (see `MetricsExporter`), the
+stages of the pipeline and of the analyzers (see `profiling.StageProfiler`) are recorded with the
+rows processed so far, counted by the loops through `count_rows` (and `progress.tqdm`), the
+diagnostics reported (see `diagnostics.Diagnostics`), the errors, and the RSS of the processes. E.g.,
+
+    russian_analysis_stage_running{analyzer="nouns",stage="assemble_analyses"} 1
+    russian_analysis_stage_rows_processed{analyzer="nouns",stage="assemble_analyses"} 120000
+    russian_analysis_stage_rows_per_second{analyzer="nouns",stage="assemble_analyses"} 85000.0
+    russian_analysis_stage_eta_seconds{analyzer="nouns",stage="assemble_analyses"} 2.9
+
+Every `interval` seconds, a background thread renders them to the file (replaced atomically, e.g.,
+for the textfile collector of the node exporter) and for the endpoint. The analyzers run in
+forked processes, which write their own records to a directory the exporter merges.
+
+When exporting is off, `count_rows` returns the iterable itself and the other hooks return at once.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Iterable, Optional
+
+from memory_budget import get_rss_mb, get_max_rss_mb, MB
+
+
+PREFIX = "russian_analysis"
+
+DEFAULT_INTERVAL_S = 5.0
+HOST = "127.0.0.1"
+PIPELINE_ANALYZER = "pipeline"  # The `analyzer` label of the stages of the pipeline itself.
+
+# Rows are added to the records in steps, to keep the loops fast.
+COUNT_STEP = 256
+
+METRICS = [
+    # (name, type, help)
+    ("stage_running", "gauge", "Whether the stage is running."),
+    ("stage_rows_processed", "gauge", "Rows processed by the stage so far."),
+    ("stage_rows_expected", "gauge", "Rows the stage is expected to process."),
+    ("stage_rows_per_second", "gauge", "Rows processed per second by the stage."),
+    ("stage_eta_seconds", "gauge", "Estimated seconds until the stage ends."),
+    ("stage_duration_seconds", "gauge", "Seconds since the stage started, or its duration once ended."),
+    ("diagnostics_total", "counter", "Diagnostics reported, by category."),
+    ("errors_total", "counter", "Stages that raised an error."),
+    ("process_resident_memory_bytes", "gauge", "Resident set size of the process."),
+    ("process_max_resident_memory_bytes", "gauge", "Peak resident set size of the process."),
+    ("run_start_time_seconds", "gauge", "Unix time the run started."),
+    ("last_update_time_seconds", "gauge", "Unix time the metrics were rendered."),
+]
+
+
+class _State:
+    """The records of this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}  # {(analyzer, stage): record}
+        self.diagnostics = {}  # {(analyzer, category): count}
+        self.errors = {}  # {(analyzer, stage): count}
+        self.local = threading.local()  # The stack of the records of the running stages of the thread.
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "pid": os.getpid(),
+                "stages": [dict(record) for record in self.stages.values()],
+                "diagnostics": [[analyzer, category, count] for (analyzer, category), count in self.diagnostics.items()],
+                "errors": [[analyzer, stage, count] for (analyzer, stage), count in self.errors.items()],
+                "rss_mb": get_rss_mb(),
+                "max_rss_mb": get_max_rss_mb(),
+            }
+
+
+_state = _State()
+_enabled = False
+_child_dir = None  # Where the forked processes write their records.
+_child_interval = DEFAULT_INTERVAL_S
+_is_child = False
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def start_stage(analyzer: str, stage: str, rows_expected: Optional[int] = None) -> Optional[dict]:
+    """Record a stage as running in this thread. Returns its record, for `end_stage`."""
+
+    if not _enabled:
+        return None
+
+    record = {
+        "analyzer": analyzer,
+        "stage": stage,
+        "running": True,
+        "rows": 0,
+        "rows_expected": rows_expected,
+        "start": time.time(),
+        "end": None,
+    }
+    with _state.lock:
+        _state.stages[(analyzer, stage)] = record
+    stack = getattr(_state.local, "stack", None)
+    if stack is None:
+        stack = _state.local.stack = []
+    stack.append(record)
+    return record
+
+
+def end_stage(record: Optional[dict], rows: Optional[int] = None, error: bool = False):
+    """:param rows: The rows processed, if more than counted (e.g., by a stage without loops over `count_rows`)."""
+
+    if record is None:
+        return
+
+    with _state.lock:
+        record["running"] = False
+        record["end"] = time.time()
+        if rows is not None and rows > record["rows"]:
+            record["rows"] = rows
+        if error:
+            key = (record["analyzer"], record["stage"])
+            _state.errors[key] = _state.errors.get(key, 0) + 1
+
+    stack = getattr(_state.local, "stack", [])
+    if record in stack:
+        stack.remove(record)
+
+
+def add_rows(n: int):
+    """Add rows processed to the innermost running stage of this thread."""
+
+    stack = getattr(_state.local, "stack", None)
+    if stack:
+        stack[-1]["rows"] += n
+
+
+def count_rows(iterable: Iterable) -> Iterable:
+    """Count the items of `iterable` as rows processed by the running stage, as they are consumed."""
+
+    if not _enabled:
+        return iterable
+    return _iter_counting(iterable)
+
+
+def _iter_counting(iterable):
+
+    n = 0
+    try:
+        for item in iterable:
+            yield item
+            n += 1
+            if n == COUNT_STEP:
+                add_rows(n)
+                n = 0
+    finally:
+        add_rows(n)
+
+
+def count_diagnostic(analyzer: str, category: str):
+
+    if not _enabled:
+        return
+    key = (analyzer, category)
+    with _state.lock:
+        _state.diagnostics[key] = _state.diagnostics.get(key, 0) + 1
+
+
+def flush():
+    """Write the records of this forked process for the exporter to merge (see `MetricsExporter`).
+
+    In the process of the exporter, there is nothing to do.
+    """
+
+    if not _enabled or not _is_child or _child_dir is None:
+        return
+
+    fp = os.path.join(_child_dir, f"{os.getpid()}.json")
+    fp_tmp = f"{fp}.{threading.get_ident()}.tmp"
+    with open(fp_tmp, "w", encoding="utf-8") as f:
+        json.dump(_state.to_dict(), f)
+    os.replace(fp_tmp, fp)
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(_child_interval)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _after_fork_in_child():
+    global _state, _is_child
+
+    # Another thread may have held the lock at the fork, and the records are the parent's.
+    _state = _State()
+    _is_child = True
+    if _enabled and _child_dir is not None:
+        threading.Thread(target=_flush_periodically, daemon=True).start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+##### Rendering #####
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_sample(name: str, labels: dict, value) -> str:
+    label_str = ",".join(f'{k}="{escape_label(v)}"' for k, v in labels.items())
+    return f"{PREFIX}_{name}{{{label_str}}} {value}" if label_str else f"{PREFIX}_{name} {value}"
+
+
+def get_stage_samples(record: dict, now: float) -> list:
+    """[(name, value)] of a stage record."""
+
+    end = record["end"] if record["end"] is not None else now
+    duration = max(end - record["start"], 0.0)
+    rows_per_s = record["rows"] / duration if duration > 0 else 0.0
+
+    samples = [
+        ("stage_running", int(record["running"])),
+        ("stage_rows_processed", record["rows"]),
+        ("stage_rows_per_second", round(rows_per_s, 3)),
+        ("stage_duration_seconds", round(duration, 3)),
+    ]
+    if record["rows_expected"] is not None:
+        samples.append(("stage_rows_expected", record["rows_expected"]))
+        if record["running"] and rows_per_s > 0:
+            samples.append(("stage_eta_seconds", round(max(record["rows_expected"] - record["rows"], 0) / rows_per_s, 3)))
+        elif not record["running"]:
+            samples.append(("stage_eta_seconds", 0))
+    return samples
+
+
+def render(snapshots: list, run_start: float, now: Optional[float] = None) -> str:
+    """The Prometheus text of the records of the processes (see `_State.to_dict`)."""
+
+    if now is None:
+        now = time.time()
+
+    # The latest record of each stage, e.g., of the last run in watch mode.
+    stages = {}
+    diagnostics = {}
+    errors = {}
+    for snapshot in snapshots:
+        for record in snapshot["stages"]:
+            key = (record["analyzer"], record["stage"])
+            if key not in stages or record["start"] >= stages[key]["start"]:
+                stages[key] = record
+        for analyzer, category, count in snapshot["diagnostics"]:
+            diagnostics[(analyzer, category)] = diagnostics.get((analyzer, category), 0) + count
+        for analyzer, stage, count in snapshot["errors"]:
+            errors[(analyzer, stage)] = errors.get((analyzer, stage), 0) + count
+
+    samples = {name: [] for name, _, _ in METRICS}
+    for (analyzer, stage), record in sorted(stages.items()):
+        for name, value in get_stage_samples(record, now):
+            samples[name].append(({"analyzer": analyzer, "stage": stage}, value))
+    for (analyzer, category), count in sorted(diagnostics.items()):
+        samples["diagnostics_total"].append(({"analyzer": analyzer, "category": category}, count))
+    for (analyzer, stage), count in sorted(errors.items()):
+        samples["errors_total"].append(({"analyzer": analyzer, "stage": stage}, count))
+    for snapshot in snapshots:
+        labels = {"pid": snapshot["pid"], "process": snapshot.get("process", "worker")}
+        if snapshot.get("rss_mb") is not None:
+            samples["process_resident_memory_bytes"].append((labels, round(snapshot["rss_mb"] * MB)))
+        if snapshot.get("max_rss_mb") is not None:
+            samples["process_max_resident_memory_bytes"].append((labels, round(snapshot["max_rss_mb"] * MB)))
+    samples["run_start_time_seconds"].append(({}, round(run_start, 3)))
+    samples["last_update_time_seconds"].append(({}, round(now, 3)))
+
+    lines = []
+    for name, metric_type, help_text in METRICS:
+        if not samples[name]:
+            continue
+        lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}_{name} {metric_type}")
+        lines.extend(format_sample(name, labels, value) for labels, value in samples[name])
+    return "\n".join(lines) + "\n"
+
+
+##### Export #####
+
+
+def is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MetricsExporter:
+    """Turn on the recording of the metrics, and render them every `interval` seconds from a background thread.
+
+    Usage:
+
+        with MetricsExporter(fp="metrics/pipeline.prom", port=9108):
+            run_pipeline(...)
+
+    :param fp: The Prometheus text file, e.g., in the directory of the textfile collector.
+    :param port: Also serve the metrics at http://127.0.0.1:<port>/metrics.
+    """
+
+    def __init__(self, fp: Optional[str] = None, port: Optional[int] = None, interval: float = DEFAULT_INTERVAL_S):
+
+        self.fp = fp
+        self.port = port
+        self.interval = interval
+
+        self.run_start = None
+        self.text = ""
+        self.child_dir = None
+        self.finished = []  # The last records of the forked processes that exited.
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        global _enabled, _child_dir, _child_interval
+
+        # Imported on first use, as tempfile slows down importing the analyzers.
+        import tempfile
+
+        self.run_start = time.time()
+        self.child_dir = tempfile.mkdtemp(prefix="metrics.")
+        _child_dir = self.child_dir
+        _child_interval = self.interval
+        _enabled = True
+
+        if self.port is not None:
+            self._start_server()
+
+        self.update()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        global _enabled, _child_dir
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.update()  # The final values, e.g., the durations and rates of all stages.
+
+        _enabled = False
+        _child_dir = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for name in os.listdir(self.child_dir):
+            os.remove(os.path.join(self.child_dir, name))
+        os.rmdir(self.child_dir)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.update()
+            except Exception as e:  # Metrics must not stop the run.
+                print(f"Metrics: {e!r}")
+
+    def get_snapshots(self) -> list:
+
+        snapshot = _state.to_dict()
+        snapshot["process"] = PIPELINE_ANALYZER
+        snapshots = [snapshot]
+
+        for name in sorted(os.listdir(self.child_dir)):
+            if not name.endswith(".json"):
+                continue
+            fp = os.path.join(self.child_dir, name)
+            try:
+                with open(fp, encoding="utf-8") as f:
+                    child = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if is_alive(child["pid"]):
+                snapshots.append(child)
+            else:
+                # Keep its records, without the memory of a process that is gone.
+                self.finished.append({**child, "rss_mb": None, "max_rss_mb": None})
+                os.remove(fp)
+
+        return snapshots + self.finished
+
+    def update(self):
+
+        self.text = render(self.get_snapshots(), run_start=self.run_start)
+        if self.fp is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.fp)), exist_ok=True)
+            with open(f"{self.fp}.tmp", "w", encoding="utf-8") as f:
+                f.write(self.text)
+            os.replace(f"{self.fp}.tmp", self.fp)
+
+    def _start_server(self):
+        # Imported on first use, as http.server slows down importing.
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = exporter.text.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((HOST, self.port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument(
+        "--metrics-file",
+        default=None,
+        help="Write live metrics of the run (stages, rows/s, ETA, diagnostics, RSS) in the Prometheus text format to this path.",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=None,
+        help=f"Also serve the metrics at http://{HOST}:<port>/metrics.",
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        default=DEFAULT_INTERVAL_S,
+        help="Seconds between updates of the metrics.",
+    )
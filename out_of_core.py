@@ -0,0 +1,193 @@
+"""Out-of-core reading of the resource dumps: one complete lemma record at a time.
+
+The analyzers need all forms of a lemma together, so the in-memory path loads the whole dumps and
+groups them in dicts keyed by word id. Here, the rows of the selected lemmas are streamed from
+`words.csv`, the part-of-speech table (e.g., `nouns.csv`), `words_forms.csv` and `translations.csv`,
+external-sorted by word id in bounded-memory runs (see `external_sort`), and merge-joined into one
+record per lemma. E.g.,
+
+    for record in iter_lemma_records("russian_word_analyses/resources", "nouns", word_ids=nom_sg_ids):
+        record  # {"word_id":, "words": [row], "nouns": [row], "words_forms": [row], "translations": [row]}
+
+The sorts of the tables keep their last run in memory instead of spilling it, and the analyzers
+sort their output rows while those are still held, so `memory_limit_mb` is split between the two
+(see `split_memory_limit`). Peak memory is then bounded by about `memory_limit_mb`, the selected
+word ids, the partner graph and the batch being analyzed, whatever the size of the dumps.
+"""
+
+import os
+from itertools import groupby
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from IO import iter_csv
+from external_sort import external_sort
+
+
+DEFAULT_MEMORY_LIMIT_MB = 256
+DEFAULT_BATCH_SIZE = 1000
+# The part of the memory limit of an analyzer for sorting its output rows.
+OUTPUT_SORT_SHARE = 0.5
+
+WORDS_NAME = "words"
+WORDS_FORMS_NAME = "words_forms"
+TRANSLATIONS_NAME = "translations"
+
+# The word id column of each table.
+KEY_COLUMNS = {
+    WORDS_NAME: "id",
+    WORDS_FORMS_NAME: "word_id",
+    TRANSLATIONS_NAME: "word_id",
+}
+DEFAULT_KEY_COLUMN = "word_id"  # The part-of-speech tables.
+
+
+def get_word_id_key(key_column: str):
+    """Word ids are compared as integers, as in the dumps."""
+    return lambda row: int(row[key_column])
+
+
+class CsvStream:
+    """A re-iterable view of a CSV that streams its rows on every iteration instead of loading them.
+
+    Can be passed to the analyzers in place of the lists from `IO.read_csv`.
+    """
+
+    def __init__(self, fp: str):
+        self.fp = fp
+        self._len = None
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter_csv(self.fp)
+
+    def __len__(self) -> int:
+        if self._len is None:
+            self._len = sum(1 for _ in iter_csv(self.fp))
+        return self._len
+
+
+def iter_sorted_rows(
+        fp: str,
+        key_column: str,
+        word_ids: Optional[set] = None,
+        max_bytes_in_memory: Optional[int] = None,
+        tmp_dir: Optional[str] = None,
+) -> Iterator[dict]:
+    """Stream the rows of the selected word ids, sorted by word id."""
+
+    rows = iter_csv(fp)
+    if word_ids is not None:
+        rows = (row for row in rows if row[key_column] in word_ids)
+
+    return external_sort(
+        rows,
+        key=get_word_id_key(key_column),
+        tmp_dir=tmp_dir,
+        max_bytes_in_memory=max_bytes_in_memory,
+    )
+
+
+def iter_lemma_records(
+        resources_dir: str,
+        pos_name: str,
+        word_ids: Optional[set] = None,
+        memory_limit_mb: float = DEFAULT_MEMORY_LIMIT_MB,
+        tmp_dir: Optional[str] = None,
+) -> Iterator[dict]:
+    """Yield one record per lemma with all its rows, in the order of word ids.
+
+    :param resources_dir: E.g., "russian_word_analyses/resources"
+    :param pos_name: The part-of-speech table, e.g., "nouns".
+    :param word_ids: The lemmas to read. All lemmas in `words.csv` if not given.
+    :param memory_limit_mb: Memory for the sorts, split evenly between the tables.
+    :return: {"word_id":, "words": [row], pos_name: [row], "words_forms": [row], "translations": [row]}
+    """
+
+    names = [WORDS_NAME, pos_name, WORDS_FORMS_NAME, TRANSLATIONS_NAME]
+    max_bytes_in_memory = int(memory_limit_mb * 1024 * 1024 / len(names))
+
+    groups = {}
+    for name in names:
+        key_column = KEY_COLUMNS.get(name, DEFAULT_KEY_COLUMN)
+        rows = iter_sorted_rows(
+            fp=os.path.join(resources_dir, f"{name}.csv"),
+            key_column=key_column,
+            word_ids=word_ids,
+            max_bytes_in_memory=max_bytes_in_memory,
+            tmp_dir=tmp_dir,
+        )
+        groups[name] = groupby(rows, key=get_word_id_key(key_column))
+
+    # The next group of each table that has not been joined yet.
+    pending = {name: next(groups[name], None) for name in names}
+
+    # Every lemma has a row in `words`, so it drives the join.
+    while pending[WORDS_NAME] is not None:
+        word_id, word_rows = pending[WORDS_NAME]
+
+        record = {
+            "word_id": str(word_id),
+            WORDS_NAME: list(word_rows),
+        }
+        for name in names[1:]:
+            # Skip the rows of word ids missing from `words`.
+            while pending[name] is not None and pending[name][0] < word_id:
+                pending[name] = next(groups[name], None)
+
+            if pending[name] is not None and pending[name][0] == word_id:
+                record[name] = list(pending[name][1])
+                pending[name] = next(groups[name], None)
+            else:
+                record[name] = []
+
+        pending[WORDS_NAME] = next(groups[WORDS_NAME], None)
+        yield record
+
+
+def split_memory_limit(memory_limit_mb: float) -> Tuple[float, float]:
+    """(MB for the sorts of the tables, MB for the sort of the output rows) of an analyzer.
+
+    The output rows are sorted while the last runs of the sorts of the tables are still held.
+    """
+
+    output_mb = memory_limit_mb * OUTPUT_SORT_SHARE
+    return memory_limit_mb - output_mb, output_mb
+
+
+def iter_batches(records: Iterable[dict], batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[List[dict]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def concat_tables(batch: List[dict], name: str) -> List[dict]:
+    """The rows of a table for a batch of lemma records, e.g., to pass to `get_noun_analyses`."""
+    return [
+        row
+        for record in batch
+        for row in record[name]
+    ]
+
+
+def add_out_of_core_arguments(parser):
+    parser.add_argument(
+        "--out-of-core",
+        action="store_true",
+        help="Stream the dumps and analyze one batch of lemmas at a time instead of loading them into memory.",
+    )
+    parser.add_argument(
+        "--memory-limit-mb",
+        type=float,
+        default=DEFAULT_MEMORY_LIMIT_MB,
+        help="With --out-of-core, the memory for external sorting, shared by the sorts of an analyzer.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="With --out-of-core, the number of lemmas analyzed at a time.",
+    )
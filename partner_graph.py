@@ -0,0 +1,329 @@
+"""A graph of lexical partners (e.g., актёр/актриса, делать/сделать) over word ids.
+
+`nouns.csv` and `verbs.csv` name the partners of a lemma in their `partner` column as strings,
+bare or accented (e.g., "актри'са", "адвока́тша"), which have to be looked up in `words.csv`
+before they can be followed. Here they are resolved once to the word ids of the same type, and
+the (symmetric) adjacency is stored as CSR arrays: the neighbours of node `i` are
+`indices[indptr[i]:indptr[i + 1]]`. E.g.,
+
+    partner_graph = build_partner_graph(words=words, pos_rows=nouns, word_type="noun", attribute_columns=["gender"])
+    partner_graph.neighbours("42")  # ["43"]
+    partner_graph.connected_component("42")  # ["42", "43"]
+    partner_graph.get_attributes("43")  # {"gender": "f"}
+
+The rows can also be added one at a time with `PartnerGraphBuilder`, during scans over the tables
+that are done anyway (see `analyze_verbs`).
+"""
+
+import argparse
+import os
+import re
+import sys
+from array import array
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+from utils import remove_accent_mark
+
+
+COMBINING_ACUTE_ACCENT = "\u0301"
+PARTNER_SEPARATORS = re.compile(r"[;,]")
+
+# The word type in `words.csv` of the lemmas in each part-of-speech table.
+WORD_TYPES = {
+    "nouns": "noun",
+    "verbs": "verb",
+}
+# Partner attributes checked by the analyzers.
+ATTRIBUTE_COLUMNS = {
+    "nouns": ["gender", "animate"],
+    "verbs": ["aspect"],
+}
+
+
+def normalize_partner(partner: str) -> str:
+    """The bare form of a partner, e.g., "актри'са" and "актри́са" -> "актриса"."""
+    return remove_accent_mark(partner).replace(COMBINING_ACUTE_ACCENT, "").strip()
+
+
+def split_partners(partner: str) -> List[str]:
+    """The bare forms of the partners in a `partner` cell, e.g., "сделать; поделать"."""
+    return [
+        bare
+        for bare in map(normalize_partner, PARTNER_SEPARATORS.split(partner or ""))
+        if bare
+    ]
+
+
+class PartnerGraph:
+
+    def __init__(self, word_ids: List[str], indptr: array, indices: array, attributes: List[tuple], attribute_columns: List[str], unresolved: Dict[str, List[str]]):
+        """Use `PartnerGraphBuilder` or `build_partner_graph`.
+
+        :param word_ids: The word id of each node.
+        :param indptr: CSR row pointers, of length len(word_ids) + 1.
+        :param indices: CSR column indices, i.e., the nodes of the neighbours.
+        :param attributes: The values of `attribute_columns` of each node, None if not in the table.
+        :param unresolved: {word_id: [partners]} of the partners not found in `words.csv`.
+        """
+
+        self.word_ids = word_ids
+        self.indptr = indptr
+        self.indices = indices
+        self.attributes = attributes
+        self.attribute_columns = attribute_columns
+        self.unresolved = unresolved
+
+        self.node_of = {word_id: node for node, word_id in enumerate(word_ids)}
+        self._component_of = None
+
+    def __len__(self) -> int:
+        return len(self.word_ids)
+
+    def __contains__(self, word_id: str) -> bool:
+        return word_id in self.node_of
+
+    @property
+    def n_edges(self) -> int:
+        """Undirected edges."""
+        return len(self.indices) // 2
+
+    def _neighbour_nodes(self, node: int):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def neighbours(self, word_id: str) -> List[str]:
+        """The word ids of the partners of a lemma, in the order of word ids."""
+
+        node = self.node_of.get(word_id)
+        if node is None:
+            return []
+        return [self.word_ids[neighbour] for neighbour in self._neighbour_nodes(node)]
+
+    def degree(self, word_id: str) -> int:
+        node = self.node_of.get(word_id)
+        if node is None:
+            return 0
+        return self.indptr[node + 1] - self.indptr[node]
+
+    def get_attributes(self, word_id: str) -> Optional[dict]:
+        node = self.node_of.get(word_id)
+        if node is None or self.attributes[node] is None:
+            return None
+        return dict(zip(self.attribute_columns, self.attributes[node]))
+
+    def get_unresolved(self, word_id: str) -> List[str]:
+        return self.unresolved.get(word_id, [])
+
+    def _get_component_of(self) -> array:
+        """The component of each node, labelled by its smallest node, by union-find over the edges."""
+
+        if self._component_of is not None:
+            return self._component_of
+
+        parent = array("l", range(len(self.word_ids)))
+
+        def find(node):
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]  # Path halving.
+                node = parent[node]
+            return node
+
+        for node in range(len(self.word_ids)):
+            for neighbour in self._neighbour_nodes(node):
+                root, root_of_neighbour = find(node), find(neighbour)
+                if root != root_of_neighbour:
+                    parent[max(root, root_of_neighbour)] = min(root, root_of_neighbour)
+
+        self._component_of = array("l", map(find, range(len(self.word_ids))))
+        return self._component_of
+
+    def component_id(self, word_id: str) -> Optional[str]:
+        """The smallest node's word id of the component of a lemma, shared by all lemmas in it."""
+
+        node = self.node_of.get(word_id)
+        if node is None:
+            return None
+        return self.word_ids[self._get_component_of()[node]]
+
+    def connected_component(self, word_id: str) -> List[str]:
+        """The word ids of all lemmas reachable from a lemma through partners, itself included."""
+
+        node = self.node_of.get(word_id)
+        if node is None:
+            return []
+
+        # A breadth-first search only visits the component.
+        visited = {node}
+        queue = deque([node])
+        while queue:
+            for neighbour in self._neighbour_nodes(queue.popleft()):
+                if neighbour not in visited:
+                    visited.add(neighbour)
+                    queue.append(neighbour)
+
+        return [self.word_ids[node] for node in sorted(visited)]
+
+    def components(self, min_size: int = 2) -> List[List[str]]:
+        """The components of at least `min_size` lemmas, e.g., all partner pairs by default."""
+
+        members = {}
+        for node, component in enumerate(self._get_component_of()):
+            members.setdefault(component, []).append(self.word_ids[node])
+
+        return [
+            word_ids
+            for _, word_ids in sorted(members.items())
+            if len(word_ids) >= min_size
+        ]
+
+
+class PartnerGraphBuilder:
+    """Collect the rows of `words.csv` and of a part-of-speech table, in any order, then `build`."""
+
+    def __init__(self, word_type: str, attribute_columns: Iterable[str] = ()):
+        """
+        :param word_type: E.g., "noun". Partners are only resolved to words of this type.
+        :param attribute_columns: Columns of the part-of-speech table kept for each lemma, e.g., ["gender"].
+        """
+
+        self.word_type = word_type
+        self.attribute_columns = list(attribute_columns)
+
+        self._bare2ids = {}
+        self._partners = {}  # {word_id: [partners]}
+        self._attributes = {}
+
+    def add_word(self, row: dict):
+        """Add a row of `words.csv`."""
+
+        if row["type"] != self.word_type:
+            return
+        self._bare2ids.setdefault(row["bare"], []).append(row["id"])
+
+    def add_lemma(self, row: dict):
+        """Add a row of the part-of-speech table, e.g., `nouns.csv`."""
+
+        word_id = row["word_id"]
+        self._attributes[word_id] = tuple(row[column] for column in self.attribute_columns)
+
+        partners = split_partners(row["partner"])
+        if partners:
+            self._partners[word_id] = partners
+
+    def build(self) -> PartnerGraph:
+
+        word_ids = set(self._attributes)
+        edges = set()
+        unresolved = {}
+        for word_id, partners in self._partners.items():
+            for partner in partners:
+                partner_ids = self._bare2ids.get(partner)
+                if not partner_ids:
+                    unresolved.setdefault(word_id, []).append(partner)
+                    continue
+
+                # Homographs are all linked.
+                for partner_id in partner_ids:
+                    if partner_id == word_id:
+                        continue
+                    word_ids.add(partner_id)
+                    edges.add((word_id, partner_id))
+                    edges.add((partner_id, word_id))
+
+        word_ids = sorted(word_ids, key=int)
+        node_of = {word_id: node for node, word_id in enumerate(word_ids)}
+
+        # Sorting the directed edges groups them by their source, i.e., the rows of the CSR.
+        edges = sorted((node_of[u], node_of[v]) for u, v in edges)
+        indptr = array("l", [0] * (len(word_ids) + 1))
+        for u, _ in edges:
+            indptr[u + 1] += 1
+        for node in range(len(word_ids)):
+            indptr[node + 1] += indptr[node]
+        indices = array("l", (v for _, v in edges))
+
+        return PartnerGraph(
+            word_ids=word_ids,
+            indptr=indptr,
+            indices=indices,
+            attributes=[self._attributes.get(word_id) for word_id in word_ids],
+            attribute_columns=self.attribute_columns,
+            unresolved=unresolved,
+        )
+
+
+def build_partner_graph(words: Iterable[dict], pos_rows: Iterable[dict], word_type: str, attribute_columns: Iterable[str] = ()) -> PartnerGraph:
+    """Build a partner graph in one pass over each table.
+
+    :param words: The rows of `words.csv`.
+    :param pos_rows: The rows of the part-of-speech table, e.g., `nouns.csv`.
+    :param word_type: E.g., "noun".
+    """
+
+    builder = PartnerGraphBuilder(
+        word_type=word_type,
+        attribute_columns=attribute_columns,
+    )
+    for row in words:
+        builder.add_word(row)
+    for row in pos_rows:
+        builder.add_lemma(row)
+    return builder.build()
+
+
+def main(args) -> int:
+
+    from out_of_core import CsvStream
+
+    word_type = WORD_TYPES[args.pos]
+    words = CsvStream(os.path.join(args.resources_dir, "words.csv"))
+    partner_graph = build_partner_graph(
+        words=words,
+        pos_rows=CsvStream(os.path.join(args.resources_dir, f"{args.pos}.csv")),
+        word_type=word_type,
+        attribute_columns=ATTRIBUTE_COLUMNS[args.pos],
+    )
+
+    components = partner_graph.components()
+    print(
+        f"#lemmas: {len(partner_graph):,}, "
+        f"#edges: {partner_graph.n_edges:,}, "
+        f"#components (>= 2 lemmas): {len(components):,}, "
+        f"#largest component: {max(map(len, components), default=0):,}, "
+        f"#lemmas with unresolved partners: {len(partner_graph.unresolved):,}"
+    )
+
+    if not args.words:
+        return 0
+
+    # Word ids are also accepted.
+    bare2ids = {}
+    for row in words:
+        if row["type"] == word_type:
+            bare2ids.setdefault(row["bare"], []).append(row["id"])
+
+    for word in args.words:
+        for word_id in bare2ids.get(normalize_partner(word), [word]):
+            if word_id not in partner_graph:
+                print(f"{word}: not found")
+                continue
+            print(
+                f"{word} ({word_id}, {partner_graph.get_attributes(word_id)}): "
+                f"partners {partner_graph.neighbours(word_id)}, "
+                f"component {partner_graph.connected_component(word_id)}, "
+                f"unresolved {partner_graph.get_unresolved(word_id)}"
+            )
+
+    return 0
+
+
+def parse_args(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("words", nargs="*", help="Bare forms or word ids to look up.")
+    parser.add_argument("--resources-dir", default="russian_word_analyses/resources")
+    parser.add_argument("--pos", choices=sorted(WORD_TYPES), default="nouns")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main(parse_args()))
@@ -0,0 +1,1060 @@
+"""Run the noun, adjective and verb analyzers as one DAG over a shared load.
+
+Stages:
+
+    read_tokens, read_verb_tokens, read_{words|words_forms|translations|nouns|adjectives|verbs}
+        -> analyze_nouns, analyze_adjectives, analyze_verbs (each writes its outputs)
+    read_words, read_words_forms -> index_articles (updates the article index, see `article_index`)
+
+The resources are loaded once, with independent loads running concurrently on a thread pool.
+The analyzers are CPU-bound, so they run on a pool of forked processes that inherit the loaded
+resources instead of receiving a pickled copy; where fork is unavailable, threads are used.
+Total wall time is then close to the load plus the slowest analyzer.
+
+Each stage has a fingerprint computed from the files it reads, the code it runs and the
+fingerprints of its dependencies. A stage whose fingerprint and outputs are unchanged since the
+last run (recorded in the state file) is skipped, and so are the loads nobody needs anymore.
+
+With `--watch`, the pipeline keeps running and re-runs the stages invalidated by edits of their
+files or code, keeping the loaded resources in memory (see `watch`).
+
+With `--memory-budget`, the peak memory is projected before anything is loaded, from samples of
+the dumps (see `project_memory`). If it is over budget, the stages stream the dumps out of core
+instead of loading them (see `out_of_core`); if that is still over budget,
+the pipeline stops before loading with the projected parts. The peak RSS of the process running
+each stage is reported, which includes what ran before the stage in that process; the peak of
+each stage alone is traced with `--track-memory`.
+
+With `--metrics-file` or `--metrics-port`, the running stages, their rows processed, rates and
+ETAs, the diagnostics, errors and RSS are exported live in the Prometheus text format (see `metrics`).
+
+With `--lemma-cache`, the noun and adjective analyzers reuse the rows of the lemmas unchanged
+since the last run (see `lemma_cache`), so that a stage invalidated by a few edited lemmas
+re-analyzes only those.
+
+With `--snapshot-store`, the outputs of the analyzers that ran are also kept as a new version in
+a deduplicated snapshot store (see `snapshot_store`).
+
+Usage:
+
+    python pipeline.py --resources-dir russian_word_analyses/resources --uploads-dir uploads \\
+        --output-dir russian_word_analyses/files
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, List, Dict, Optional, Sequence
+
+import analyze_adjectives
+import analyze_nouns
+import analyze_verbs
+import article_index
+import metrics
+from IO import read_csv, read_json, read_tokens, CSV_BACKEND_CSV, CSV_BACKENDS
+from analysis_stats import AnalysisStats
+from diagnostics import Diagnostics
+from fixes import FP_LEMMA_FIXES
+from lemma_cache import LemmaCache
+from memory_budget import (
+    MemoryBudgetError,
+    estimate_csv,
+    estimate_json_mb,
+    get_data_size,
+    get_max_rss_mb,
+    get_rss_mb,
+    MB,
+    WORKING_SET_BYTES_PER_ROW,
+    INDEX_BYTES_PER_ARTICLE_BYTE,
+    OUT_OF_CORE_BYTES_PER_LEMMA,
+    PARTNER_GRAPH_BYTES_PER_WORD,
+    MIN_MEMORY_LIMIT_MB,
+)
+from out_of_core import CsvStream, add_out_of_core_arguments, DEFAULT_MEMORY_LIMIT_MB, DEFAULT_BATCH_SIZE
+from profiling import StageProfiler
+
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+RESOURCE_NAMES = ["words", "words_forms", "translations", "nouns", "adjectives", "verbs"]
+
+# The modules each stage imports, directly or not.
+READ_CODE = ["IO.py", "fast_csv.py", "compression.py"]
+IO_CODE = READ_CODE + ["utils.py"]
+ANALYZER_CODE = IO_CODE + [
+    "diagnostics.py", "profiling.py", "progress.py", "metrics.py", "memory_budget.py", "out_of_core.py", "external_sort.py",
+]
+COMMON_CODE = ANALYZER_CODE + [
+    "russian_word.py", "russian_case.py", "russian_gender.py", "russian_number.py", "analysis_stats.py", "fixes.py", "lemma_cache.py",
+]
+NOUN_CODE = COMMON_CODE + ["analyze_nouns.py", "noun_analyses/russian_noun.py", "partner_graph.py"]
+ADJECTIVE_CODE = COMMON_CODE + ["analyze_adjectives.py", "adjective_analyses/russian_adjective.py"]
+VERB_CODE = ANALYZER_CODE + ["analyze_verbs.py", "partner_graph.py"]
+ARTICLE_INDEX_CODE = IO_CODE + ["article_index.py"]
+
+# The analyzers that can stream the dumps instead of loading them, and the tables they read.
+OUT_OF_CORE_RESOURCE_NAMES = {
+    "analyze_nouns": ["words", "words_forms", "translations", "nouns"],
+    "analyze_adjectives": ["words", "words_forms", "translations", "adjectives"],
+}
+# The other stages that, out of core, stream the tables they read (see `out_of_core.CsvStream`).
+STREAMED_RESOURCE_NAMES = {
+    "analyze_verbs": ["verbs", "words", "words_forms"],
+    "index_articles": ["words", "words_forms"],
+}
+
+DEFAULT_FP_STATE = ".pipeline_state.json"
+
+# Watch mode.
+DEFAULT_WATCH_INTERVAL = 1.0
+# Modules run by the stages, which are re-imported when their code changes.
+STAGE_MODULES = ["analyze_nouns", "analyze_adjectives", "analyze_verbs", "article_index"]
+# Code whose names are imported into this module, so that changes need a restart.
+NOT_RELOADED_CODE = [
+    "IO.py", "fast_csv.py", "analysis_stats.py", "diagnostics.py", "fixes.py", "lemma_cache.py", "memory_budget.py",
+    "metrics.py", "out_of_core.py", "profiling.py",
+]
+
+
+class PipelineConfig:
+
+    def __init__(
+            self,
+            resources_dir: str = "russian_word_analyses/resources",
+            uploads_dir: str = "uploads",
+            output_dir: str = "russian_word_analyses/files",
+            duolingo_only_articles: bool = True,
+            verbose: bool = False,
+            csv_backend: str = CSV_BACKEND_CSV,
+            lemma_cache: Optional[str] = None,
+            out_of_core: bool = False,
+            memory_limit_mb: float = DEFAULT_MEMORY_LIMIT_MB,
+            batch_size: int = DEFAULT_BATCH_SIZE,
+            track_memory: bool = False,
+    ):
+        """
+        :param out_of_core: Run the analyzers of `OUT_OF_CORE_RESOURCE_NAMES` out of core (see `out_of_core`),
+            and the stages of `STREAMED_RESOURCE_NAMES` on streams of the tables, so that no table is loaded.
+        :param memory_limit_mb: With `out_of_core`, the memory for the external sorts of each analyzer.
+        :param track_memory: Trace the peak memory of the stages of the analyzers (see `profiling.StageProfiler`).
+        """
+        self.resources_dir = resources_dir
+        self.uploads_dir = uploads_dir
+        self.output_dir = output_dir
+        self.duolingo_only_articles = duolingo_only_articles
+        self.verbose = verbose
+        self.csv_backend = csv_backend
+        self.lemma_cache = lemma_cache
+        self.out_of_core = out_of_core
+        self.memory_limit_mb = memory_limit_mb
+        self.batch_size = batch_size
+        self.track_memory = track_memory
+
+    def resource(self, name: str) -> str:
+        return os.path.join(self.resources_dir, f"{name}.csv")
+
+    def upload(self, name: str) -> str:
+        return os.path.join(self.uploads_dir, f"{name}.ru.json")
+
+    def output(self, name: str) -> str:
+        return os.path.join(self.output_dir, name)
+
+
+class PipelineStage:
+    """A node of the pipeline DAG.
+
+    `run(config, results)` gets the outputs of the dependencies in `results` and returns the
+    output of the stage. Stages with `in_process` are CPU-bound and run on the process pool;
+    their outputs must be small, since they are sent back to the parent.
+
+    `estimate_memory(config)` projects the memory (MB) the stage holds, before anything is
+    loaded: its output for the loads, its working set for the analyzers (see `project_memory`).
+    """
+
+    def __init__(
+            self,
+            name: str,
+            run: Callable[[PipelineConfig, dict], object],
+            deps: Sequence[str] = (),
+            files: Sequence[str] = (),
+            code: Sequence[str] = (),
+            in_process: bool = False,
+            estimate_memory: Optional[Callable[[PipelineConfig], float]] = None,
+    ):
+        self.name = name
+        self.run = run
+        self.deps = list(deps)
+        self.files = list(files)
+        self.code = [os.path.join(ROOT_DIR, fp) for fp in code]
+        self.in_process = in_process
+        self.estimate_memory = estimate_memory
+
+
+def get_file_signature(fp: str) -> list:
+    if not os.path.exists(fp):
+        return [fp, None, None]
+    stat = os.stat(fp)
+    return [fp, stat.st_size, stat.st_mtime_ns]
+
+
+def get_fingerprints(stages: Dict[str, PipelineStage]) -> Dict[str, str]:
+
+    fingerprints = {}
+
+    def fingerprint(name):
+        if name not in fingerprints:
+            stage = stages[name]
+            fingerprints[name] = hashlib.sha256(json.dumps([
+                name,
+                [get_file_signature(fp) for fp in stage.files],
+                [get_file_signature(fp) for fp in stage.code],
+                [fingerprint(dep) for dep in stage.deps],
+            ]).encode("utf-8")).hexdigest()
+        return fingerprints[name]
+
+    for name in stages:
+        fingerprint(name)
+    return fingerprints
+
+
+def get_generations(stages: Dict[str, PipelineStage], names: set) -> List[List[str]]:
+    """Group the stages into generations, each depending only on the earlier ones.
+
+    Dependencies not in `names` (e.g., kept in memory) are taken as done.
+    """
+
+    generations = []
+    done = set()
+    while len(done) < len(names):
+        generation = [
+            name
+            for name in names
+            if name not in done and all(dep in done or dep not in names for dep in stages[name].deps)
+        ]
+        if not generation:
+            raise ValueError(f"The pipeline has a cycle among {sorted(names - done)}.")
+        generations.append(sorted(generation))
+        done.update(generation)
+    return generations
+
+
+##### Stages #####
+
+
+def run_read_tokens(config, results):
+    return read_tokens(
+        fp_words=config.upload("words"),
+        fp_articles=config.upload("articles"),
+        duolingo_only_articles=config.duolingo_only_articles,
+    )
+
+
+def run_read_verb_tokens(config, results):
+    return read_tokens(
+        fp_words=config.upload("words"),
+        fp_articles=None,
+    )
+
+
+def make_run_read_csv(name):
+    def run_read_csv(config, results):
+        return read_csv(
+            fp=config.resource(name),
+            backend=config.csv_backend,
+        )
+    return run_read_csv
+
+
+def estimate_read_tokens_mb(config):
+    return estimate_json_mb(config.upload("words")) + estimate_json_mb(config.upload("articles"))
+
+
+def estimate_read_verb_tokens_mb(config):
+    return estimate_json_mb(config.upload("words"))
+
+
+def make_estimate_read_csv_mb(name):
+    def estimate_read_csv_mb(config):
+        return estimate_csv(config.resource(name))["mb"]
+    return estimate_read_csv_mb
+
+
+def make_estimate_analyzer_mb(name, pos_name):
+    def estimate_analyzer_mb(config):
+        if config.out_of_core and name in OUT_OF_CORE_RESOURCE_NAMES:
+            # The sorts share `memory_limit_mb` (see `out_of_core.split_memory_limit`).
+            return config.memory_limit_mb + (
+                config.batch_size * OUT_OF_CORE_BYTES_PER_LEMMA
+                + estimate_csv(config.resource("words"))["rows"] * PARTNER_GRAPH_BYTES_PER_WORD
+            ) / MB
+        return estimate_csv(config.resource(pos_name))["rows"] * WORKING_SET_BYTES_PER_ROW[pos_name] / MB
+    return estimate_analyzer_mb
+
+
+def estimate_index_articles_mb(config):
+    fp_articles = config.upload("articles")
+    if not os.path.exists(fp_articles):
+        return 0.0
+    return estimate_json_mb(fp_articles) + get_data_size(fp_articles) * INDEX_BYTES_PER_ARTICLE_BYTE / MB
+
+
+def open_lemma_cache(config, analyzer: str, code_modules: Sequence[str]) -> Optional[LemmaCache]:
+    if config.lemma_cache is None:
+        return None
+    return LemmaCache(fp=config.lemma_cache, analyzer=analyzer, code_modules=code_modules)
+
+
+def run_analyze_nouns(config, results):
+    profiler = StageProfiler(name="nouns", track_memory=config.track_memory)
+    diagnostics = Diagnostics(name="nouns", echo=config.verbose)
+    stats = AnalysisStats(name="nouns", groups=analyze_nouns.STATS_GROUPS)
+    cache = open_lemma_cache(config, analyzer="nouns", code_modules=analyze_nouns.CACHE_CODE_MODULES)
+    fp_analyses = config.output("noun_analyses.csv")
+    if config.out_of_core:
+        analyze_nouns.main_out_of_core(
+            tokens=results["read_tokens"],
+            resources_dir=config.resources_dir,
+            fp_analyses=fp_analyses,
+            memory_limit_mb=config.memory_limit_mb,
+            batch_size=config.batch_size,
+            profiler=profiler,
+            diagnostics=diagnostics,
+            stats=stats,
+            cache=cache,
+        )
+    else:
+        analyze_nouns.main(
+            tokens=results["read_tokens"],
+            nouns=results["read_nouns"],
+            words=results["read_words"],
+            words_forms=results["read_words_forms"],
+            translations=results["read_translations"],
+            fp_analyses=fp_analyses,
+            profiler=profiler,
+            diagnostics=diagnostics,
+            stats=stats,
+            cache=cache,
+        )
+    if cache is not None:
+        cache.close()
+    return {
+        "outputs": [fp_analyses],
+        "profile": profiler.report(),
+        "diagnostics": diagnostics.summary(),
+        "stats": stats.summary(),
+        "lemma_cache": cache.summary() if cache is not None else None,
+    }
+
+
+def run_analyze_adjectives(config, results):
+    profiler = StageProfiler(name="adjectives", track_memory=config.track_memory)
+    diagnostics = Diagnostics(name="adjectives", echo=config.verbose)
+    stats = AnalysisStats(name="adjectives", groups=analyze_adjectives.STATS_GROUPS)
+    cache = open_lemma_cache(config, analyzer="adjectives", code_modules=analyze_adjectives.CACHE_CODE_MODULES)
+    fp_analyses = config.output("adjective_analyses.csv")
+    if config.out_of_core:
+        analyze_adjectives.main_out_of_core(
+            tokens=results["read_tokens"],
+            resources_dir=config.resources_dir,
+            fp_analyses=fp_analyses,
+            memory_limit_mb=config.memory_limit_mb,
+            batch_size=config.batch_size,
+            profiler=profiler,
+            diagnostics=diagnostics,
+            stats=stats,
+            cache=cache,
+        )
+    else:
+        analyze_adjectives.main(
+            tokens=results["read_tokens"],
+            adjectives=results["read_adjectives"],
+            words=results["read_words"],
+            words_forms=results["read_words_forms"],
+            translations=results["read_translations"],
+            fp_analyses=fp_analyses,
+            profiler=profiler,
+            diagnostics=diagnostics,
+            stats=stats,
+            cache=cache,
+        )
+    if cache is not None:
+        cache.close()
+    return {
+        "outputs": [fp_analyses],
+        "profile": profiler.report(),
+        "diagnostics": diagnostics.summary(),
+        "stats": stats.summary(),
+        "lemma_cache": cache.summary() if cache is not None else None,
+    }
+
+
+def get_table(config, results, name: str):
+    """The rows of a table loaded by its stage, or out of core, a stream of them."""
+
+    if config.out_of_core:
+        return CsvStream(config.resource(name))
+    return results[f"read_{name}"]
+
+
+def run_analyze_verbs(config, results):
+    profiler = StageProfiler(name="verbs", track_memory=config.track_memory)
+    diagnostics = Diagnostics(name="verbs", echo=config.verbose)
+    tokens = results["read_verb_tokens"]
+    tokens_hash = hashlib.sha256(" ".join(tokens).encode("utf-8")).hexdigest()
+    token2inf_ids_hash = analyze_verbs.get_token2inf_ids_hash(
+        tokens_hash=tokens_hash,
+        fps_resources=[config.resource("words"), config.resource("words_forms")],
+    )
+    fp_token2inf_ids = config.output(f"token2inf_ids.{token2inf_ids_hash}.txt")
+    fp_analyses = config.output(f"verb_info.{tokens_hash}.csv")
+    analyze_verbs.analyze_verbs(
+        tokens=tokens,
+        verbs=get_table(config, results, "verbs"),
+        words=get_table(config, results, "words"),
+        words_forms=get_table(config, results, "words_forms"),
+        fp_token2inf_ids=fp_token2inf_ids,
+        fp_analyses=fp_analyses,
+        profiler=profiler,
+        diagnostics=diagnostics,
+    )
+    return {
+        "outputs": [fp_token2inf_ids, fp_analyses],
+        "profile": profiler.report(),
+        "diagnostics": diagnostics.summary(),
+    }
+
+
+def run_index_articles(config, results):
+    fp_index = config.output("article_index.json")
+    index = article_index.ArticleIndex.load(fp_index)
+    counts = index.update_articles(
+        articles=read_json(config.upload("articles")),
+        words=get_table(config, results, "words"),
+        words_forms=get_table(config, results, "words_forms"),
+        resources_signature=[
+            get_file_signature(config.resource(name))[1:]
+            for name in ["words", "words_forms"]
+        ],
+    )
+    index.save(fp_index)
+    return {
+        "outputs": [fp_index],
+        "articles": counts,
+    }
+
+
+def build_stages(config: PipelineConfig) -> Dict[str, PipelineStage]:
+
+    stages = [
+        PipelineStage(
+            name="read_tokens",
+            run=run_read_tokens,
+            files=[config.upload("words"), config.upload("articles")],
+            code=READ_CODE,
+            estimate_memory=estimate_read_tokens_mb,
+        ),
+        PipelineStage(
+            name="read_verb_tokens",
+            run=run_read_verb_tokens,
+            files=[config.upload("words")],
+            code=READ_CODE,
+            estimate_memory=estimate_read_verb_tokens_mb,
+        ),
+    ]
+    for name in RESOURCE_NAMES:
+        stages.append(PipelineStage(
+            name=f"read_{name}",
+            run=make_run_read_csv(name),
+            files=[config.resource(name)],
+            code=READ_CODE,
+            estimate_memory=make_estimate_read_csv_mb(name),
+        ))
+
+    # Out of core, the stages read the tables themselves.
+    def get_resource_deps(name, resource_names):
+        if config.out_of_core and (name in OUT_OF_CORE_RESOURCE_NAMES or name in STREAMED_RESOURCE_NAMES):
+            return dict(files=[config.resource(resource_name) for resource_name in resource_names], deps=[])
+        return dict(files=[], deps=[f"read_{resource_name}" for resource_name in resource_names])
+
+    noun_resources = get_resource_deps("analyze_nouns", ["nouns", "words", "words_forms", "translations"])
+    adjective_resources = get_resource_deps("analyze_adjectives", ["adjectives", "words", "words_forms", "translations"])
+    verb_resources = get_resource_deps("analyze_verbs", STREAMED_RESOURCE_NAMES["analyze_verbs"])
+    index_resources = get_resource_deps("index_articles", STREAMED_RESOURCE_NAMES["index_articles"])
+    stages.extend([
+        PipelineStage(
+            name="analyze_nouns",
+            run=run_analyze_nouns,
+            deps=["read_tokens"] + noun_resources["deps"],
+            files=[FP_LEMMA_FIXES] + noun_resources["files"],
+            code=NOUN_CODE,
+            in_process=True,
+            estimate_memory=make_estimate_analyzer_mb("analyze_nouns", "nouns"),
+        ),
+        PipelineStage(
+            name="analyze_adjectives",
+            run=run_analyze_adjectives,
+            deps=["read_tokens"] + adjective_resources["deps"],
+            files=[FP_LEMMA_FIXES] + adjective_resources["files"],
+            code=ADJECTIVE_CODE,
+            in_process=True,
+            estimate_memory=make_estimate_analyzer_mb("analyze_adjectives", "adjectives"),
+        ),
+        PipelineStage(
+            name="analyze_verbs",
+            run=run_analyze_verbs,
+            deps=["read_verb_tokens"] + verb_resources["deps"],
+            files=verb_resources["files"],
+            code=VERB_CODE,
+            in_process=True,
+            estimate_memory=make_estimate_analyzer_mb("analyze_verbs", "verbs"),
+        ),
+        PipelineStage(
+            name="index_articles",
+            run=run_index_articles,
+            deps=index_resources["deps"],
+            files=[config.upload("articles")] + index_resources["files"],
+            code=ARTICLE_INDEX_CODE,
+            in_process=True,
+            estimate_memory=estimate_index_articles_mb,
+        ),
+    ])
+
+    return {
+        stage.name: stage
+        for stage in stages
+    }
+
+
+##### Execution #####
+
+
+# Inherited by the forked workers, so the loaded resources are not pickled.
+_forked_state = {}
+
+
+def _run_stage(stage: PipelineStage, config: PipelineConfig, results: dict):
+    """Returns (output, peak RSS of the process running the stage so far).
+
+    The peak is over the lifetime of the process, e.g., of the loads before the stage in the same
+    process, not of the stage alone: per-stage peaks are traced with `--track-memory`.
+    """
+
+    record = metrics.start_stage(metrics.PIPELINE_ANALYZER, stage.name)
+    try:
+        output = stage.run(config, results)
+    except BaseException:
+        metrics.end_stage(record, error=True)
+        metrics.flush()
+        raise
+    metrics.end_stage(record, rows=len(output) if isinstance(output, list) else None)
+    metrics.flush()
+    return output, get_max_rss_mb()
+
+
+def _run_forked_stage(name: str):
+    return _run_stage(_forked_state["stages"][name], _forked_state["config"], _forked_state["results"])
+
+
+def get_process_context():
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+
+def run_pipeline(
+        config: PipelineConfig,
+        targets: Optional[List[str]] = None,
+        fp_state: str = DEFAULT_FP_STATE,
+        workers: int = 3,
+        force: bool = False,
+        stages: Optional[Dict[str, PipelineStage]] = None,
+        results: Optional[dict] = None,
+) -> dict:
+    """Run the stages needed by `targets` (default: all analyzers).
+
+    :param fp_state: Where the fingerprints and outputs of the last run are kept.
+    :param force: Run the targets even if they are unchanged.
+    :param results: Outputs of stages kept from an earlier call, reused when still valid.
+    :return: {stage: {"status":, "wall_s":, ...}}
+    """
+
+    if stages is None:
+        stages = build_stages(config)
+    if targets is None:
+        targets = [name for name, stage in stages.items() if stage.in_process]
+    if results is None:
+        results = {}
+
+    state = {}
+    if os.path.exists(fp_state):
+        with open(fp_state, encoding="utf-8") as f:
+            state = json.load(f)
+
+    fingerprints = get_fingerprints(stages)
+
+    # Decide which stages to run: stale targets and everything they need.
+    def is_fresh(name):
+        entry = state.get(name)
+        return (
+            not force
+            and entry is not None
+            and entry["fingerprint"] == fingerprints[name]
+            and all(os.path.exists(fp) for fp in entry.get("outputs", []))
+        )
+
+    to_run = set()
+
+    def require(name):
+        if name in to_run:
+            return
+        if name in results and results[name][0] == fingerprints[name]:
+            return  # Kept in memory and still valid.
+        to_run.add(name)
+        for dep in stages[name].deps:
+            require(dep)
+
+    report = {}
+    for name in targets:
+        if is_fresh(name):
+            report[name] = {"status": "skipped"}
+        else:
+            require(name)
+
+    process_context = get_process_context()
+
+    try:
+        for generation in get_generations(stages, to_run):
+            process_stages = [name for name in generation if stages[name].in_process and process_context is not None]
+            thread_stages = [name for name in generation if name not in process_stages]
+
+            starts = {}
+            ends = {}
+            futures = {}
+
+            def submit(pool, name, *args):
+                starts[name] = time.perf_counter()
+                futures[name] = pool.submit(*args)
+                futures[name].add_done_callback(
+                    lambda _, name=name: ends.__setitem__(name, time.perf_counter())
+                )
+            inputs = {name: output for name, (_, output) in results.items()}
+
+            # If stages fail, the others of the generation still finish and are recorded, then
+            # the error of the first one is raised.
+            error = None
+            process_pool = None
+            try:
+                # Fork before starting any thread of this generation.
+                if process_stages:
+                    _forked_state.update(
+                        stages=stages,
+                        config=config,
+                        results=inputs,
+                    )
+                    process_pool = ProcessPoolExecutor(
+                        max_workers=min(workers, len(process_stages)),
+                        mp_context=process_context,
+                    )
+                    for name in process_stages:
+                        submit(process_pool, name, _run_forked_stage, name)
+
+                with ThreadPoolExecutor(max_workers=max(1, workers)) as thread_pool:
+                    for name in thread_stages:
+                        submit(thread_pool, name, _run_stage, stages[name], config, inputs)
+
+                    for name, future in futures.items():
+                        try:
+                            output, process_max_rss_mb = future.result()
+                        except Exception as e:
+                            if error is None:
+                                error = e
+                            continue
+                        results[name] = (fingerprints[name], output)
+                        report[name] = {
+                            "status": "ran",
+                            "wall_s": ends.get(name, time.perf_counter()) - starts[name],
+                            "process_max_rss_mb": process_max_rss_mb,
+                        }
+                        if isinstance(output, dict) and "outputs" in output:
+                            report[name].update(output)
+                            state[name] = {
+                                "fingerprint": fingerprints[name],
+                                "outputs": output["outputs"],
+                            }
+            finally:
+                # Also after a failure, e.g., in watch mode, which goes on after it.
+                if process_pool is not None:
+                    process_pool.shutdown(cancel_futures=True)
+                _forked_state.clear()
+
+            if error is not None:
+                raise error
+    finally:
+        # Also after a failure, so that the stages that finished are not run again.
+        with open(fp_state, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+
+    return report
+
+
+##### Memory budget #####
+
+
+def get_required_stages(stages: Dict[str, PipelineStage], targets: List[str]) -> List[str]:
+
+    required = set()
+
+    def require(name):
+        if name not in required:
+            required.add(name)
+            for dep in stages[name].deps:
+                require(dep)
+
+    for name in targets:
+        require(name)
+    return sorted(required)
+
+
+def project_memory(config: PipelineConfig, targets: Optional[List[str]] = None, workers: int = 3) -> dict:
+    """Project the peak memory (MB) of running `targets` from scratch, before anything is loaded.
+
+    The outputs of the loads are kept until the end, and the analyzers running at the same time
+    each add their working set (see `PipelineStage.estimate_memory` and `memory_budget`).
+
+    :return: {"total_mb":, "baseline_mb":, "loads": {stage: mb}, "analyzers": {stage: mb}}
+    """
+
+    stages = build_stages(config)
+    if targets is None:
+        targets = [name for name, stage in stages.items() if stage.in_process]
+
+    loads = {}
+    analyzers = {}
+    for name in get_required_stages(stages, targets):
+        stage = stages[name]
+        mb = stage.estimate_memory(config) if stage.estimate_memory is not None else 0.0
+        (analyzers if stage.in_process else loads)[name] = mb
+
+    baseline_mb = get_rss_mb() or 0.0
+    concurrent_mb = sorted(analyzers.values(), reverse=True)[:max(1, workers)]
+    return {
+        "total_mb": baseline_mb + sum(loads.values()) + sum(concurrent_mb),
+        "baseline_mb": baseline_mb,
+        "loads": loads,
+        "analyzers": analyzers,
+    }
+
+
+def format_projection(projection: dict, n_parts: int = 4) -> str:
+    """E.g., "read_words_forms 134 MB, read_translations 18 MB, ..." for the largest parts."""
+
+    parts = sorted(
+        {**projection["loads"], **projection["analyzers"]}.items(),
+        key=lambda item: -item[1],
+    )[:n_parts]
+    return ", ".join(f"{name} {mb:,.0f} MB" for name, mb in parts)
+
+
+def apply_memory_budget(config: PipelineConfig, budget_mb: float, targets: Optional[List[str]] = None, workers: int = 3) -> dict:
+    """Choose how to run `targets` within `budget_mb` MB, before loading anything.
+
+    Both strategies are projected: loading the dumps, and running the analyzers of
+    `OUT_OF_CORE_RESOURCE_NAMES` out of core (`config.out_of_core`) with the smallest external
+    sorts. The smaller projection that fits is chosen; out of core, the sorts are then sized to
+    what is left of the budget (`config.memory_limit_mb`).
+
+    :return: The chosen projection (see `project_memory`), with "strategy": "in_memory" or "out_of_core".
+    :raise MemoryBudgetError: If both projections are over budget.
+    """
+
+    projections = {}
+    if not config.out_of_core:
+        projections["in_memory"] = project_memory(config, targets=targets, workers=workers)
+
+    max_memory_limit_mb = config.memory_limit_mb
+    out_of_core = config.out_of_core
+    config.out_of_core = True
+    config.memory_limit_mb = MIN_MEMORY_LIMIT_MB
+    projection = project_memory(config, targets=targets, workers=workers)
+    out_of_core_analyzers = [name for name in projection["analyzers"] if name in OUT_OF_CORE_RESOURCE_NAMES]
+    if out_of_core_analyzers or not projections:
+        projections["out_of_core"] = projection
+    config.out_of_core = out_of_core
+    config.memory_limit_mb = max_memory_limit_mb
+
+    strategy, projection = min(projections.items(), key=lambda item: item[1]["total_mb"])
+    spare_mb = budget_mb - projection["total_mb"]
+    if spare_mb < 0:
+        raise MemoryBudgetError(
+            f"The projected peak memory is {projection['total_mb']:,.0f} MB, over the budget of {budget_mb:,.0f} MB, "
+            + ("loading the dumps" if strategy == "in_memory" else f"with {', '.join(out_of_core_analyzers) or 'the analyzers'} out of core")
+            + "".join(
+                f" ({other_projection['total_mb']:,.0f} MB {'loading the dumps' if other_strategy == 'in_memory' else 'out of core'})"
+                for other_strategy, other_projection in projections.items()
+                if other_strategy != strategy
+            )
+            + f" (largest parts: {format_projection(projection)}; baseline {projection['baseline_mb']:,.0f} MB). "
+            f"Raise --memory-budget to at least {projection['total_mb']:,.0f} MB, or leave out the stages "
+            f"that need the dumps in memory from --targets."
+        )
+
+    if strategy == "in_memory" or not out_of_core_analyzers:
+        return {**projection, "strategy": strategy}
+
+    # What is left of the budget is shared by the out-of-core analyzers.
+    config.out_of_core = True
+    config.memory_limit_mb = min(max_memory_limit_mb, MIN_MEMORY_LIMIT_MB + spare_mb / len(out_of_core_analyzers))
+    projection = project_memory(config, targets=targets, workers=workers)
+    return {**projection, "strategy": strategy}
+
+
+def snapshot_outputs(report: dict, fp_store: str, version: Optional[str] = None) -> List[dict]:
+    """Store the outputs of the stages that ran as one version. Returns their manifests."""
+
+    from snapshot_store import SnapshotStore, get_default_version
+
+    store = SnapshotStore(fp_store)
+    if version is None:
+        version = get_default_version()
+
+    manifests = []
+    for name, entry in report.items():
+        if entry["status"] != "ran":
+            continue
+        for fp in entry.get("outputs", []):
+            manifests.append(store.put(
+                fp,
+                version=version,
+                metadata={"stage": name},
+            ))
+    return manifests
+
+
+##### Watch mode #####
+
+
+def get_module_name(fp: str) -> str:
+    """E.g., "/path/to/noun_analyses/russian_noun.py" -> "noun_analyses.russian_noun"."""
+    return os.path.splitext(os.path.relpath(fp, ROOT_DIR))[0].replace(os.sep, ".")
+
+
+def get_watched_signatures(stages: Dict[str, PipelineStage]) -> Dict[str, list]:
+    """The signatures of the files and code the stages depend on, which make them stale when they change."""
+
+    return {
+        fp: get_file_signature(fp)
+        for stage in stages.values()
+        for fp in stage.files + stage.code
+    }
+
+
+def reload_code(stages: Dict[str, PipelineStage]):
+    """Re-import the modules run by the stages, and the modules of their code, after the code changed.
+
+    The modules are removed from `sys.modules` and the stage modules imported again, so that every
+    module is re-executed after the modules it imports.
+    """
+
+    not_reloaded = {os.path.join(ROOT_DIR, fp) for fp in NOT_RELOADED_CODE}
+    for fp in {fp for stage in stages.values() for fp in stage.code} - not_reloaded:
+        sys.modules.pop(get_module_name(fp), None)
+    for name in STAGE_MODULES:
+        sys.modules.pop(name, None)
+
+    for name in STAGE_MODULES:
+        globals()[name] = importlib.import_module(name)
+
+
+def watch(
+        config: PipelineConfig,
+        targets: Optional[List[str]] = None,
+        fp_state: str = DEFAULT_FP_STATE,
+        workers: int = 3,
+        interval: float = DEFAULT_WATCH_INTERVAL,
+        max_runs: Optional[int] = None,
+):
+    """Run the pipeline, then again whenever the files or the code the stages depend on change.
+
+    The files and code (e.g., the uploads, the resources, the lemma fixes and the rule modules) are
+    polled every `interval` seconds. Only the invalidated stages run again (see `run_pipeline`):
+    the outputs of the others, e.g., the loaded resources, are kept in memory between runs. After a
+    change of the code of the stages, their modules are re-imported (see `reload_code`).
+
+    :param max_runs: Stop after this many runs. Runs until interrupted by default.
+    """
+
+    stages = build_stages(config)
+    results = {}
+    code = {fp for stage in stages.values() for fp in stage.code}
+    not_reloaded = {os.path.join(ROOT_DIR, fp) for fp in NOT_RELOADED_CODE}
+
+    signatures = None
+    n_runs = 0
+    while max_runs is None or n_runs < max_runs:
+        new_signatures = get_watched_signatures(stages)
+        if new_signatures == signatures:
+            time.sleep(interval)
+            continue
+
+        if signatures is not None:
+            # Wait for the edits (e.g., an editor saving several files) to settle.
+            time.sleep(interval)
+            if get_watched_signatures(stages) != new_signatures:
+                continue
+
+            changed = sorted(fp for fp, signature in new_signatures.items() if signatures.get(fp) != signature)
+            print(f"Changed: {', '.join(os.path.relpath(fp) for fp in changed)}")
+            if any(fp in not_reloaded for fp in changed):
+                print(f"Restart to use the changes of {', '.join(fp for fp in NOT_RELOADED_CODE)}.")
+            if any(fp in code for fp in changed):
+                try:
+                    reload_code(stages)
+                except Exception:
+                    traceback.print_exc()
+                    signatures = new_signatures
+                    continue
+        signatures = new_signatures
+
+        start = time.perf_counter()
+        try:
+            report = run_pipeline(
+                config=config,
+                targets=targets,
+                fp_state=fp_state,
+                workers=workers,
+                stages=stages,
+                results=results,
+            )
+        except Exception:
+            traceback.print_exc()
+        else:
+            print_report(report)
+            print(f"Total: {time.perf_counter() - start:.3f}s")
+        n_runs += 1
+        print(f"Watching {len(signatures):,} files for changes (Ctrl-C to stop)")
+
+
+def print_report(report: dict):
+    print(f"{'stage':<25} {'status':<10} {'wall_s':>10} {'process_max_rss_mb':>19}")
+    for name, entry in report.items():
+        wall_s = entry.get("wall_s")
+        process_max_rss_mb = entry.get("process_max_rss_mb")
+        print(
+            f"{name:<25} {entry['status']:<10} "
+            f"{'' if wall_s is None else format(wall_s, '.3f'):>10} "
+            f"{'' if process_max_rss_mb is None else format(process_max_rss_mb, ',.1f'):>19}"
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resources-dir", default="russian_word_analyses/resources")
+    parser.add_argument("--uploads-dir", default="uploads")
+    parser.add_argument("--output-dir", default="russian_word_analyses/files")
+    parser.add_argument("--all-articles", action="store_true", help="Read all articles, not only Duolingo sentences.")
+    parser.add_argument("--targets", default=None, help="Comma-separated analyzer stages to run. Defaults to all.")
+    parser.add_argument("--state", default=None, help=f"State file. Defaults to {DEFAULT_FP_STATE} in the output directory.")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--force", action="store_true", help="Run even if the inputs are unchanged.")
+    parser.add_argument("--profile", default=None, help="Write the stage timings, analyzer profiles and statistics as JSON to this path.")
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--csv-backend", default=CSV_BACKEND_CSV, choices=CSV_BACKENDS, help="See `IO.read_csv`.")
+    parser.add_argument("--lemma-cache", default=None, help="Reuse the rows of unchanged lemmas from this SQLite file (see `lemma_cache`).")
+    parser.add_argument("--snapshot-store", default=None, help="Keep the outputs as a new version in this snapshot store.")
+    parser.add_argument("--watch", action="store_true", help="Keep running, and re-run the invalidated stages whenever their inputs or code change.")
+    parser.add_argument("--watch-interval", type=float, default=DEFAULT_WATCH_INTERVAL, help="Seconds between checks for changes.")
+    parser.add_argument("--memory-budget", type=float, default=None, help="In MB. Run the analyzers out of core if loading the dumps would exceed it, and stop before loading if that would too.")
+    parser.add_argument("--track-memory", action="store_true", help="Trace the peak memory of the stages of the analyzers with tracemalloc (slower).")
+    add_out_of_core_arguments(parser)
+    metrics.add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    config = PipelineConfig(
+        resources_dir=args.resources_dir,
+        uploads_dir=args.uploads_dir,
+        output_dir=args.output_dir,
+        duolingo_only_articles=not args.all_articles,
+        verbose=args.verbose,
+        csv_backend=args.csv_backend,
+        lemma_cache=args.lemma_cache,
+        out_of_core=args.out_of_core,
+        memory_limit_mb=args.memory_limit_mb,
+        batch_size=args.batch_size,
+        track_memory=args.track_memory,
+    )
+    os.makedirs(config.output_dir, exist_ok=True)
+
+    if args.memory_budget is not None:
+        try:
+            projection = apply_memory_budget(
+                config=config,
+                budget_mb=args.memory_budget,
+                targets=args.targets.split(",") if args.targets is not None else None,
+                workers=args.workers,
+            )
+        except MemoryBudgetError as e:
+            sys.exit(f"Memory budget: {e}")
+        print(
+            f"Memory budget: {args.memory_budget:,.0f} MB, projected {projection['total_mb']:,.0f} MB "
+            f"({projection['strategy']}"
+            + (f", sorts of {config.memory_limit_mb:,.0f} MB" if projection["strategy"] == "out_of_core" else "")
+            + f"; {format_projection(projection)})"
+        )
+
+    exporter = None
+    if args.metrics_file is not None or args.metrics_port is not None:
+        exporter = metrics.MetricsExporter(
+            fp=args.metrics_file,
+            port=args.metrics_port,
+            interval=args.metrics_interval,
+        )
+        exporter.start()
+
+    if args.watch:
+        try:
+            watch(
+                config=config,
+                targets=args.targets.split(",") if args.targets is not None else None,
+                fp_state=args.state if args.state is not None else config.output(DEFAULT_FP_STATE),
+                workers=args.workers,
+                interval=args.watch_interval,
+            )
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if exporter is not None:
+                exporter.stop()
+        sys.exit(0)
+
+    start = time.perf_counter()
+    try:
+        report = run_pipeline(
+            config=config,
+            targets=args.targets.split(",") if args.targets is not None else None,
+            fp_state=args.state if args.state is not None else config.output(DEFAULT_FP_STATE),
+            workers=args.workers,
+            force=args.force,
+        )
+    finally:
+        if exporter is not None:
+            exporter.stop()
+    print_report(report)
+    print(f"Total: {time.perf_counter() - start:.3f}s")
+
+    if args.snapshot_store is not None:
+        for manifest in snapshot_outputs(report, fp_store=args.snapshot_store):
+            print(
+                f"Snapshot {manifest['name']}@{manifest['version']}: "
+                f"{manifest['size']:,} bytes, {manifest['bytes_written']:,} bytes written"
+            )
+
+    if args.profile is not None:
+        with open(args.profile, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
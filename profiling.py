@@ -0,0 +1,153 @@
+import cProfile
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import metrics
+from memory_budget import get_max_rss_mb, MB
+
+
+class StageProfiler:
+    """Collect wall time, CPU time, throughput and peak memory of the stages of an analyzer.
+
+    Usage:
+
+        profiler = StageProfiler(name="nouns")
+        with profiler.stage("read_csv") as stage:
+            words = read_csv(fp=...)
+            stage["rows_out"] = len(words)
+        profiler.save(fp="profile.nouns.json")
+
+    The peak RSS of the process at the end of each stage is recorded. With `track_memory`, so is the
+    peak of the memory allocated by Python during each stage, traced with tracemalloc, which slows
+    down allocations by several times.
+    """
+
+    def __init__(self, name: str, cprofile_dir: Optional[str] = None, track_memory: bool = False):
+
+        self.name = name
+        self.cprofile_dir = cprofile_dir
+        self.track_memory = track_memory
+
+        self.stages = []
+
+        if self.track_memory:
+            # Imported on first use, as tracemalloc slows down importing the analyzers.
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None):
+
+        stage = {
+            "name": name,
+            "rows_in": rows_in,
+            "rows_out": None,
+        }
+
+        profile = None
+        if self.cprofile_dir is not None:
+            profile = cProfile.Profile()
+
+        traced_start = None
+        if self.track_memory:
+            import tracemalloc
+            tracemalloc.reset_peak()
+            traced_start = tracemalloc.get_traced_memory()[0]
+
+        record = metrics.start_stage(self.name, name, rows_expected=rows_in)
+        error = False
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        if profile is not None:
+            profile.enable()
+
+        try:
+            yield stage
+        except BaseException:
+            error = True
+            raise
+        finally:
+            if profile is not None:
+                profile.disable()
+            stage["wall_s"] = time.perf_counter() - wall_start
+            stage["cpu_s"] = time.process_time() - cpu_start
+            stage["max_rss_mb"] = get_max_rss_mb()
+            if traced_start is not None:
+                import tracemalloc
+                stage["peak_traced_mb"] = (tracemalloc.get_traced_memory()[1] - traced_start) / MB
+
+            rows = stage["rows_in"] if stage["rows_in"] is not None else stage["rows_out"]
+            stage["rows_per_s"] = (
+                rows / stage["wall_s"]
+                if rows is not None and stage["wall_s"] > 0
+                else None
+            )
+
+            if profile is not None:
+                os.makedirs(self.cprofile_dir, exist_ok=True)
+                stage["cprofile"] = os.path.join(
+                    self.cprofile_dir,
+                    f"{self.name}.{len(self.stages)}.{name}.prof",
+                )
+                profile.dump_stats(stage["cprofile"])
+
+            self.stages.append(stage)
+            metrics.end_stage(record, rows=rows, error=error)
+
+    def report(self) -> dict:
+        return {
+            "analyzer": self.name,
+            "wall_s": sum(stage["wall_s"] for stage in self.stages),
+            "cpu_s": sum(stage["cpu_s"] for stage in self.stages),
+            "max_rss_mb": get_max_rss_mb(),
+            "stages": self.stages,
+        }
+
+    def save(self, fp: str):
+        with open(fp, "w", encoding="utf-8") as f:
+            json.dump(
+                obj=self.report(),
+                fp=f,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+    def print_report(self):
+        print(
+            f"{'stage':<25} {'wall_s':>10} {'cpu_s':>10} {'rows_in':>12} {'rows_out':>12} {'rows/s':>12} {'max_rss_mb':>11}"
+            + (f" {'traced_mb':>10}" if self.track_memory else "")
+        )
+        for stage in self.stages:
+            print(
+                f"{stage['name']:<25} "
+                f"{stage['wall_s']:>10.3f} "
+                f"{stage['cpu_s']:>10.3f} "
+                f"{'' if stage['rows_in'] is None else format(stage['rows_in'], ','):>12} "
+                f"{'' if stage['rows_out'] is None else format(stage['rows_out'], ','):>12} "
+                f"{'' if stage['rows_per_s'] is None else format(stage['rows_per_s'], ',.0f'):>12} "
+                f"{'' if stage['max_rss_mb'] is None else format(stage['max_rss_mb'], ',.1f'):>11}"
+                + (f" {stage['peak_traced_mb']:>10.1f}" if "peak_traced_mb" in stage else "")
+            )
+
+
+def add_profile_arguments(parser):
+    parser.add_argument(
+        "--profile",
+        default=None,
+        help="Write a JSON report with the wall time, CPU time and throughput of each stage to this path.",
+    )
+    parser.add_argument(
+        "--cprofile-dir",
+        default=None,
+        help="Also dump a cProfile file per stage to this directory.",
+    )
+    parser.add_argument(
+        "--track-memory",
+        action="store_true",
+        help="Also trace the peak memory allocated during each stage with tracemalloc (slower).",
+    )
@@ -0,0 +1,31 @@
+"""A lazily importing stand-in for `tqdm.tqdm`.
+
+Importing tqdm takes tens of milliseconds, which dominates short-lived invocations and library
+imports that never show a progress bar. `tqdm` here imports it on first use, and returns the
+iterable unchanged if tqdm is not installed.
+
+While metrics are exported, the items are also counted as rows processed (see `metrics.count_rows`).
+"""
+
+from metrics import count_rows, enabled as metrics_enabled
+
+_tqdm = None
+
+
+def tqdm(iterable=None, *args, **kwargs):
+    global _tqdm
+
+    if _tqdm is None:
+        try:
+            from tqdm import tqdm as _tqdm
+        except ImportError:
+            _tqdm = False
+
+    if metrics_enabled() and iterable is not None:
+        if "total" not in kwargs and hasattr(iterable, "__len__"):
+            kwargs["total"] = len(iterable)
+        iterable = count_rows(iterable)
+
+    if _tqdm is False:
+        return iterable
+    return _tqdm(iterable, *args, **kwargs)
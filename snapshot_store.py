@@ -0,0 +1,476 @@
+"""A content-addressed store of analysis snapshots, deduplicated at the row level.
+
+Successive runs of an analysis (e.g., `files/noun_analyses.old.1.csv` ... `noun_analyses.csv`)
+differ in a few rows, so instead of keeping full copies, each version is cut into chunks of rows,
+and each chunk is stored once under the SHA-256 of its content. A version is then a manifest
+listing its chunks, and keeping another snapshot only costs the chunks that changed.
+
+Chunk boundaries are content-defined: a chunk ends after a row whose hash is 0 modulo
+`AVG_ROWS_PER_CHUNK`, so inserting or deleting rows only changes the chunks around them instead
+of shifting all the following ones. CSVs are cut at rows (quoted newlines included, see
+`csv_index.iter_raw_rows`), other files (e.g., `token2inf_ids.*.txt`) at lines, and the bytes are
+restored exactly. Layout:
+
+    <store>/objects/ab/abcdef....gz  # A chunk, gzipped.
+    <store>/manifests/<name>/<version>.json
+
+E.g.,
+
+    store = SnapshotStore("snapshots")
+    store.put("files/noun_analyses.csv", name="noun_analyses", version="0310")
+    for row in store.iter_rows("noun_analyses", version="0310"):  # Or the latest version by default.
+        ...
+    store.restore("noun_analyses", "files/noun_analyses.0310.csv", version="0310")
+
+or from the command line:
+
+    python snapshot_store.py --store snapshots put files/noun_analyses.csv --name noun_analyses --version 0310
+    python snapshot_store.py --store snapshots put files/noun_analyses.old.1.csv files/noun_analyses.csv  # Oldest first.
+    python snapshot_store.py --store snapshots list
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+import zlib
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from compression import open_file, compress_chunk, COMPRESSION_GZIP
+from csv_index import iter_raw_rows
+
+
+MANIFEST_VERSION = 1
+
+AVG_ROWS_PER_CHUNK = 32
+MAX_ROWS_PER_CHUNK = 256
+MAX_BYTES_PER_CHUNK = 256 * 1024
+
+OBJECTS_DIR_NAME = "objects"
+MANIFESTS_DIR_NAME = "manifests"
+OBJECT_SUFFIX = ".gz"
+
+
+def iter_chunks(raw_rows: Iterable[bytes], is_csv: bool) -> Iterator[List[bytes]]:
+    """Group the rows into content-defined chunks. The header of a CSV is a chunk on its own."""
+
+    chunk = []
+    n_bytes = 0
+    for i, raw in enumerate(raw_rows):
+        chunk.append(raw)
+        n_bytes += len(raw)
+
+        if (
+            (is_csv and i == 0)
+            or zlib.crc32(raw) % AVG_ROWS_PER_CHUNK == 0
+            or len(chunk) >= MAX_ROWS_PER_CHUNK
+            or n_bytes >= MAX_BYTES_PER_CHUNK
+        ):
+            yield chunk
+            chunk = []
+            n_bytes = 0
+
+    if chunk:
+        yield chunk
+
+
+def get_default_version() -> str:
+    """E.g., "20261019T072300.123456". Sorts in time order.
+
+    To the microsecond, so that runs finishing within the same second get distinct versions.
+    """
+
+    t = time.time()
+    return f"{time.strftime('%Y%m%dT%H%M%S', time.localtime(t))}.{int(t % 1 * 1_000_000):06d}"
+
+
+def get_put_versions(fps: List[str], name: Optional[str] = None, version: Optional[str] = None) -> List[Optional[str]]:
+    """The versions of files stored at once, in the order given (oldest first).
+
+    Files of the same name (e.g., "noun_analyses.old.2.csv", "noun_analyses.old.1.csv",
+    "noun_analyses.csv") get the same version with a counter appended, e.g., "0310.1" ... "0310.3",
+    so that the last one given is the latest. The others keep `version`.
+
+    :param name: The name of all the files, instead of their file names (see `SnapshotStore.put`).
+    :param version: The current time by default.
+    """
+
+    names = [name if name is not None else get_default_name(fp) for fp in fps]
+    base_version = version if version is not None else get_default_version()
+
+    versions = []
+    counters = {}
+    for fp_name in names:
+        n_files = names.count(fp_name)
+        if n_files == 1:
+            versions.append(version)
+            continue
+        counters[fp_name] = counters.get(fp_name, 0) + 1
+        versions.append(f"{base_version}.{counters[fp_name]:0{len(str(n_files))}d}")
+    return versions
+
+
+def get_default_name(fp: str) -> str:
+    """The file name without extensions, e.g., "files/noun_analyses.old.1.csv" -> "noun_analyses"."""
+    return os.path.basename(fp).split(".")[0]
+
+
+class SnapshotStore:
+
+    def __init__(self, root: str):
+        """
+        :param root: The store directory, created if missing.
+        """
+
+        self.root = root
+        self.objects_dir = os.path.join(root, OBJECTS_DIR_NAME)
+        self.manifests_dir = os.path.join(root, MANIFESTS_DIR_NAME)
+
+    # Objects.
+
+    def get_object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}{OBJECT_SUFFIX}")
+
+    def has_object(self, digest: str) -> bool:
+        return os.path.exists(self.get_object_path(digest))
+
+    def put_object(self, data: bytes) -> Tuple[str, int]:
+        """Store a chunk unless it is already stored. Returns (digest, number of bytes written)."""
+
+        digest = hashlib.sha256(data).hexdigest()
+        fp = self.get_object_path(digest)
+        if os.path.exists(fp):
+            return digest, 0
+
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
+        compressed = compress_chunk(data, COMPRESSION_GZIP)
+
+        # Write to a temporary file first, so that a concurrent reader never sees a partial object.
+        fp_tmp = f"{fp}.{os.getpid()}.tmp"
+        with open(fp_tmp, "wb") as f:
+            f.write(compressed)
+        os.replace(fp_tmp, fp)
+
+        return digest, len(compressed)
+
+    def get_object(self, digest: str) -> bytes:
+
+        with open(self.get_object_path(digest), "rb") as f:
+            data = zlib.decompress(f.read(), wbits=31)
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Object {digest} is corrupted.")
+        return data
+
+    # Manifests.
+
+    def get_manifest_path(self, name: str, version: str) -> str:
+        return os.path.join(self.manifests_dir, name, f"{version}.json")
+
+    def names(self) -> List[str]:
+        if not os.path.isdir(self.manifests_dir):
+            return []
+        return sorted(os.listdir(self.manifests_dir))
+
+    def versions(self, name: str) -> List[str]:
+        """In the order of version names, i.e., of time for the default versions."""
+
+        dp = os.path.join(self.manifests_dir, name)
+        if not os.path.isdir(dp):
+            return []
+        return sorted(
+            fn[:-len(".json")]
+            for fn in os.listdir(dp)
+            if fn.endswith(".json")
+        )
+
+    def get_manifest(self, name: str, version: Optional[str] = None) -> dict:
+        """The manifest of a version, the latest by default."""
+
+        if version is None:
+            versions = self.versions(name)
+            if not versions:
+                raise KeyError(f"No snapshots of {name}.")
+            version = versions[-1]
+
+        fp = self.get_manifest_path(name, version)
+        if not os.path.exists(fp):
+            raise KeyError(f"No snapshot {name}@{version}.")
+        with open(fp, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    # Writing.
+
+    def put_raw_rows(self, raw_rows: Iterable[bytes], name: str, version: Optional[str] = None, is_csv: bool = True, metadata: Optional[dict] = None) -> dict:
+        """Store a version from its raw rows (or lines), and write its manifest.
+
+        :param name: E.g., "noun_analyses"
+        :param version: E.g., "0310". The current time by default.
+        :param metadata: Anything JSON-serializable to keep in the manifest, e.g., {"tokens_hash":}.
+        :return: The manifest, with "bytes_written" of the new objects.
+        """
+
+        if version is None:
+            version = get_default_version()
+        if os.path.exists(self.get_manifest_path(name, version)):
+            raise ValueError(f"Snapshot {name}@{version} already exists.")
+
+        file_hash = hashlib.sha256()
+        chunks = []
+        n_rows = 0
+        size = 0
+        bytes_written = 0
+        for chunk in iter_chunks(raw_rows, is_csv=is_csv):
+            data = b"".join(chunk)
+            digest, n_bytes = self.put_object(data)
+
+            file_hash.update(data)
+            chunks.append([digest, len(data), len(chunk)])
+            n_rows += len(chunk)
+            size += len(data)
+            bytes_written += n_bytes
+
+        manifest = {
+            "manifest_version": MANIFEST_VERSION,
+            "name": name,
+            "version": version,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "is_csv": is_csv,
+            "size": size,
+            "sha256": file_hash.hexdigest(),
+            "n_rows": n_rows,  # The header included.
+            "n_chunks": len(chunks),
+            "bytes_written": bytes_written,
+            "metadata": metadata or {},
+            "chunks": chunks,  # [[digest, size, n_rows]]
+        }
+
+        fp = self.get_manifest_path(name, version)
+        os.makedirs(os.path.dirname(fp), exist_ok=True)
+        fp_tmp = f"{fp}.{os.getpid()}.tmp"
+        with open(fp_tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(fp_tmp, fp)
+
+        return manifest
+
+    def put(self, fp: str, name: Optional[str] = None, version: Optional[str] = None, metadata: Optional[dict] = None) -> dict:
+        """Store a file as a version. CSVs (also compressed ones) are cut at rows, others at lines.
+
+        :param fp: E.g., "russian_word_analyses/files/noun_analyses.csv"
+        :param name: The file name without extensions by default, e.g., "noun_analyses".
+        """
+
+        if name is None:
+            name = get_default_name(fp)
+        is_csv = ".csv" in os.path.basename(fp).lower()
+
+        with open_file(fp, "rb") as f:
+            if is_csv:
+                raw_rows = (raw for _, raw in iter_raw_rows(f))
+            else:
+                raw_rows = iter(f)
+
+            return self.put_raw_rows(
+                raw_rows,
+                name=name,
+                version=version,
+                is_csv=is_csv,
+                metadata={"source": fp, **(metadata or {})},
+            )
+
+    def put_rows(self, rows: Iterable[dict], name: str, version: Optional[str] = None, metadata: Optional[dict] = None) -> dict:
+        """Store rows as a CSV version, formatted as `IO.write_csv` does. The header is taken from the first row."""
+
+        def iter_raw():
+            buffer = io.StringIO()
+            csv_writer = None
+            for row in rows:
+                if csv_writer is None:
+                    csv_writer = csv.DictWriter(buffer, fieldnames=list(row.keys()))
+                    csv_writer.writeheader()
+                    yield buffer.getvalue().encode("utf-8")
+                    buffer.seek(0)
+                    buffer.truncate()
+
+                csv_writer.writerow(row)
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+
+        return self.put_raw_rows(
+            iter_raw(),
+            name=name,
+            version=version,
+            is_csv=True,
+            metadata=metadata,
+        )
+
+    # Reading.
+
+    def iter_bytes(self, name: str, version: Optional[str] = None) -> Iterator[bytes]:
+        """Stream the content of a version, one chunk at a time."""
+
+        for digest, _, _ in self.get_manifest(name, version)["chunks"]:
+            yield self.get_object(digest)
+
+    def iter_lines(self, name: str, version: Optional[str] = None) -> Iterator[str]:
+        """Stream the lines of a version, with universal newlines as text-mode `open`."""
+
+        for i, data in enumerate(self.iter_bytes(name, version)):
+            yield from io.StringIO(data.decode("utf-8-sig" if i == 0 else "utf-8"), newline=None)
+
+    def iter_rows(self, name: str, version: Optional[str] = None) -> Iterator[dict]:
+        """Stream the rows of a CSV version, as `IO.iter_csv` does."""
+        return csv.DictReader(self.iter_lines(name, version))
+
+    def restore(self, name: str, fp: str, version: Optional[str] = None) -> dict:
+        """Write a version back to a file (compressed by its extension), checking its hash."""
+
+        manifest = self.get_manifest(name, version)
+
+        file_hash = hashlib.sha256()
+        with open_file(fp, "wb") as f:
+            for data in self.iter_bytes(name, manifest["version"]):
+                file_hash.update(data)
+                f.write(data)
+
+        if file_hash.hexdigest() != manifest["sha256"]:
+            raise ValueError(f"Restored {name}@{manifest['version']} does not match its hash.")
+        return manifest
+
+    # Maintenance.
+
+    def delete(self, name: str, version: str):
+        """Delete a manifest. Its objects are deleted by `gc` unless other versions use them."""
+        os.remove(self.get_manifest_path(name, version))
+
+    def iter_objects(self) -> Iterator[str]:
+        if not os.path.isdir(self.objects_dir):
+            return
+        for dn in sorted(os.listdir(self.objects_dir)):
+            for fn in sorted(os.listdir(os.path.join(self.objects_dir, dn))):
+                if fn.endswith(OBJECT_SUFFIX):
+                    yield fn[:-len(OBJECT_SUFFIX)]
+
+    def gc(self) -> int:
+        """Delete the objects no manifest refers to. Returns the number of objects deleted."""
+
+        referenced = {
+            digest
+            for name in self.names()
+            for version in self.versions(name)
+            for digest, _, _ in self.get_manifest(name, version)["chunks"]
+        }
+
+        n_deleted = 0
+        for digest in list(self.iter_objects()):
+            if digest not in referenced:
+                os.remove(self.get_object_path(digest))
+                n_deleted += 1
+        return n_deleted
+
+    def get_stats(self) -> dict:
+        """The logical size of all versions against the size of the stored objects."""
+
+        logical_size = 0
+        n_versions = 0
+        for name in self.names():
+            for version in self.versions(name):
+                logical_size += self.get_manifest(name, version)["size"]
+                n_versions += 1
+
+        stored_size = 0
+        n_objects = 0
+        for digest in self.iter_objects():
+            stored_size += os.path.getsize(self.get_object_path(digest))
+            n_objects += 1
+
+        return {
+            "n_names": len(self.names()),
+            "n_versions": n_versions,
+            "n_objects": n_objects,
+            "logical_size": logical_size,
+            "stored_size": stored_size,
+        }
+
+
+def main(args) -> int:
+
+    store = SnapshotStore(args.store)
+
+    if args.command == "put":
+        for fp, version in zip(args.files, get_put_versions(args.files, name=args.name, version=args.version)):
+            manifest = store.put(fp, name=args.name, version=version)
+            print(
+                f"{manifest['name']}@{manifest['version']}: "
+                f"{manifest['size']:,} bytes, {manifest['n_rows']:,} rows, {manifest['n_chunks']:,} chunks, "
+                f"{manifest['bytes_written']:,} bytes written"
+            )
+
+    elif args.command == "list":
+        for name in store.names() if args.name is None else [args.name]:
+            for version in store.versions(name):
+                manifest = store.get_manifest(name, version)
+                print(
+                    f"{name}@{version}  {manifest['created_at']}  "
+                    f"{manifest['size']:>12,} bytes  {manifest['n_rows']:>9,} rows  "
+                    f"{manifest['bytes_written']:>12,} bytes written  {manifest['metadata'].get('source', '')}"
+                )
+
+    elif args.command == "cat":
+        out = sys.stdout.buffer
+        for data in store.iter_bytes(args.name, version=args.version):
+            out.write(data)
+
+    elif args.command == "restore":
+        manifest = store.restore(args.name, fp=args.output, version=args.version)
+        print(f"Restored {args.name}@{manifest['version']} to {args.output}")
+
+    elif args.command == "gc":
+        print(f"Deleted {store.gc():,} objects.")
+
+    stats = store.get_stats()
+    if args.command in ("put", "list", "gc"):
+        print(
+            f"#names: {stats['n_names']:,}, #versions: {stats['n_versions']:,}, #objects: {stats['n_objects']:,}, "
+            f"{stats['logical_size']:,} bytes in {stats['stored_size']:,} bytes "
+            f"({stats['logical_size'] / max(stats['stored_size'], 1):.1f}x)",
+            file=sys.stderr,
+        )
+
+    return 0
+
+
+def parse_args(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", default="snapshots", help="The store directory.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    put_parser = subparsers.add_parser("put", help="Store files as new versions.")
+    put_parser.add_argument("files", nargs="+")
+    put_parser.add_argument("--name", default=None, help="The file name without extensions by default.")
+    put_parser.add_argument("--version", default=None, help="The current time by default. Files of the same name get a counter appended, in the order given, oldest first.")
+
+    list_parser = subparsers.add_parser("list", help="List the versions.")
+    list_parser.add_argument("--name", default=None)
+
+    cat_parser = subparsers.add_parser("cat", help="Write a version to stdout.")
+    cat_parser.add_argument("name")
+    cat_parser.add_argument("--version", default=None, help="The latest by default.")
+
+    restore_parser = subparsers.add_parser("restore", help="Write a version to a file.")
+    restore_parser.add_argument("name")
+    restore_parser.add_argument("output")
+    restore_parser.add_argument("--version", default=None, help="The latest by default.")
+
+    subparsers.add_parser("gc", help="Delete the objects of deleted versions.")
+
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main(parse_args()))
@@ -0,0 +1,313 @@
+"""Bitmap indexes over the tags and classes of an analysis CSV, for boolean filter queries.
+
+Finding, e.g., the masculine nouns with an accent change but no irregular form in gen_pl would
+otherwise mean parsing every tag string of the CSV. The index keeps, as bitmaps with one bit per
+row, the rows where each cell has each tag bit (see `TAG_BITS`), where any cell has it, and where
+each class column (gender, animacy, suffix, ...) has each value. A query is then a few bitmap
+operations. E.g.,
+
+    index = load_tag_index("russian_word_analyses/files/noun_analyses.csv")
+    index.query("gender=m & gen_pl:a & !gen_pl:i")  # [{"bare_form":, "accented_form":}, ...]
+
+Query syntax (`!` binds tighter than `&`, which binds tighter than `|`):
+
+    gen_pl:a            The gen_pl form has an accent change. The bit is i, I, a or m (see `TAG_BITS`).
+    *:I                 Any form is Irregular.
+    gender=m            A class column has a value.
+    !x, x & y, x | y    Not, and, or. Parentheses group.
+
+Like the sidecar indexes of `csv_index`, the index is saved next to the CSV (e.g.,
+`noun_analyses.csv.tags.idx.json`) and rebuilt automatically when the CSV changes.
+
+Usage:
+
+    python tag_index.py russian_word_analyses/files/noun_analyses.csv "gender=m & gen_pl:a & !gen_pl:i"
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+from IO import iter_csv
+from compression import resolve_path
+from csv_index import get_source_signature
+
+
+INDEX_SUFFIX = ".tags.idx.json"
+INDEX_VERSION = 1
+
+TAGS_SUFFIX = "_tags"
+
+# Tag bits (see `utils.get_bits_str_and_tags`).
+TAG_BITS = {
+    "i": "irregular",
+    "I": "Irregular",  # Not counting -а/-у in gen_sg and -у' in prep_sg of nouns.
+    "a": "accent_change",
+    "m": "multiple_variants",
+}
+ANY_CELL = "*"
+
+KEY_COLUMNS = ["bare_form", "accented_form"]
+# Indexed if present. Nouns: gender ... is_pl_only, last_letter. Adjectives: suffix, is_incomparable.
+CLASS_COLUMNS = [
+    "gender",
+    "is_animate",
+    "is_indeclinable",
+    "is_sg_only",
+    "is_pl_only",
+    "last_letter",
+    "suffix",
+    "is_incomparable",
+]
+
+QUERY_TOKENS = re.compile(r"\s*(?:(?P<op>[()!&|])|(?P<term>[^\s()!&|]+))")
+
+
+def get_index_path(fp: str) -> str:
+    """E.g., "files/noun_analyses.csv" -> "files/noun_analyses.csv.tags.idx.json"."""
+    return f"{fp}{INDEX_SUFFIX}"
+
+
+def to_bitmap(row_ids: List[int], n_rows: int) -> int:
+    """Set the bits of the rows, e.g., [0, 3] -> 0b1001.
+
+    Built in a bytearray, as or-ing the bits into an int one at a time copies the int every time.
+    """
+
+    bits = bytearray((n_rows + 7) // 8)
+    for row_id in row_ids:
+        bits[row_id >> 3] |= 1 << (row_id & 7)
+    return int.from_bytes(bits, "little")
+
+
+def iter_row_ids(bitmap: int):
+    """E.g., 0b1001 -> 0, 3."""
+
+    bits = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for i, byte in enumerate(bits):
+        while byte:
+            low_bit = byte & -byte
+            yield (i << 3) + low_bit.bit_length() - 1
+            byte ^= low_bit
+
+
+def count_rows(bitmap: int) -> int:
+    return bin(bitmap).count("1")
+
+
+class TagIndex:
+    """Bitmaps of the rows of an analysis, by cell and tag bit and by class."""
+
+    def __init__(self, keys: Dict[str, List[str]], bitmaps: Dict[str, int], n_rows: int, cells: List[str]):
+        """
+        :param keys: The key columns of the rows, e.g., {"bare_form": [...], "accented_form": [...]}.
+        :param bitmaps: E.g., {"gen_pl:a": ..., "*:a": ..., "gender=m": ...}.
+        """
+
+        self.keys = keys
+        self.bitmaps = bitmaps
+        self.n_rows = n_rows
+        self.cells = cells
+        self.all_rows = (1 << n_rows) - 1
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    @classmethod
+    def from_rows(cls, rows, class_columns: List[str] = CLASS_COLUMNS) -> "TagIndex":
+
+        keys = {}
+        row_ids = {}  # {term: [row_id]}
+        cells = None
+        n_rows = 0
+        for row_id, row in enumerate(rows):
+            if cells is None:
+                cells = [column[:-len(TAGS_SUFFIX)] for column in row if column.endswith(TAGS_SUFFIX)]
+                keys = {column: [] for column in KEY_COLUMNS if column in row}
+                class_columns = [column for column in class_columns if column in row]
+            n_rows += 1
+
+            for column, values in keys.items():
+                values.append(row[column])
+
+            for column in class_columns:
+                row_ids.setdefault(f"{column}={row[column]}", []).append(row_id)
+
+            row_bits = set()
+            for cell in cells:
+                tags = row[f"{cell}{TAGS_SUFFIX}"]
+                if not tags.startswith("#"):
+                    continue
+                for bit in set(tags[1:].split(",", 1)[0]) & TAG_BITS.keys():
+                    row_ids.setdefault(f"{cell}:{bit}", []).append(row_id)
+                    row_bits.add(bit)
+            for bit in row_bits:
+                row_ids.setdefault(f"{ANY_CELL}:{bit}", []).append(row_id)
+
+        bitmaps = {
+            term: to_bitmap(ids, n_rows)
+            for term, ids in row_ids.items()
+        }
+        return cls(keys=keys, bitmaps=bitmaps, n_rows=n_rows, cells=cells or [])
+
+    def get_bitmap(self, term: str) -> int:
+        """The bitmap of a term, e.g., "gen_pl:a", "*:i" or "gender=m"."""
+
+        if ":" in term:
+            cell, bit = term.split(":", 1)
+            if cell != ANY_CELL and cell not in self.cells:
+                raise ValueError(f"Unknown cell {cell!r} in {term!r}. Expected {ANY_CELL!r} or one of {self.cells}.")
+            if bit not in TAG_BITS:
+                raise ValueError(f"Unknown tag bit {bit!r} in {term!r}. Expected one of {list(TAG_BITS)}.")
+        elif "=" in term:
+            column = term.split("=", 1)[0]
+            if not any(other.startswith(f"{column}=") for other in self.bitmaps):
+                raise ValueError(f"Column {column!r} in {term!r} is not indexed.")
+        else:
+            raise ValueError(f"Cannot parse the term {term!r}. Expected cell:bit or column=value.")
+
+        return self.bitmaps.get(term, 0)
+
+    def evaluate(self, query: str) -> int:
+        """The bitmap of the rows matching a query (see the module docstring)."""
+
+        tokens = []
+        pos = 0
+        query = query.strip()
+        while pos < len(query):
+            match = QUERY_TOKENS.match(query, pos)
+            if match is None or match.end() == pos:
+                raise ValueError(f"Cannot parse {query[pos:]!r} in the query {query!r}.")
+            tokens.append(match.group("op") or match.group("term"))
+            pos = match.end()
+        tokens.append(None)
+
+        pos = 0
+
+        def peek():
+            return tokens[pos]
+
+        def take():
+            nonlocal pos
+            pos += 1
+            return tokens[pos - 1]
+
+        def parse_or():
+            bitmap = parse_and()
+            while peek() == "|":
+                take()
+                bitmap |= parse_and()
+            return bitmap
+
+        def parse_and():
+            bitmap = parse_not()
+            while peek() == "&":
+                take()
+                bitmap &= parse_not()
+            return bitmap
+
+        def parse_not():
+            token = take()
+            if token == "!":
+                return self.all_rows ^ parse_not()
+            if token == "(":
+                bitmap = parse_or()
+                if take() != ")":
+                    raise ValueError(f"Unbalanced parentheses in the query {query!r}.")
+                return bitmap
+            if token is None or token in ")&|":
+                raise ValueError(f"Expected a term, got {token!r} in the query {query!r}.")
+            return self.get_bitmap(token)
+
+        bitmap = parse_or()
+        if peek() is not None:
+            raise ValueError(f"Unexpected {peek()!r} in the query {query!r}.")
+        return bitmap
+
+    def count(self, query: str) -> int:
+        return count_rows(self.evaluate(query))
+
+    def query(self, query: str, limit: Optional[int] = None) -> List[dict]:
+        """The keys of the rows matching a query, in the order of the CSV."""
+
+        matches = []
+        for row_id in iter_row_ids(self.evaluate(query)):
+            if limit is not None and len(matches) >= limit:
+                break
+            matches.append({column: values[row_id] for column, values in self.keys.items()})
+        return matches
+
+    def to_dict(self) -> dict:
+        return {
+            "n_rows": self.n_rows,
+            "cells": self.cells,
+            "keys": self.keys,
+            "bitmaps": {term: format(bitmap, "x") for term, bitmap in self.bitmaps.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "TagIndex":
+        return cls(
+            keys=d["keys"],
+            bitmaps={term: int(bitmap, 16) for term, bitmap in d["bitmaps"].items()},
+            n_rows=d["n_rows"],
+            cells=d["cells"],
+        )
+
+
+def load_tag_index(fp: str, rebuild: bool = False) -> TagIndex:
+    """Load the sidecar tag index of an analysis CSV, (re)building and saving it if it is missing or stale."""
+
+    fp = resolve_path(fp)
+    fp_index = get_index_path(fp)
+    signature = get_source_signature(fp)
+
+    if not rebuild and os.path.exists(fp_index):
+        with open(fp_index, "r", encoding="utf-8") as f:
+            d = json.load(f)
+        if d.get("version") == INDEX_VERSION and d.get("source") == signature:
+            return TagIndex.from_dict(d)
+
+    index = TagIndex.from_rows(iter_csv(fp))
+
+    # Write to a temporary file first, so that a concurrent reader never sees a partial index.
+    fp_tmp = f"{fp_index}.{os.getpid()}.tmp"
+    with open(fp_tmp, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "version": INDEX_VERSION,
+                "source": signature,
+                **index.to_dict(),
+            },
+            f,
+            ensure_ascii=False,
+        )
+    os.replace(fp_tmp, fp_index)
+
+    return index
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("fp_analyses", help="E.g., russian_word_analyses/files/noun_analyses.csv")
+    parser.add_argument("queries", nargs="*", help="E.g., \"gender=m & gen_pl:a & !gen_pl:i\"")
+    parser.add_argument("--limit", type=int, default=20, help="Print at most this many matches per query.")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the index even if it is up to date.")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    tag_index = load_tag_index(args.fp_analyses, rebuild=args.rebuild)
+    print(f"{get_index_path(resolve_path(args.fp_analyses))}: {len(tag_index):,} rows, {len(tag_index.bitmaps):,} bitmaps ({time.perf_counter() - start:.3f}s)")
+
+    for query in args.queries:
+        start = time.perf_counter()
+        bitmap = tag_index.evaluate(query)
+        elapsed_us = (time.perf_counter() - start) * 1e6
+
+        print(f"{query} ({elapsed_us:.0f}us): {count_rows(bitmap):,} rows")
+        for match in tag_index.query(query, limit=args.limit):
+            print(f"    {match.get('accented_form') or match.get('bare_form')}")
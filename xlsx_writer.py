@@ -0,0 +1,303 @@
+"""A streaming XLSX writer for the analysis tables, on the standard library only.
+
+An XLSX file is a zip of XML parts. The sheet part is streamed into the zip a chunk of rows at a
+time, with the cells as inline strings (no shared string table), so memory stays constant whatever
+the number of rows. The header row is bold, frozen and has an autofilter. Cells are highlighted by
+their tags: for each `<name>_tags` column (see `utils.get_bits_str_and_tags`), both the `<name>`
+cell and the tag cell are filled according to the tag bits, and so are the verb forms marked with
+"(*)" or "(')" (see `analyze_verbs`). E.g.,
+
+    write_xlsx("noun_analyses.xlsx", rows)  # Or via `IO.write_xlsx`.
+
+or from the command line, converting a CSV:
+
+    python xlsx_writer.py russian_word_analyses/files/noun_analyses.csv noun_analyses.xlsx
+"""
+
+import argparse
+import os
+import re
+import sys
+import zipfile
+from itertools import chain
+from typing import Callable, Dict, Iterable, List, Optional
+from xml.sax.saxutils import escape, quoteattr
+
+
+TAGS_SUFFIX = "_tags"
+
+# Highlights, from the most to the least important.
+HIGHLIGHT_IRREGULAR = "irregular"
+HIGHLIGHT_ACCENT_CHANGE = "accent_change"
+HIGHLIGHT_MULTIPLE_VARIANTS = "multiple_variants"
+
+# Tag bits (see `utils.get_bits_str_and_tags`) and verb form marks (see `analyze_verbs`).
+TAG_BIT_HIGHLIGHTS = [
+    ("i", HIGHLIGHT_IRREGULAR),
+    ("I", HIGHLIGHT_IRREGULAR),
+    ("a", HIGHLIGHT_ACCENT_CHANGE),
+    ("m", HIGHLIGHT_MULTIPLE_VARIANTS),
+]
+FORM_MARK_HIGHLIGHTS = [
+    ("(*) ", HIGHLIGHT_IRREGULAR),
+    ("(') ", HIGHLIGHT_ACCENT_CHANGE),
+]
+
+# Cell style ids, i.e., indices into `cellXfs` of STYLES_XML.
+STYLE_DEFAULT = 0
+STYLE_HEADER = 1
+HIGHLIGHT_STYLES = {
+    HIGHLIGHT_IRREGULAR: 2,
+    HIGHLIGHT_ACCENT_CHANGE: 3,
+    HIGHLIGHT_MULTIPLE_VARIANTS: 4,
+}
+
+ROWS_PER_CHUNK = 1000
+MAX_COLUMN_WIDTH = 40
+MAX_SHEET_NAME_LENGTH = 31
+
+# Characters not allowed in sheet names.
+ILLEGAL_SHEET_NAME_CHARS = re.compile(r"[\[\]:*?/\\']")
+# Characters not allowed in XML 1.0.
+ILLEGAL_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+# Most cells need neither escaping nor removing characters, so check for both at once first.
+SPECIAL_XML_CHARS = re.compile("[&<>\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+CONTENT_TYPES_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>"""
+
+ROOT_RELS_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+WORKBOOK_RELS_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>"""
+
+WORKBOOK_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name={sheet_name} sheetId="1" r:id="rId1"/></sheets>
+<definedNames><definedName name="_xlnm._FilterDatabase" localSheetId="0" hidden="1">{filter_range}</definedName></definedNames>
+</workbook>"""
+
+# Fills: none, gray125 (both required), then red, yellow and blue for the highlights.
+STYLES_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="5">
+<fill><patternFill patternType="none"/></fill>
+<fill><patternFill patternType="gray125"/></fill>
+<fill><patternFill patternType="solid"><fgColor rgb="FFFFC7CE"/><bgColor indexed="64"/></patternFill></fill>
+<fill><patternFill patternType="solid"><fgColor rgb="FFFFEB9C"/><bgColor indexed="64"/></patternFill></fill>
+<fill><patternFill patternType="solid"><fgColor rgb="FFDDEBF7"/><bgColor indexed="64"/></patternFill></fill>
+</fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="5">
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>
+<xf numFmtId="0" fontId="0" fillId="2" borderId="0" xfId="0" applyFill="1"/>
+<xf numFmtId="0" fontId="0" fillId="3" borderId="0" xfId="0" applyFill="1"/>
+<xf numFmtId="0" fontId="0" fillId="4" borderId="0" xfId="0" applyFill="1"/>
+</cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>"""
+
+SHEET_HEAD_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<sheetViews><sheetView workbookViewId="0">{pane}</sheetView></sheetViews>
+<sheetFormatPr defaultRowHeight="15"/>
+<cols>{cols}</cols>
+<sheetData>
+"""
+
+SHEET_TAIL_XML = """</sheetData>
+<autoFilter ref="{filter_range}"/>
+</worksheet>"""
+
+
+def get_column_letter(index: int) -> str:
+    """E.g., 0 -> "A", 25 -> "Z", 26 -> "AA"."""
+
+    letters = ""
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def get_tag_highlight(tags: str) -> Optional[str]:
+    """The highlight of a tag cell, e.g., "#__a_, accent_chg:0" -> "accent_change"."""
+
+    if not tags.startswith("#"):
+        return None
+    bits = tags[1:].split(",", 1)[0]
+    for bit, highlight in TAG_BIT_HIGHLIGHTS:
+        if bit in bits:
+            return highlight
+    return None
+
+
+def get_form_highlight(form: str) -> Optional[str]:
+    """The highlight of a marked verb form, e.g., "(*) бу'ду" -> "irregular"."""
+
+    for mark, highlight in FORM_MARK_HIGHLIGHTS:
+        if form.startswith(mark):
+            return highlight
+    return None
+
+
+def highlight_tags(row: dict) -> Dict[str, str]:
+    """{column: highlight} of the cells of a row to highlight."""
+
+    highlights = {}
+    for column, value in row.items():
+        if not value or not isinstance(value, str):
+            continue
+
+        if column.endswith(TAGS_SUFFIX):
+            highlight = get_tag_highlight(value)
+            if highlight is not None:
+                highlights[column] = highlight
+                highlights.setdefault(column[:-len(TAGS_SUFFIX)], highlight)
+        elif value[0] == "(":
+            highlight = get_form_highlight(value)
+            if highlight is not None:
+                highlights[column] = highlight
+
+    return highlights
+
+
+def make_cell(ref: str, value, style: int) -> str:
+
+    style_attr = f' s="{style}"' if style != STYLE_DEFAULT else ""
+    if value is None or value == "":
+        return f'<c r="{ref}"{style_attr}/>' if style_attr else ""
+
+    text = str(value)
+    if SPECIAL_XML_CHARS.search(text) is not None:
+        text = escape(ILLEGAL_XML_CHARS.sub("", text))
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def make_row(index: int, values: list, letters: List[str], styles: List[int]) -> str:
+    """A `<row>` of the sheet. `index` is 1-based as in Excel."""
+
+    cells = "".join(
+        make_cell(f"{letter}{index}", value, style)
+        for letter, value, style in zip(letters, values, styles)
+    )
+    return f'<row r="{index}">{cells}</row>\n'
+
+
+def write_xlsx(
+        fp: str,
+        l: Iterable[dict],
+        sheet_name: str = "Sheet1",
+        freeze_columns: int = 0,
+        highlight: Optional[Callable[[dict], Dict[str, str]]] = highlight_tags,
+        column_widths: Optional[Dict[str, float]] = None,
+) -> int:
+    """Write rows to an XLSX with a frozen header. The header is taken from the first row.
+
+    :param l: A list, or any iterable (e.g., a generator), which is written as it is consumed.
+    :param sheet_name: Characters not allowed by Excel are replaced, and it is truncated to 31 characters.
+    :param freeze_columns: Number of leading columns to freeze as well, e.g., 2 for the bare and accented forms.
+    :param highlight: Maps a row to {column: highlight}. `highlight_tags` by default, None for no highlighting.
+    :param column_widths: {column: width in characters}. By default from the header, up to 40.
+    :return: The number of rows written, without the header.
+    """
+
+    sheet_name = ILLEGAL_SHEET_NAME_CHARS.sub("_", sheet_name)[:MAX_SHEET_NAME_LENGTH]
+
+    rows = iter(l)
+    first_row = next(rows)
+    columns = list(first_row.keys())
+    letters = [get_column_letter(i) for i in range(len(columns))]
+
+    if column_widths is None:
+        column_widths = {}
+    cols = "".join(
+        f'<col min="{i + 1}" max="{i + 1}" width="{column_widths.get(column, min(max(len(column) + 2, 10), MAX_COLUMN_WIDTH))}" customWidth="1"/>'
+        for i, column in enumerate(columns)
+    )
+
+    top_left_cell = f"{get_column_letter(freeze_columns)}2"
+    x_split = f' xSplit="{freeze_columns}"' if freeze_columns > 0 else ""
+    pane = f'<pane{x_split} ySplit="1" topLeftCell="{top_left_cell}" activePane="bottomRight" state="frozen"/>'
+    if freeze_columns == 0:
+        pane = pane.replace("bottomRight", "bottomLeft")
+
+    n_rows = 0
+    with zipfile.ZipFile(fp, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", CONTENT_TYPES_XML)
+        zf.writestr("_rels/.rels", ROOT_RELS_XML)
+        zf.writestr("xl/_rels/workbook.xml.rels", WORKBOOK_RELS_XML)
+        zf.writestr("xl/styles.xml", STYLES_XML)
+
+        # The size is not known in advance, so allow the sheet to exceed 4 GiB.
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as f:
+            f.write(SHEET_HEAD_XML.format(pane=pane, cols=cols).encode("utf-8"))
+
+            chunk = [make_row(1, columns, letters, [STYLE_HEADER] * len(columns))]
+            for row in chain([first_row], rows):
+                highlights = highlight(row) if highlight is not None else {}
+                styles = [
+                    HIGHLIGHT_STYLES[highlights[column]] if column in highlights else STYLE_DEFAULT
+                    for column in columns
+                ]
+                n_rows += 1
+                chunk.append(make_row(n_rows + 1, [row.get(column) for column in columns], letters, styles))
+
+                if len(chunk) >= ROWS_PER_CHUNK:
+                    f.write("".join(chunk).encode("utf-8"))
+                    chunk = []
+
+            filter_range = f"A1:{letters[-1]}{n_rows + 1}"
+            chunk.append(SHEET_TAIL_XML.format(filter_range=filter_range))
+            f.write("".join(chunk).encode("utf-8"))
+
+        # The autofilter range is only known once all rows are written.
+        zf.writestr("xl/workbook.xml", WORKBOOK_XML.format(
+            sheet_name=quoteattr(sheet_name),
+            filter_range=escape(f"'{sheet_name}'!$A$1:${letters[-1]}${n_rows + 1}"),
+        ))
+
+    return n_rows
+
+
+def main(args) -> int:
+
+    from IO import iter_csv
+
+    n_rows = write_xlsx(
+        fp=args.fp_xlsx,
+        l=iter_csv(args.fp_csv),
+        sheet_name=args.sheet_name or os.path.splitext(os.path.basename(args.fp_csv))[0],
+        freeze_columns=args.freeze_columns,
+    )
+    print(f"Wrote {n_rows:,} rows to {args.fp_xlsx}")
+    return 0
+
+
+def parse_args(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("fp_csv", help="E.g., russian_word_analyses/files/noun_analyses.csv")
+    parser.add_argument("fp_xlsx")
+    parser.add_argument("--sheet-name", default=None, help="The name of the CSV by default.")
+    parser.add_argument("--freeze-columns", type=int, default=2, help="Leading columns to freeze, e.g., the bare and accented forms.")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(main(parse_args()))